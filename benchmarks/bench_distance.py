@@ -0,0 +1,48 @@
+"""
+Benchmark : distance Haversine scalaire (boucle Python) vs vectorisée (NumPy).
+
+Usage : python benchmarks/bench_distance.py
+"""
+import os
+import sys
+import time
+import random
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'flask'))
+from geo import calculate_distance, haversine_np
+
+QUERY = (48.8566, 2.3522)
+SIZES = [1_000, 10_000, 100_000]
+REPEAT = 5
+
+def best_of(fn):
+    best = float('inf')
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    rnd = random.Random(0)
+    print(f"{'points':>8} | {'scalaire (ms)':>14} | {'numpy (ms)':>11} | {'speedup':>8}")
+    print("-" * 52)
+    for n in SIZES:
+        lats = [48.80 + rnd.random() * 0.12 for _ in range(n)]
+        lons = [2.22 + rnd.random() * 0.25 for _ in range(n)]
+        lats_np = np.ascontiguousarray(lats, dtype=np.float64)
+        lons_np = np.ascontiguousarray(lons, dtype=np.float64)
+
+        scalar = best_of(lambda: [calculate_distance(QUERY[0], QUERY[1], la, lo) for la, lo in zip(lats, lons)])
+        vector = best_of(lambda: haversine_np(QUERY[0], QUERY[1], lats_np, lons_np))
+
+        # Vérification : mêmes résultats à 1 mm près
+        ref = np.array([calculate_distance(QUERY[0], QUERY[1], la, lo) for la, lo in zip(lats, lons)])
+        assert np.allclose(ref, haversine_np(QUERY[0], QUERY[1], lats_np, lons_np), atol=1e-3)
+
+        print(f"{n:>8} | {scalar * 1000:>14.2f} | {vector * 1000:>11.3f} | {scalar / vector:>7.0f}x")
+
+if __name__ == "__main__":
+    main()
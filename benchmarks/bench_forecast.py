@@ -0,0 +1,102 @@
+"""
+Benchmark : préparation des features + predict de /api/forecast_stats (48 créneaux).
+
+  ancien : liste de dicts -> pd.DataFrame -> sélection des colonnes -> XGBRegressor.predict
+  nouveau : tableau NumPy préalloué (build_global_matrix) -> Booster.inplace_predict
+
+Usage : python benchmarks/bench_forecast.py   (nécessite pandas et xgboost)
+"""
+import os
+import sys
+import time
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'flask'))
+from forecasting import GLOBAL_FEATURES, build_global_matrix
+from predictor import BoosterPredictor
+
+SLOTS = 48
+REPEAT = 200
+CODES = [0, 1, 2, 3, 45, 51, 61, 80]
+
+def describe(code):
+    return {0: "Ciel dégagé", 1: "Principalement clair", 61: "Pluie légère"}.get(code, "Inconnu")
+
+def make_forecasts(rnd):
+    start = datetime(2026, 1, 1)
+    return [{
+        "time": (start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:00"),
+        "temperature": 5 + rnd.random() * 20,
+        "windspeed": rnd.random() * 30,
+        "weathercode": rnd.choice(CODES)
+    } for h in range(SLOTS)]
+
+def train_model(rnd):
+    n = 5000
+    X = pd.DataFrame({
+        'hour': [rnd.randrange(24) for _ in range(n)],
+        'day_of_week': [rnd.randrange(7) for _ in range(n)],
+        'temperature': [rnd.random() * 30 for _ in range(n)],
+        'windspeed': [rnd.random() * 30 for _ in range(n)],
+        'weathercode': [rnd.choice(CODES) for _ in range(n)],
+    })
+    y = 15 + (X['hour'].between(7, 9) * 10) - (X['weathercode'] > 50) * 8
+    model = xgb.XGBRegressor(objective='reg:squarederror', n_estimators=100, learning_rate=0.1, max_depth=6)
+    model.fit(X, y)
+    return model
+
+def old_path(model, forecast_items):
+    rows = []
+    for item in forecast_items:
+        t_str = item.get('time')
+        dt = datetime.fromisoformat(t_str)
+        rows.append({
+            'hour': dt.hour,
+            'day_of_week': dt.weekday(),
+            'temperature': item.get('temperature', 15),
+            'windspeed': item.get('windspeed', 10),
+            'weathercode': item.get('weathercode', 0),
+            '_time': t_str,
+            '_desc': describe(item.get('weathercode', 0))
+        })
+    df_pred = pd.DataFrame(rows)
+    return model.predict(df_pred[GLOBAL_FEATURES])
+
+def new_path(predictor, forecast_items):
+    X, times, descs = build_global_matrix(forecast_items, describe)
+    return predictor.predict(X)
+
+def best_of(fn):
+    fn()  # échauffement
+    best = float('inf')
+    for _ in range(REPEAT):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+def main():
+    rnd = random.Random(0)
+    model = train_model(rnd)
+    predictor = BoosterPredictor(model.get_booster(), GLOBAL_FEATURES)
+    forecast_items = make_forecasts(rnd)
+
+    # Vérification : mêmes prédictions
+    assert np.allclose(old_path(model, forecast_items), new_path(predictor, forecast_items), atol=1e-5)
+
+    old = best_of(lambda: old_path(model, forecast_items))
+    new = best_of(lambda: new_path(predictor, forecast_items))
+    build = best_of(lambda: build_global_matrix(forecast_items, describe))
+
+    print(f"{SLOTS} créneaux, meilleur temps sur {REPEAT} exécutions")
+    print(f"  ancien (DataFrame + XGBRegressor.predict) : {old * 1000:8.3f} ms")
+    print(f"  nouveau (NumPy + inplace_predict)         : {new * 1000:8.3f} ms  (dont features {build * 1000:.3f} ms)")
+    print(f"  speedup : {old / new:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
 import os
 import json
-from flask import Flask, render_template, jsonify, request, send_from_directory
-from pymongo import MongoClient
+import gzip
+import hashlib
+import threading
+import time
+from flask import Flask, Response, g, render_template, jsonify, request, send_from_directory
+from pymongo import MongoClient, ReplaceOne, errors
 from datetime import datetime, timezone
 from dotenv import load_dotenv
+from background import start_once
+from geo import StationGridIndex
+from metrics import MODEL_INFERENCE_LATENCY, REQUEST_LATENCY, MongoMetricsListener, render_metrics
+from model_registry import ModelRegistry
+from predictor import load_predictor
+from slow_queries import SlowQueryLog
+from queries import (CYCLE_MARKER_COLLECTION, CYCLE_MARKER_ID, EMPTY_SHARD_STATS, KEYFRAME_INDEX_KEYS,
+                     KEYFRAME_INDEX_OPTIONS, LATEST_PROJECTION, LATEST_TIMESTAMP_PROJECTION, LATEST_TIMESTAMP_SORT,
+                     STATION_LIST_SORTS,
+                     availability_pipeline, describe_last_update, encode_list_cursor, format_availability,
+                     format_hourly_stats, format_shard_stats, geo_near_pipeline, hourly_stats_pipeline,
+                     parse_availability_params, parse_nearby_params, parse_station_list_params,
+                     station_list_query, total_capacity, window_start_lookups)
+from forecasting import (ForecastGrid, ForecastGridCache, build_global_matrix, forecast_hours_utc,
+                         predict_station_values)
 
 # Charger les variables d'environnement depuis .env (pour le dev local)
 load_dotenv()
@@ -16,27 +35,72 @@ app = Flask(__name__)
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongos:27017/velib")
 MONGO_URI_CLOUD = os.getenv("MONGO_URI_CLOUD") # Ajout pour la météo si stockée ailleurs
 
-# Connexion principale (Velib)
-client = MongoClient(MONGO_URI)
-db = client['velib']
+STATUS_LAYOUT = os.getenv("STATUS_LAYOUT", "documents")
+# Ingestion delta des statuts (même variable que le scraper) : keyframes dans l'historique
+STATUS_DELTA = os.getenv("SCRAPER_STATUS_DELTA", "0") == "1"
 
+# Durée de chaque commande MongoDB (par collection / pipeline) -> /metrics
+mongo_metrics_listener = MongoMetricsListener()
 
+# Mode diagnostic : find / aggregate plus lents que SLOW_QUERY_MS (0 = désactivé)
+# rejoués en explain et listés sur /monitoring/slow
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+SLOW_QUERY_LOG_SIZE = int(os.getenv("SLOW_QUERY_LOG_SIZE", "50"))
+slow_query_log = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_LOG_SIZE)
 
-# Connexion Météo (si Cloud spécifié, sinon local/principal)
-if MONGO_URI_CLOUD:
-    try:
-        client_weather = MongoClient(MONGO_URI_CLOUD)
-        weather_db = client_weather['Meteo'] # Correction: Base 'Meteo'
-        col_weather_current = weather_db['meteo_current']
-        col_weather_forecast = weather_db['meteo_forecast']
-        print("Connecté à MongoDB Cloud pour la Météo.")
-    except Exception as e:
-        print(f"Erreur connexion Cloud Météo: {e}, fallback sur local.")
+def connect_databases():
+    """
+    (Re)crée les clients MongoDB et les collections globales. Appelée à l'import et,
+    sous gunicorn, dans chaque worker après le fork (un MongoClient ne doit pas être
+    partagé entre processus).
+    """
+    global client, db, col_status, client_weather, col_weather_current, col_weather_forecast
+
+    # Connexion principale (Velib)
+    client = MongoClient(MONGO_URI, event_listeners=[mongo_metrics_listener, slow_query_log])
+    db = client['velib']
+    slow_query_log.client = client
+
+    # Historique des statuts : collection classique ou time-series (cf. scraper STATUS_LAYOUT)
+    col_status = db['status_ts'] if STATUS_LAYOUT == "timeseries" else db['status']
+
+    # Connexion Météo (si Cloud spécifié, sinon local/principal)
+    client_weather = None
+    if MONGO_URI_CLOUD:
+        try:
+            client_weather = MongoClient(MONGO_URI_CLOUD, event_listeners=[mongo_metrics_listener])
+            weather_db = client_weather['Meteo'] # Correction: Base 'Meteo'
+            col_weather_current = weather_db['meteo_current']
+            col_weather_forecast = weather_db['meteo_forecast']
+            print("Connecté à MongoDB Cloud pour la Météo.")
+        except Exception as e:
+            print(f"Erreur connexion Cloud Météo: {e}, fallback sur local.")
+            col_weather_current = db['meteo_current']
+            col_weather_forecast = db['meteo_forecast']
+    else:
         col_weather_current = db['meteo_current']
         col_weather_forecast = db['meteo_forecast']
-else:
-    col_weather_current = db['meteo_current']
-    col_weather_forecast = db['meteo_forecast']
+
+connect_databases()
+
+# --- MÉTRIQUES (PROMETHEUS) ---
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Règle d'URL (/models_static/<path:filename>) et non le chemin : cardinalité bornée
+        route = request.url_rule.rule if request.url_rule else "<inconnue>"
+        REQUEST_LATENCY.labels(request.method, route, response.status_code).observe(time.perf_counter() - start)
+    return response
+
+@app.route('/metrics')
+def metrics():
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
     
 def get_weather_description(code):
     table = {
@@ -54,11 +118,116 @@ def get_weather_description(code):
 # --- OPTIMISATION INDEX ---
 try:
     # Index composite pour accélérer le lookup + sort
-    db.status.create_index([("station_id", 1), ("scrape_timestamp", -1)])
+    # (en layout time-series, la collection et ses index sont créés par le scraper)
+    if STATUS_LAYOUT != "timeseries":
+        col_status.create_index([("station_id", 1), ("scrape_timestamp", -1)])
+        # Parcours par plage de temps (reconstruction de la disponibilité à une date)
+        col_status.create_index([("scrape_timestamp", -1)])
+        col_status.create_index(KEYFRAME_INDEX_KEYS, **KEYFRAME_INDEX_OPTIONS)
+    # Vue matérialisée "dernier état par station" (alimentée par le scraper)
+    db.station_latest.create_index("station_id", unique=True)
+    db.station_latest.create_index("scrape_timestamp")
+    db.station_latest.create_index([("location", "2dsphere")])
+    # Tris paginés de /velib_list/ (champ trié, puis station_id pour départager)
+    for sort_field in STATION_LIST_SORTS.values():
+        db.station_latest.create_index([(sort_field, 1), ("station_id", 1)])
+    # Agrégat horaire (station × jour × heure) alimenté par le scraper
+    db.status_hourly.create_index([("station_id", 1), ("day_of_week", 1), ("hour", 1)], unique=True)
     print("Index sur status créé/vérifié.")
 except Exception as e:
     print(f"Warning: Impossible de créer l'index: {e}")
 
+
+def get_latest_snapshot(query=None, comment=None):
+    """
+    Renvoie le dernier état connu de chaque station (infos statiques + vélos/places)
+    depuis station_latest : un document par station_id, indépendamment de l'historique.
+    `comment` nomme la requête (métriques, requêtes lentes, logs MongoDB).
+    """
+    return list(db.station_latest.find(query or {}, LATEST_PROJECTION, comment=comment))
+
+def get_latest_scrape_timestamp():
+    """Horodatage du dernier cycle du scraper (requête indexée sur station_latest)."""
+    doc = db.station_latest.find_one({}, LATEST_TIMESTAMP_PROJECTION, sort=LATEST_TIMESTAMP_SORT)
+    return doc.get('scrape_timestamp') if doc else None
+
+def get_completed_cycle_key():
+    """
+    Fin du dernier cycle complet du scraper (marqueur écrit après les deux flux) : tant
+    qu'elle ne change pas, station_latest n'est pas en cours de réécriture par un cycle
+    déjà visible. Sans marqueur (scraper plus ancien), dernier scrape_timestamp.
+    """
+    marker = db[CYCLE_MARKER_COLLECTION].find_one({"_id": CYCLE_MARKER_ID}, {"_id": 0, "completed_at": 1})
+    if marker and marker.get('completed_at'):
+        return marker['completed_at']
+    return get_latest_scrape_timestamp()
+
+# --- CACHE DU SNAPSHOT DE LA CARTE ---
+# Intervalle minimum (secondes) entre deux vérifications du marqueur de fin de cycle en base
+MAP_CACHE_CHECK_INTERVAL = float(os.getenv("MAP_CACHE_CHECK_INTERVAL", "5"))
+
+class MapSnapshot:
+    """Snapshot sérialisé de la carte pour un cycle du scraper."""
+    def __init__(self, key, stations):
+        self.key = key
+        self.stations = stations
+        self.body = json.dumps(stations, sort_keys=True, separators=(',', ':')).encode('utf-8')
+        self.gzip_body = gzip.compress(self.body, compresslevel=6)
+        self.etag = hashlib.md5(self.body).hexdigest()
+        # ETag fort propre à chaque représentation : octets différents, validateurs différents
+        self.gzip_etag = f"{self.etag}-gz"
+        # Index spatial reconstruit à chaque cycle du scraper avec le snapshot
+        self.index = StationGridIndex(stations)
+
+class MapSnapshotCache:
+    """
+    Garde en mémoire le JSON de /api/map_data (brut + gzip) tant que le
+    scraper n'a pas terminé de nouveau cycle (clé = marqueur de fin de cycle).
+    """
+    def __init__(self, check_interval):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._checked_at = 0.0
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+
+        with self._lock:
+            # Un autre thread a peut-être rafraîchi pendant l'attente du verrou
+            if self._snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._snapshot
+            try:
+                key = get_completed_cycle_key()
+                if self._snapshot is None or key != self._snapshot.key:
+                    self._snapshot = MapSnapshot(key, build_map_data())
+            except Exception as e:
+                if self._snapshot is None:
+                    raise
+                print(f"Warning: rafraîchissement du cache carte impossible, snapshot conservé: {e}")
+            self._checked_at = time.monotonic()
+            return self._snapshot
+
+def build_map_data():
+    """Liste des stations (avec coordonnées) au format attendu par Leaflet."""
+    data = [
+        {
+            "station_id": s['station_id'],
+            "name": s.get('name'),
+            "lat": s.get('lat'),
+            "lon": s.get('lon'),
+            "bikes": s.get('num_bikes_available'),
+            "docks": s.get('num_docks_available')
+        }
+        for s in get_latest_snapshot(comment="map_data")
+    ]
+    # Nettoyage des coordonnées nulles
+    return [d for d in data if d.get('lat') and d.get('lon')]
+
+map_cache = MapSnapshotCache(MAP_CACHE_CHECK_INTERVAL)
+
 # --- ROUTE 1 : PAGE D'ACCUEIL (LA CARTE) ---
 @app.route('/')
 def index():
@@ -69,66 +238,33 @@ def index():
 def api_map_data():
     """
     Cette route renvoie le JSON utilisé par Leaflet.
-    Optimisation : 
-    1. On ne récupère qu'une seule entrée par station (la plus récente).
-    2. On fait un lookup optimisé pour ne récupérer que le dernier statut.
+    Optimisation :
+    1. Lecture de la vue matérialisée station_latest (1 document par station).
+    2. Le JSON est pré-sérialisé (et pré-compressé en gzip) une seule fois par
+       cycle du scraper ; les requêtes suivantes sont servies depuis la mémoire,
+       ou en 304 si le navigateur a déjà la version courante (ETag).
     """
-    pipeline = [
-        # 1. Dédoublonnage des stations (car le scraper insère en boucle)
-        # On groupe par station_id et on garde les infos de la dernière entrée
-        {
-            "$sort": {"scrape_timestamp": -1} # Pour être sûr de prendre le dernier nom/lat/lon
-        },
-        {
-            "$group": {
-                "_id": "$station_id",
-                "name": {"$first": "$name"},
-                "lat": {"$first": "$lat"},
-                "lon": {"$first": "$lon"}
-            }
-        },
-        # 2. Lookup optimisé : on ne récupère QUE le dernier statut
-        {
-            "$lookup": {
-                "from": "status",
-                "let": {"sid": "$_id"},
-                "pipeline": [
-                    {"$match": {"$expr": {"$eq": ["$station_id", "$$sid"]}}},
-                    {"$sort": {"scrape_timestamp": -1}},
-                    {"$limit": 1}
-                ],
-                "as": "latest_status_array"
-            }
-        },
-        # 3. On met à plat le tableau (qui contient 0 ou 1 élément)
-        {
-            "$addFields": {
-                "latest_status": {"$arrayElemAt": ["$latest_status_array", 0]}
-            }
-        },
-        # 4. Projection finale
-        {
-            "$project": {
-                "_id": 0,
-                "station_id": "$_id", # On garde l'ID si besoin
-                "name": 1,
-                "lat": 1,
-                "lon": 1,
-                "bikes": "$latest_status.num_bikes_available",
-                "docks": "$latest_status.num_docks_available"
-            }
-        }
-    ]
-
-    # On exécute
     try:
-        data = list(db.stations.aggregate(pipeline))
-        # Nettoyage des coordonnées nulles
-        clean_data = [d for d in data if d.get('lat') and d.get('lon')]
-        return jsonify(clean_data)
+        snapshot = map_cache.get()
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+    use_gzip = bool(request.accept_encodings['gzip'])
+    etag = snapshot.gzip_etag if use_gzip else snapshot.etag
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif use_gzip:
+        response = Response(snapshot.gzip_body, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(snapshot.body, mimetype='application/json')
+
+    response.set_etag(etag)
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
 # --- ROUTE 3 : STATISTIQUES HORAIRES ---
 from flask import request
 
@@ -136,6 +272,8 @@ from flask import request
 def api_hourly_stats():
     """
     Calcule la moyenne des vélos disponibles par heure pour une liste de stations donnée.
+    Lecture de l'agrégat status_hourly (mis à jour à chaque cycle par le scraper) :
+    le temps de réponse ne dépend pas de la profondeur de l'historique.
     """
     try:
         req_data = request.get_json()
@@ -145,69 +283,16 @@ def api_hourly_stats():
             return jsonify([])
 
         # 1. Calcul de la capacité totale pour ces stations
-        # On récupère le dernier statut connu pour chaque station demandée
-        capacity_pipeline = [
-            {"$match": {"station_id": {"$in": station_ids}}},
-            {"$sort": {"scrape_timestamp": -1}},
-            {"$group": {
-                "_id": "$station_id",
-                "last_bikes": {"$first": "$num_bikes_available"},
-                "last_docks": {"$first": "$num_docks_available"}
-            }},
-            {"$project": {
-                "capacity": {"$add": ["$last_bikes", "$last_docks"]}
-            }},
-            {"$group": {
-                "_id": None,
-                "total_capacity": {"$sum": "$capacity"}
-            }}
-        ]
-        
-        capacity_res = list(db.status.aggregate(capacity_pipeline))
-        total_capacity = capacity_res[0]['total_capacity'] if capacity_res else 0
-
-        pipeline = [
-            # 1. Filtrer sur les stations visibles
-            {
-                "$match": {
-                    "station_id": {"$in": station_ids}
-                }
-            },
-            # 2. Extraire l'heure du timestamp
-            {
-                "$project": {
-                    "hour": {"$hour": "$scrape_timestamp"},
-                    "bikes": "$num_bikes_available"
-                }
-            },
-            # 3. Grouper par heure et calculer la moyenne
-            {
-                "$group": {
-                    "_id": "$hour",
-                    "avg_bikes": {"$avg": "$bikes"}
-                }
-            },
-            # 4. Trier par heure (0h -> 23h)
-            {
-                "$sort": {"_id": 1}
-            }
-        ]
+        # Dernier statut connu (bikes + docks) lu dans station_latest
+        capacity = total_capacity(get_latest_snapshot({"station_id": {"$in": station_ids}}, comment="hourly_stats"))
 
-        stats = list(db.status.aggregate(pipeline))
-        
-        # Formater pour le frontend : tableau de 24 valeurs (une par heure)
-        # On met None si pas de données pour ne pas fausser la moyenne
-        hourly_data = [None] * 24
-        for s in stats:
-            hour = s['_id']
-            avg = s.get('avg_bikes')
-            
-            if hour is not None and 0 <= hour < 24:
-                hourly_data[hour] = round(avg, 1) if avg is not None else None
+        # 2. Moyenne par heure depuis l'agrégat status_hourly
+        stats = db.status_hourly.aggregate(hourly_stats_pipeline(station_ids), comment="hourly_stats")
+        hourly_data = format_hourly_stats(stats)
                 
         return jsonify({
             "data": hourly_data,
-            "capacity": total_capacity
+            "capacity": capacity
         })
 
     except Exception as e:
@@ -217,116 +302,229 @@ def api_hourly_stats():
 
 # --- TES ROUTES EXISTANTES (MONITORING & LISTE) ---
 
-def get_shard_stats():
+def get_shard_stats(collection_name="stations"):
     try:
-        stats = db.command("collStats", "stations")
-        shards_data = stats.get('shards', {})
-        labels = []
-        counts = []
-        sizes = []
-        for shard_name, shard_info in shards_data.items():
-            labels.append(shard_name)
-            counts.append(shard_info.get('count', 0))
-            sizes.append(round(shard_info.get('size', 0) / 1024, 2)) 
-        return {
-            "labels": labels, "counts": counts, "sizes": sizes,
-            "total_count": stats.get('count', 0),
-            "total_size": round(stats.get('size', 0) / 1024, 2),
-            "avg_obj_size": stats.get('avgObjSize', 0)
-        }
+        return format_shard_stats(db.command("collStats", collection_name))
     except Exception as e:
         print(f"Erreur stats shards: {e}")
-        return {"labels": [], "counts": [], "sizes": [], "total_count": 0, "total_size": 0, "avg_obj_size": 0}
+        return dict(EMPTY_SHARD_STATS)
 
-@app.route('/monitoring/')
-def dashboard():
-    shard_stats = get_shard_stats()
-    last_entry = db.status.find_one(sort=[("_id", -1)]) # Tri par ID plus fiable
-    
-    time_since_update = "Jamais"
-    last_update_str = "Aucune donnée"
-
-    if last_entry:
-        # On essaie de trouver une date valide
-        last_update = last_entry.get('scrape_timestamp') or last_entry.get('timestamp') or last_entry['_id'].generation_time
-        
-        if last_update.tzinfo is None:
-            last_update = last_update.replace(tzinfo=timezone.utc)
-            
-        now_utc = datetime.now(timezone.utc)
-        delta = now_utc - last_update
-        minutes = int(delta.total_seconds() / 60)
-        
-        time_since_update = f"il y a {minutes} min"
-        last_update_str = last_update.strftime("%Y-%m-%d %H:%M:%S UTC")
+# --- MONITORING : instantané échantillonné en tâche de fond ---
+# Le tableau de bord ne lit qu'un instantané en mémoire, rafraîchi toutes les
+# MONITOR_SAMPLE_INTERVAL secondes avec des requêtes sur les métadonnées (collStats,
+# estimated_document_count) : aucun count_documents (parcours complet) par page vue.
+MONITOR_SAMPLE_INTERVAL = int(os.getenv("MONITOR_SAMPLE_INTERVAL", "30"))
+monitoring_snapshot = None
 
-    total_stations = db.stations.count_documents({})
-    total_status_logs = db.status.count_documents({})
-    
-    # Stats Météo
-    total_weather_logs = col_weather_current.count_documents({})
-    total_forecasts = col_weather_forecast.count_documents({})
-    
-    last_weather_entry = col_weather_current.find_one(sort=[("scrape_timestamp", -1)])
-    weather_last_update_str = "Aucune donnée"
-    if last_weather_entry:
-         lwu = last_weather_entry.get('scrape_timestamp')
-         if lwu:
-             if lwu.tzinfo is None: lwu = lwu.replace(tzinfo=timezone.utc)
-             weather_last_update_str = lwu.strftime("%Y-%m-%d %H:%M:%S UTC")
+def estimated_count(collection, shard_stats=None):
+    """Nombre de documents d'après les métadonnées (pas de parcours de la collection)."""
+    try:
+        return collection.estimated_document_count()
+    except Exception as e:
+        # Ex. collection time-series : total de collStats
+        print(f"Erreur estimation {collection.name}: {e}")
+        return shard_stats['total_count'] if shard_stats else 0
+
+def collect_monitoring_stats():
+    shard_stats = get_shard_stats("stations")
+    status_shard_stats = get_shard_stats(col_status.name)
+    # Dernier relevé météo dans l'ordre d'insertion (pas de tri sur un champ non indexé)
+    last_weather_entry = col_weather_current.find_one(
+        {}, {"_id": 0, "scrape_timestamp": 1}, sort=[("$natural", -1)]
+    )
+    return {
+        "shard_stats": shard_stats,
+        "status_shard_stats": status_shard_stats,
+        "status_collection": col_status.name,
+        # Collection time-series : estimated_document_count / collStats comptent les
+        # buckets (mesures groupées par station), pas les mesures ; un décompte exact
+        # demanderait un parcours complet, d'où l'unité affichée
+        "status_count_unit": "buckets" if STATUS_LAYOUT == "timeseries" else "documents",
+        # Dernier cycle lu dans station_latest (index scrape_timestamp) plutôt qu'un
+        # tri sur toute la collection status, qui interrogerait tous les shards
+        "last_update": get_latest_scrape_timestamp(),
+        "total_stations": estimated_count(db.stations, shard_stats),
+        "total_status_logs": estimated_count(col_status, status_shard_stats),
+        "total_weather_logs": estimated_count(col_weather_current),
+        "total_forecasts": estimated_count(col_weather_forecast),
+        "weather_last_update": last_weather_entry.get('scrape_timestamp') if last_weather_entry else None,
+        "sampled_at": datetime.now(timezone.utc)
+    }
 
-    return render_template(
-        'monitor.html',
-        shard_stats=shard_stats,
+def monitoring_sampler_loop():
+    global monitoring_snapshot
+    while True:
+        try:
+            monitoring_snapshot = collect_monitoring_stats()
+        except Exception as e:
+            print(f"Erreur échantillonnage monitoring: {e}")
+        time.sleep(MONITOR_SAMPLE_INTERVAL)
+
+def get_monitoring_snapshot():
+    """Dernier instantané (collecté ici une seule fois si l'échantillonneur n'est pas encore passé)."""
+    global monitoring_snapshot
+    if monitoring_snapshot is None:
+        monitoring_snapshot = collect_monitoring_stats()
+    return monitoring_snapshot
+
+def monitoring_context(snapshot):
+    """Variables du template monitor.html ; les délais sont calculés à l'affichage."""
+    last_update_str, time_since_update = describe_last_update(snapshot['last_update'])
+    weather_last_update_str, weather_since_update = describe_last_update(snapshot['weather_last_update'])
+    sampled_ago = int((datetime.now(timezone.utc) - snapshot['sampled_at']).total_seconds())
+    return dict(
+        snapshot,
         last_update=last_update_str,
         time_since_update=time_since_update,
-        total_stations=total_stations,
-        total_status_logs=total_status_logs,
-        total_weather_logs=total_weather_logs,
-        total_forecasts=total_forecasts,
-        weather_last_update=weather_last_update_str
+        weather_last_update=weather_last_update_str,
+        weather_since_update=weather_since_update,
+        sampled_ago=sampled_ago,
+        refresh_interval=MONITOR_SAMPLE_INTERVAL
+    )
+
+@app.route('/monitoring/')
+def dashboard():
+    return render_template('monitor.html', **monitoring_context(get_monitoring_snapshot()))
+
+@app.route('/monitoring/slow')
+def slow_queries():
+    return render_template(
+        'slow_queries.html',
+        entries=list(slow_query_log.entries),
+        enabled=slow_query_log.enabled,
+        threshold_ms=SLOW_QUERY_MS,
+        capacity=SLOW_QUERY_LOG_SIZE
     )
 
 @app.route('/velib_list/')
 def velib_list():
-    pipeline = [
-        {"$limit": 50},
-        {
-            "$lookup": {
-                "from": "status",
-                "localField": "station_id",
-                "foreignField": "station_id",
-                "as": "status_info"
-            }
-        },
-        {
-            "$addFields": {
-                "latest_status": {"$last": "$status_info"}
-            }
-        }
-    ]
-    stations = list(db.stations.aggregate(pipeline))
-    return render_template('velib_list.html', stations=stations)
+    """
+    Liste de toutes les stations (station_latest), triée et paginée par clé :
+    chaque page est une lecture indexée de `size` lignes, quelle que soit sa position.
+    """
+    try:
+        sort, descending, size, after = parse_station_list_params(request.args)
+    except ValueError as e:
+        return jsonify({"error": f"Paramètre invalide: {e}"}), 400
+
+    field = STATION_LIST_SORTS[sort]
+    query, order = station_list_query(field, descending, after)
+    # Une ligne de plus que la page : indique s'il existe une page suivante
+    try:
+        stations = list(
+            db.station_latest.find(query, LATEST_PROJECTION, comment="velib_list").sort(order).limit(size + 1)
+        )
+    except errors.PyMongoError as e:
+        print(f"Erreur liste des stations: {e}")
+        return jsonify({"error": str(e)}), 500
+    next_cursor = None
+    if len(stations) > size:
+        stations = stations[:size]
+        next_cursor = encode_list_cursor(stations[-1].get(field), stations[-1]['station_id'])
+
+    return render_template(
+        'velib_list.html',
+        stations=stations,
+        sort=sort,
+        order='desc' if descending else 'asc',
+        size=size,
+        next_cursor=next_cursor,
+        is_first_page=after is None,
+        total_stations=estimated_count(db.station_latest)
+    )
+
+# --- DISPONIBILITÉ À UNE DATE (STATUT DELTA) ---
+def get_status_window_start(ts, station_ids=None):
+    """Début de la fenêtre de reconstruction pour la date `ts` (cf. window_start_lookups)."""
+    for query, projection, sort in window_start_lookups(ts, STATUS_DELTA, station_ids):
+        doc = col_status.find_one(query, projection, sort=sort)
+        if doc:
+            return doc['scrape_timestamp']
+    return None
+
+def get_availability_at(ts, station_ids=None):
+    """
+    Reconstruit la disponibilité (vélos/places) de chaque station à la date `ts` :
+    dernier statut connu entre le keyframe précédent et `ts`.
+    Renvoie {station_id: {'bikes', 'docks', 'as_of'}}.
+    """
+    start = get_status_window_start(ts, station_ids)
+    if start is None:
+        return {}
+
+    return {
+        doc['_id']: {"bikes": doc['bikes'], "docks": doc['docks'], "as_of": doc['as_of']}
+        for doc in col_status.aggregate(availability_pipeline(start, ts, station_ids), allowDiskUse=True,
+                                        comment="availability_at")
+    }
+
+@app.route('/api/availability_at')
+def api_availability_at():
+    """
+    Disponibilité des stations à une date passée (?ts=ISO, UTC), optionnellement
+    limitée à ?station_ids=1,2,3.
+    """
+    try:
+        ts, station_ids = parse_availability_params(request.args)
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Paramètre invalide: {e}"}), 400
+
+    try:
+        return jsonify(format_availability(get_availability_at(ts, station_ids)))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 # --- ROUTE 4 : RECHERCHE D'ITINÉRAIRE ---
-import math
+# Backend de recherche spatiale : "memory" (grille en mémoire) ou "geonear" (index 2dsphere)
+ROUTE_SPATIAL_BACKEND = os.getenv("ROUTE_SPATIAL_BACKEND", "memory")
+ROUTE_CANDIDATES = 10
 
-def calculate_distance(lat1, lon1, lat2, lon2):
+def find_nearest_stations(lat, lon, k=ROUTE_CANDIDATES, radius=None):
     """
-    Calcule la distance en mètres entre deux points (Haversine).
+    Renvoie les stations les plus proches d'un point : liste de (distance_m, station),
+    triée par distance. Les stations ont le format de /api/map_data.
     """
-    R = 6371000  # Rayon de la Terre en mètres
-    phi1 = lat1 * math.pi / 180
-    phi2 = lat2 * math.pi / 180
-    delta_phi = (lat2 - lat1) * math.pi / 180
-    delta_lambda = (lon2 - lon1) * math.pi / 180
+    if ROUTE_SPATIAL_BACKEND == "geonear":
+        return geo_near_stations(lat, lon, k, radius)
 
-    a = math.sin(delta_phi / 2) * math.sin(delta_phi / 2) + \
-        math.cos(phi1) * math.cos(phi2) * \
-        math.sin(delta_lambda / 2) * math.sin(delta_lambda / 2)
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    index = map_cache.get().index
+    if radius is not None:
+        return index.within(lat, lon, radius)[:k]
+    return index.nearest(lat, lon, k)
+
+def geo_near_stations(lat, lon, k, radius=None):
+    """Variante MongoDB : $geoNear sur l'index 2dsphere de station_latest.location."""
+    docs = db.station_latest.aggregate(geo_near_pipeline(lat, lon, k, radius), comment="geo_near")
+    return [(doc.pop('distance'), doc) for doc in docs]
+
+@app.route('/api/nearby_stations')
+def api_nearby_stations():
+    """
+    Stations les plus proches d'un point (?lat=&lon=), au plus `k`,
+    éventuellement limitées à un rayon `radius` en mètres.
+    """
+    try:
+        lat, lon, k, radius = parse_nearby_params(request.args, ROUTE_CANDIDATES)
+    except (KeyError, ValueError) as e:
+        return jsonify({"error": f"Paramètre invalide: {e}"}), 400
+
+    try:
+        results = find_nearest_stations(lat, lon, k, radius)
+        return jsonify([dict(station, distance=round(dist, 0)) for dist, station in results])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-    return R * c
+def build_candidates(nearest, type_, is_realtime):
+    """Prépare les candidats (copies) avec la distance et la dispo temps réel."""
+    candidates = []
+    for dist, s in nearest:
+        cand = dict(s)
+        cand[f'dist_{type_}'] = dist
+        # En prévisionnel, la dispo est évaluée plus bas avec la moyenne historique
+        cand['realtime_bikes'] = (s.get('bikes') or 0) if is_realtime else 0
+        cand['realtime_docks'] = (s.get('docks') or 0) if is_realtime else 0
+        candidates.append(cand)
+    return candidates
 
 @app.route('/api/find_route', methods=['POST'])
 def api_find_route():
@@ -352,81 +550,22 @@ def api_find_route():
 
         print(f"Route request: Realtime={is_realtime}, Time={req_time}")
 
-        # 2. Récupération de toutes les stations (Nom, Lat, Lon)
-        # On utilise le même pipeline que map_data pour avoir les infos de base
-        # Mais on a besoin de filtrer ensuite.
-        # Pour faire simple et robuste : on récupère tout et on trie en Python.
-        
-        # Pipeline simplifié pour avoir juste les infos statiques + dernier status
-        pipeline = [
-            {"$sort": {"scrape_timestamp": -1}},
-            {"$group": {
-                "_id": "$station_id",
-                "name": {"$first": "$name"},
-                "lat": {"$first": "$lat"},
-                "lon": {"$first": "$lon"}
-            }},
-             {
-                "$lookup": {
-                    "from": "status",
-                    "let": {"sid": "$_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$station_id", "$$sid"]}}},
-                        {"$sort": {"scrape_timestamp": -1}},
-                        {"$limit": 1}
-                    ],
-                    "as": "latest_status_array"
-                }
-            },
-            {"$addFields": {"latest_status": {"$arrayElemAt": ["$latest_status_array", 0]}}}
-        ]
-        
-        stations = list(db.stations.aggregate(pipeline))
-        
-        candidates_start = []
-        candidates_end = []
-
-        # 3. Filtrage et Calcul de distance
-        for s in stations:
-            if not s.get('lat') or not s.get('lon'):
-                continue
-                
-            dist_start = calculate_distance(start_lat, start_lon, s['lat'], s['lon'])
-            dist_end = calculate_distance(end_lat, end_lon, s['lat'], s['lon'])
-            
-            # Critères de disponibilité
-            bikes = 0
-            docks = 0
-            
-            if is_realtime:
-                # Mode Temps Réel
-                ls = s.get('latest_status', {})
-                if ls:
-                    bikes = ls.get('num_bikes_available', 0)
-                    docks = ls.get('num_docks_available', 0)
-            else:
-                # Mode Prévisionnel (Moyenne historique pour l'heure demandée)
-                # On ne fait pas la requête ici pour ne pas ralentir
-                # On le fera seulement pour les candidats proches
-                pass 
-
-            # On ajoute aux candidats avec la distance
-            # Pour le prévisionnel, on fera le check après le tri par distance pour minimiser les requêtes DB
-            s['dist_start'] = dist_start
-            s['dist_end'] = dist_end
-            s['realtime_bikes'] = bikes
-            s['realtime_docks'] = docks
-            
-            candidates_start.append(s)
-            candidates_end.append(s)
-
-        # 4. Tri et Sélection
-        candidates_start.sort(key=lambda x: x['dist_start'])
-        candidates_end.sort(key=lambda x: x['dist_end'])
+        # 2. Les 10 stations les plus proches du départ et de l'arrivée
+        # (index spatial en mémoire, reconstruit à chaque cycle du scraper)
+        candidates_start = build_candidates(
+            find_nearest_stations(start_lat, start_lon), "start", is_realtime)
+        candidates_end = build_candidates(
+            find_nearest_stations(end_lat, end_lon), "end", is_realtime)
 
         best_start = None
         best_end = None
 
+        # En prévisionnel : moyennes historiques de tous les candidats en une seule requête
+        historical = {}
+        if not is_realtime:
+            candidate_ids = {c['station_id'] for c in candidates_start[:10] + candidates_end[:10]}
+            historical = get_historical_avgs(list(candidate_ids), req_time.hour)
+
         # Recherche du meilleur départ
         for cand in candidates_start[:10]: # On regarde les 10 plus proches
             if is_realtime:
@@ -435,7 +574,7 @@ def api_find_route():
                     break
             else:
                 # Check historique
-                avg_bikes = get_historical_avg(cand['_id'], req_time.hour, 'bikes')
+                avg_bikes = historical.get(cand['station_id'], {}).get('bikes', 0)
                 if avg_bikes >= 1:
                     best_start = cand
                     break
@@ -448,7 +587,7 @@ def api_find_route():
                     break
             else:
                 # Check historique
-                avg_docks = get_historical_avg(cand['_id'], req_time.hour, 'docks')
+                avg_docks = historical.get(cand['station_id'], {}).get('docks', 0)
                 if avg_docks >= 1:
                     best_end = cand
                     break
@@ -466,30 +605,41 @@ def api_find_route():
         print(f"Error find_route: {e}")
         return jsonify({"error": str(e)}), 500
 
-def get_historical_avg(station_id, hour, field_type):
+def get_historical_avgs(station_ids, hour):
     """
-    Calcule la moyenne historique pour une station et une heure donnée.
-    field_type: 'bikes' ou 'docks'
+    Calcule les moyennes historiques (vélos et places) à une heure donnée
+    pour une liste de stations, en un seul aller-retour sur status_hourly.
+    Renvoie {station_id: {'bikes': moyenne, 'docks': moyenne}}.
     """
-    field_map = {
-        'bikes': 'num_bikes_available',
-        'docks': 'num_docks_available'
-    }
+    if not station_ids:
+        return {}
     pipeline = [
-        {"$match": {"station_id": station_id}},
-        {"$project": {"hour": {"$hour": "$scrape_timestamp"}, "val": f"${field_map[field_type]}"}},
-        {"$match": {"hour": hour}},
-        {"$group": {"_id": None, "avg": {"$avg": "$val"}}}
+        # day_of_week explicite : bornes d'index exactes sur (station_id, day_of_week, hour)
+        {"$match": {
+            "station_id": {"$in": station_ids},
+            "day_of_week": {"$in": list(range(7))},
+            "hour": hour
+        }},
+        {"$group": {
+            "_id": "$station_id",
+            "count": {"$sum": "$count"},
+            "sum_bikes": {"$sum": "$sum_bikes"},
+            "sum_docks": {"$sum": "$sum_docks"}
+        }}
     ]
-    res = list(db.status.aggregate(pipeline))
-    if res:
-        return res[0]['avg']
-    return 0
+    averages = {}
+    for res in db.status_hourly.aggregate(pipeline, comment="historical_avgs"):
+        if res['count']:
+            averages[res['_id']] = {
+                'bikes': res['sum_bikes'] / res['count'],
+                'docks': res['sum_docks'] / res['count']
+            }
+    return averages
 
 def format_station_response(station, type_):
     if not station: return None
     return {
-        "station_id": station['_id'],
+        "station_id": station['station_id'],
         "name": station['name'],
         "lat": station['lat'],
         "lon": station['lon'],
@@ -523,18 +673,151 @@ def api_weather():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-import joblib
-import pandas as pd
-import numpy as np
+# Load Models : artefacts natifs XGBoost (.ubj + métadonnées, chargés sans pandas ni
+# pickle), sinon ancien pickle. Chargés au démarrage puis rechargés à chaud (thread de
+# fond) dès que le trainer publie une nouvelle version, sans redémarrer Flask
+MODEL_PATH = "/models/velib_model.ubj"
+MODEL_PICKLE_PATH = "/models/velib_model.pkl"
+# Modèle par station (entraîné par trainer/train.py, optionnel)
+STATION_MODEL_PATH = "/models/velib_station_model.ubj"
+STATION_MODEL_PICKLE_PATH = "/models/velib_station_model.pkl"
+MODEL_RELOAD_INTERVAL = int(os.getenv("MODEL_RELOAD_INTERVAL", "30"))
+
+model_registry = ModelRegistry("velib_model", [MODEL_PATH, MODEL_PICKLE_PATH],
+                               load_predictor, MODEL_RELOAD_INTERVAL)
+station_model_registry = ModelRegistry("velib_station_model", [STATION_MODEL_PATH, STATION_MODEL_PICKLE_PATH],
+                                       load_predictor, MODEL_RELOAD_INTERVAL)
+for registry in (model_registry, station_model_registry):
+    if not registry.reload():
+        print(f"Modèle {registry.name} indisponible ({registry.path})")
+
+# --- Grille de prévisions pré-calculée ---
+# Les prédictions ne changent qu'avec une nouvelle météo (weather_scraper, toutes les
+# 8 minutes), le passage à l'heure suivante ou un nouveau modèle : un job de fond
+# recalcule alors la grille 48 créneaux (modèle global + toutes les stations), la stocke
+# dans forecast_predictions et en mémoire ; /api/forecast_stats n'est plus qu'une lecture.
+FORECAST_REFRESH_INTERVAL = int(os.getenv("FORECAST_REFRESH_INTERVAL", "60"))
+forecast_grid_cache = ForecastGridCache()
+
+def get_upcoming_forecasts():
+    """Les 48 prochains créneaux horaires de meteo_forecast."""
+    now = datetime.now()
+    return list(col_weather_forecast.find({
+        "time": {"$gte": now.strftime("%Y-%m-%dT%H:00")}
+    }).sort("time", 1).limit(48))
+
+def forecast_grid_key(forecast_items, model_version, station_model_version):
+    """Premier créneau, nombre de créneaux, dernière mise à jour météo et versions des modèles."""
+    weather_version = max(str(item.get('last_updated')) for item in forecast_items)
+    return f"{forecast_items[0]['time']}|{len(forecast_items)}|{weather_version}|{model_version}|{station_model_version}"
+
+def predict_global_forecast(forecast_items, model):
+    """Créneaux (méta-données) et valeurs du modèle global (moyenne toutes stations)."""
+    # Features dans un tableau NumPy préalloué, méta-données en listes parallèles
+    X, times, descs = build_global_matrix(forecast_items, get_weather_description)
+    slots = [{
+        "time": times[i],
+        "temp": item.get('temperature', 15),
+        "wind": item.get('windspeed', 10),
+        "weather_description": descs[i],
+        "weather_code": item.get('weathercode', 0)
+    } for i, item in enumerate(forecast_items)]
+    if model is None:
+        return slots, None
+
+    # Predict (Returns GLOBAL AVERAGE)
+    with MODEL_INFERENCE_LATENCY.labels("global").time():
+        values = model.predict(X)
+    return slots, values
+
+def compute_forecast_grid(key, forecast_items, model, station_model):
+    t0 = time.perf_counter()
+    slots, global_values = predict_global_forecast(forecast_items, model)
+    stations, station_values = None, None
+    if station_model is not None:
+        stations = get_latest_snapshot({"lat": {"$ne": None}, "lon": {"$ne": None}})
+        # Profils horaires limités aux jours couverts par les créneaux
+        _, days = forecast_hours_utc(forecast_items)
+        profile_docs = db.status_hourly.find(
+            {"day_of_week": {"$in": sorted({int(d) for d in days})}},
+            {"_id": 0, "station_id": 1, "day_of_week": 1, "hour": 1, "sum_bikes": 1, "count": 1}
+        )
+        # Lecture des profils hors chronométrage : le temps d'inférence n'inclut pas MongoDB
+        profile_docs = list(profile_docs)
+        with MODEL_INFERENCE_LATENCY.labels("station").time():
+            stations, station_values = predict_station_values(station_model, forecast_items, stations, profile_docs)
+    grid = ForecastGrid(key, slots, global_values, stations, station_values)
+    print(f"Grille de prévisions recalculée : {len(slots)} créneaux × "
+          f"{len(grid.index)} stations en {time.perf_counter() - t0:.2f}s")
+    return grid
+
+def store_forecast_grid(grid):
+    """Stations d'abord, _meta en dernier : un lecteur qui voit la nouvelle clé a toute la grille."""
+    docs = grid.to_documents()
+    operations = [ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in docs[:-1]]
+    if operations:
+        db.forecast_predictions.bulk_write(operations, ordered=False)
+    db.forecast_predictions.replace_one({"_id": "_meta"}, docs[-1], upsert=True)
+
+def load_forecast_grid(key):
+    """Grille déjà calculée pour cette clé (par un autre processus), sinon None."""
+    meta = db.forecast_predictions.find_one({"_id": "_meta", "key": key})
+    if meta is None:
+        return None
+    station_docs = db.forecast_predictions.find({"key": key, "_id": {"$ne": "_meta"}})
+    return ForecastGrid.from_documents(meta, station_docs)
+
+def refresh_forecast_grid():
+    """Recalcule la grille si les créneaux, la météo ou un modèle ont changé."""
+    forecast_items = get_upcoming_forecasts()
+    if not forecast_items:
+        return forecast_grid_cache.current
+    # Un seul instantané (modèle, version) par modèle : la clé et le calcul restent
+    # cohérents même si un rechargement a lieu pendant le calcul
+    model, model_version = model_registry.current
+    station_model, station_model_version = station_model_registry.current
+    key = forecast_grid_key(forecast_items, model_version, station_model_version)
+
+    def compute():
+        grid = load_forecast_grid(key)
+        if grid is None:
+            grid = compute_forecast_grid(key, forecast_items, model, station_model)
+            store_forecast_grid(grid)
+        return grid
+
+    return forecast_grid_cache.get(key, compute)
+
+def forecast_refresher_loop():
+    while True:
+        try:
+            refresh_forecast_grid()
+        except Exception as e:
+            print(f"Erreur rafraîchissement des prévisions: {e}")
+        time.sleep(FORECAST_REFRESH_INTERVAL)
+
+def start_background_tasks():
+    """
+    Threads de fond du processus : rechargement des modèles, grille de prévisions,
+    échantillonnage du monitoring et explain des requêtes lentes.
+    Idempotent (cf. background.start_once) ; à appeler dans chaque processus qui sert des requêtes.
+    """
+    model_registry.start()
+    station_model_registry.start()
+    start_once("forecast-refresher", forecast_refresher_loop)
+    start_once("monitoring-sampler", monitoring_sampler_loop)
+    slow_query_log.start()
 
-# Load Model
-MODEL_PATH = "/models/velib_model.pkl"
-try:
-    model = joblib.load(MODEL_PATH)
-    print(f"Modèle chargé depuis {MODEL_PATH}")
-except Exception as e:
-    print(f"Erreur chargement modèle: {e}")
-    model = None
+def warm_caches():
+    """
+    Remplit les caches du processus (snapshot des stations de la carte, grille de
+    prévisions). Sous gunicorn (preload_app), appelée dans le maître avant le fork :
+    les workers partagent alors ces données, comme les modèles, en copy-on-write.
+    """
+    for name, fill in (("carte", map_cache.get), ("prévisions", refresh_forecast_grid)):
+        try:
+            fill()
+        except Exception as e:
+            print(f"Préchargement {name} impossible: {e}")
 
 @app.route('/model', strict_slashes=False)
 def model_dashboard():
@@ -564,59 +847,34 @@ def api_forecast_stats():
         req_data = request.get_json()
         station_id = req_data.get('station_id') # Optional specific station
         
-        # 1. Fetch Station Capacity if specific station requested
+        # 1. Lecture de la grille pré-calculée (calculée ici une seule fois si le job
+        # de fond n'est pas encore passé)
+        grid = forecast_grid_cache.current or refresh_forecast_grid()
+        predictions = []
+
+        # Station précise : prévisions du modèle par station, sinon repli sur le
+        # modèle global mis à l'échelle de la capacité
+        station_values = grid.for_station(station_id) if grid and station_id else None
+
+        # 2. Fetch Station Capacity if specific station requested (global model only)
         station_capacity = 30 # Default average capacity
         station_name = "Global"
         
-        if station_id:
+        if station_id and not station_values:
             try:
-                # Try to get station capacity from latest status or static info
-                # Here we fetch the latest status to get capacity = bikes + docks
-                stat = db.status.find_one({"station_id": station_id}, sort=[("scrape_timestamp", -1)])
+                # Latest status + static info from station_latest (capacity = bikes + docks)
+                stat = db.station_latest.find_one({"station_id": station_id}, LATEST_PROJECTION)
                 if stat:
-                    station_capacity = stat.get('num_bikes_available', 0) + stat.get('num_docks_available', 0)
-                
-                # Fetch Name
-                st_info = db.stations.find_one({"_id": station_id})
-                if st_info: station_name = st_info.get('name', 'Station')
+                    station_capacity = (stat.get('num_bikes_available') or 0) + (stat.get('num_docks_available') or 0)
+                    station_name = stat.get('name', 'Station')
             except Exception as e:
                 print(f"Warning fetching station info: {e}")
 
-        # 2. Récupérer les prévisions futures depuis meteo_forecast
-        now = datetime.now()
-        cursor = col_weather_forecast.find({
-            "time": {"$gte": now.strftime("%Y-%m-%dT%H:00")}
-        }).sort("time", 1).limit(48)
-        
-        forecast_items = list(cursor)
-        predictions = []
-        
-        if forecast_items and model:
-            # Prepare DataFrame for Model
-            rows = []
-            for item in forecast_items:
-                t_str = item.get('time')
-                dt = datetime.fromisoformat(t_str)
-                
-                row = {
-                    'hour': dt.hour,
-                    'day_of_week': dt.weekday(),
-                    'temperature': item.get('temperature', 15),
-                    'windspeed': item.get('windspeed', 10),
-                    'weathercode': item.get('weathercode', 0),
-                    # Meta info to keep for result
-                    '_time': t_str,
-                    '_desc': get_weather_description(item.get('weathercode', 0))
-                }
-                rows.append(row)
-            
-            df_pred = pd.DataFrame(rows)
-            
-            # Predict (Returns GLOBAL AVERAGE)
-            features = ['hour', 'day_of_week', 'temperature', 'windspeed', 'weathercode']
-            X = df_pred[features]
-            y_pred = model.predict(X)
-            
+        if station_values:
+            station_name, station_capacity, values = station_values
+            for slot, value in zip(grid.slots, values):
+                predictions.append(dict(slot, predicted_bikes=int(value)))
+        elif grid and grid.slots and grid.global_values is not None:
             # Scale Factor: (Station Capacity / Avg Capacity of ~30)
             # This makes big stations have big numbers, small stations have small numbers.
             # We assume the model was trained on an average station of capacity ~30.
@@ -624,27 +882,20 @@ def api_forecast_stats():
             scale_factor = station_capacity / 30.0
             
             # Format results
-            for i, row in enumerate(rows):
+            for slot, global_val in zip(grid.slots, grid.global_values):
                 # Ensure non-negative and round
-                global_val = float(y_pred[i])
-                scaled_val = max(0, round(global_val * scale_factor))
+                scaled_val = max(0, round(float(global_val) * scale_factor))
                 
                 # Clip to actual capacity if known
                 if station_id:
                     scaled_val = min(scaled_val, station_capacity)
                 
-                predictions.append({
-                    "time": row['_time'],
-                    "temp": row['temperature'],
-                    "wind": row['windspeed'],
-                    "weather_description": row['_desc'],
-                    "weather_code": row['weathercode'],
-                    "predicted_bikes": scaled_val
-                })
+                predictions.append(dict(slot, predicted_bikes=scaled_val))
                 
         else:
             # Fallback (Simulated or Error if critical)
             print("Fallback forecast (No model or No data)")
+            now = datetime.now()
             for i in range(0, 24, 3): 
                 future_time = now.replace(hour=i, minute=0, second=0, microsecond=0)
                 if future_time < now: future_time = future_time.replace(day=future_time.day + 1)
@@ -668,4 +919,10 @@ def api_forecast_stats():
         return jsonify({"error": str(e)}), 500
 
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Threads de fond démarrés par chaque point d'entrée, jamais depuis une route :
+    # ici (serveur de dev), post_fork (gunicorn) et lifespan (asgi_app).
+    # Avec le reloader (debug), seul le processus enfant sert les requêtes.
+    debug = True
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_tasks()
+    app.run(host='0.0.0.0', port=5000, debug=debug)
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Variante asynchrone (ASGI) de l'API : uvicorn asgi_app:app  (SERVER_MODE=asgi)
+
+Les routes API ci-dessous utilisent le driver asynchrone motor : les requêtes
+indépendantes d'une même route partent en parallèle (asyncio.gather), la latence
+est celle de la plus lente et un seul processus garde de nombreuses requêtes en
+vol. /monitoring/ rend l'instantané échantillonné par la partie Flask. Toutes les
+autres routes (pages, carte, itinéraires, prévisions) restent servies par
+l'application Flask, montée en WSGI derrière.
+"""
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+
+from a2wsgi import WSGIMiddleware
+from motor.motor_asyncio import AsyncIOMotorClient
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+from starlette.templating import Jinja2Templates
+
+import app as flask_app
+from metrics import REQUEST_LATENCY
+from queries import (LATEST_PROJECTION, availability_pipeline, format_availability, format_hourly_stats,
+                     geo_near_pipeline, hourly_stats_pipeline, parse_availability_params, parse_nearby_params,
+                     pick_window_start, total_capacity, window_start_lookups)
+
+templates = Jinja2Templates(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates'))
+
+
+def connect_async_databases():
+    """
+    Clients motor (liés à la boucle asyncio en cours : créés au démarrage de
+    l'application, dans chaque processus uvicorn).
+    """
+    global client, db, col_status
+
+    client = AsyncIOMotorClient(flask_app.MONGO_URI, event_listeners=[flask_app.mongo_metrics_listener,
+                                                                    flask_app.slow_query_log])
+    db = client['velib']
+    col_status = db[flask_app.col_status.name]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    connect_async_databases()
+    # Threads de fond de la partie Flask (modèles, prévisions, monitoring)
+    flask_app.start_background_tasks()
+    yield
+    client.close()
+
+
+async def dashboard(request):
+    # Instantané échantillonné en tâche de fond par la partie Flask (aucune requête ici,
+    # sauf la toute première collecte, faite hors de la boucle asyncio)
+    snapshot = await run_in_threadpool(flask_app.get_monitoring_snapshot)
+    return templates.TemplateResponse(request, 'monitor.html', flask_app.monitoring_context(snapshot))
+
+
+async def api_hourly_stats(request):
+    try:
+        req_data = await request.json()
+        station_ids = req_data.get('station_ids', [])
+
+        if not station_ids:
+            return JSONResponse([])
+
+        # Capacité (station_latest) et moyennes horaires (status_hourly) en parallèle
+        stations, stats = await asyncio.gather(
+            db.station_latest.find({"station_id": {"$in": station_ids}}, LATEST_PROJECTION,
+                                   comment="hourly_stats").to_list(None),
+            db.status_hourly.aggregate(hourly_stats_pipeline(station_ids), comment="hourly_stats").to_list(None),
+        )
+        return JSONResponse({
+            "data": format_hourly_stats(stats),
+            "capacity": total_capacity(stations)
+        })
+    except Exception as e:
+        print(f"Error stats: {e}")
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def api_availability_at(request):
+    try:
+        ts, station_ids = parse_availability_params(request.query_params)
+    except (KeyError, ValueError) as e:
+        return JSONResponse({"error": f"Paramètre invalide: {e}"}, status_code=400)
+
+    try:
+        # Début de fenêtre : les recherches (keyframe en mode delta, dernier cycle) en parallèle
+        start = pick_window_start(await asyncio.gather(*(
+            col_status.find_one(query, projection, sort=sort)
+            for query, projection, sort in window_start_lookups(ts, flask_app.STATUS_DELTA, station_ids)
+        )))
+        if start is None:
+            return JSONResponse([])
+
+        cursor = col_status.aggregate(availability_pipeline(start, ts, station_ids), allowDiskUse=True,
+                                      comment="availability_at")
+        availability = {
+            doc['_id']: {"bikes": doc['bikes'], "docks": doc['docks'], "as_of": doc['as_of']}
+            async for doc in cursor
+        }
+        return JSONResponse(format_availability(availability))
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+async def api_nearby_stations(request):
+    try:
+        lat, lon, k, radius = parse_nearby_params(request.query_params, flask_app.ROUTE_CANDIDATES)
+    except (KeyError, ValueError) as e:
+        return JSONResponse({"error": f"Paramètre invalide: {e}"}, status_code=400)
+
+    try:
+        if flask_app.ROUTE_SPATIAL_BACKEND == "geonear":
+            docs = await db.station_latest.aggregate(geo_near_pipeline(lat, lon, k, radius),
+                                                     comment="geo_near").to_list(None)
+            results = [(doc.pop('distance'), doc) for doc in docs]
+        else:
+            # Index en mémoire de la partie Flask (son rafraîchissement peut lire MongoDB)
+            results = await run_in_threadpool(flask_app.find_nearest_stations, lat, lon, k, radius)
+        return JSONResponse([dict(station, distance=round(dist, 0)) for dist, station in results])
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=500)
+
+
+def timed_route(path, endpoint, **kwargs):
+    """Route Starlette chronométrée comme les routes Flask (même histogramme, même label)."""
+    async def timed_endpoint(request):
+        start = time.perf_counter()
+        response = await endpoint(request)
+        REQUEST_LATENCY.labels(request.method, path, response.status_code).observe(time.perf_counter() - start)
+        return response
+    return Route(path, timed_endpoint, **kwargs)
+
+
+app = Starlette(
+    routes=[
+        timed_route('/monitoring/', dashboard),
+        timed_route('/api/hourly_stats', api_hourly_stats, methods=['POST']),
+        timed_route('/api/availability_at', api_availability_at),
+        timed_route('/api/nearby_stations', api_nearby_stations),
+        # Tout le reste : application Flask
+        Mount('/', app=WSGIMiddleware(flask_app.app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,30 @@
+"""
+Threads de fond du processus (rechargement des modèles, grille de prévisions,
+monitoring, explain des requêtes lentes) : un thread démon par nom, démarré une
+seule fois par processus quel que soit le nombre d'appels.
+"""
+import os
+import threading
+
+_started = set()
+_lock = threading.Lock()
+
+
+def start_once(name, target):
+    """Lance `target` dans le thread démon `name` s'il n'existe pas encore. Renvoie True s'il vient d'être lancé."""
+    with _lock:
+        if name in _started:
+            return False
+        _started.add(name)
+    threading.Thread(target=target, name=name, daemon=True).start()
+    return True
+
+
+def _reset_after_fork():
+    # Les threads ne survivent pas au fork (workers gunicorn) : l'enfant repart de zéro
+    global _lock
+    _lock = threading.Lock()
+    _started.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,187 @@
+import threading
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+# Ordre des colonnes du modèle global (trainer/train.py load_data)
+GLOBAL_FEATURES = ['hour', 'day_of_week', 'temperature', 'windspeed', 'weathercode']
+
+# Ordre des colonnes du modèle par station : identique à STATION_FEATURES (trainer/features.py)
+STATION_FEATURES = ['hour', 'day_of_week', 'temperature', 'windspeed', 'weathercode',
+                    'lat', 'lon', 'capacity', 'profile_bikes']
+
+# Les créneaux de meteo_forecast sont en heure de Paris (open-meteo, timezone=Europe/Paris),
+# le modèle est entraîné sur des heures UTC (scrape_timestamp)
+FORECAST_TZ = ZoneInfo("Europe/Paris")
+
+DEFAULT_CAPACITY = 20  # même valeur par défaut qu'à l'entraînement
+
+
+def build_global_matrix(forecast_items, describe):
+    """
+    Features du modèle global directement dans un tableau float32 préalloué (T, 5),
+    depuis les documents meteo_forecast (curseur ou liste). Les méta-données de chaque
+    créneau (heure ISO, description météo via `describe`) sont gardées dans des listes
+    parallèles : renvoie (X, times, descs).
+    """
+    forecast_items = list(forecast_items)
+    X = np.empty((len(forecast_items), len(GLOBAL_FEATURES)), dtype=np.float32)
+    times = [None] * len(forecast_items)
+    descs = [None] * len(forecast_items)
+    for t, item in enumerate(forecast_items):
+        t_str = item.get('time')
+        dt = datetime.fromisoformat(t_str)
+        code = item.get('weathercode', 0)
+        X[t, 0] = dt.hour
+        X[t, 1] = dt.weekday()
+        X[t, 2] = item.get('temperature', 15)
+        X[t, 3] = item.get('windspeed', 10)
+        X[t, 4] = code
+        times[t] = t_str
+        descs[t] = describe(code)
+    return X, times, descs
+
+
+def forecast_hours_utc(forecast_items):
+    """(heures, jours de la semaine) UTC des créneaux de prévision, en tableaux int."""
+    hours = np.empty(len(forecast_items), dtype=np.int64)
+    days = np.empty(len(forecast_items), dtype=np.int64)
+    for t, item in enumerate(forecast_items):
+        dt = datetime.fromisoformat(item['time']).replace(tzinfo=FORECAST_TZ).astimezone(timezone.utc)
+        hours[t] = dt.hour
+        days[t] = dt.weekday()
+    return hours, days
+
+
+def station_capacity(station):
+    """Capacité déclarée, sinon vélos + places du dernier statut."""
+    if station.get('capacity'):
+        return station['capacity']
+    total = (station.get('num_bikes_available') or 0) + (station.get('num_docks_available') or 0)
+    return total or DEFAULT_CAPACITY
+
+
+def build_station_matrix(forecast_items, stations, profile_docs):
+    """
+    Matrice des features pour tous les couples (créneau, station) : tableau float32
+    de forme (T * N, F), lignes rangées créneau par créneau (station la plus rapide).
+
+    profile_docs : documents status_hourly (station_id, day_of_week, hour, sum_bikes, count) ;
+    un profil absent vaut la moitié de la capacité, comme à l'entraînement.
+    """
+    n_times, n_stations = len(forecast_items), len(stations)
+    hours, days = forecast_hours_utc(forecast_items)
+    index = {s['station_id']: i for i, s in enumerate(stations)}
+    capacities = np.array([station_capacity(s) for s in stations], dtype=np.float32)
+
+    # Profil horaire de chaque station : (N, 7, 24), NaN si inconnu
+    profiles = np.full((n_stations, 7, 24), np.nan, dtype=np.float32)
+    for doc in profile_docs:
+        i = index.get(doc.get('station_id'))
+        if i is not None and doc.get('count'):
+            profiles[i, doc['day_of_week'], doc['hour']] = doc['sum_bikes'] / doc['count']
+
+    X = np.empty((n_times, n_stations, len(STATION_FEATURES)), dtype=np.float32)
+    X[:, :, 0] = hours[:, None]
+    X[:, :, 1] = days[:, None]
+    X[:, :, 2] = np.array([item.get('temperature', 15) for item in forecast_items], dtype=np.float32)[:, None]
+    X[:, :, 3] = np.array([item.get('windspeed', 10) for item in forecast_items], dtype=np.float32)[:, None]
+    X[:, :, 4] = np.array([item.get('weathercode', 0) for item in forecast_items], dtype=np.float32)[:, None]
+    X[:, :, 5] = np.array([s['lat'] for s in stations], dtype=np.float32)[None, :]
+    X[:, :, 6] = np.array([s['lon'] for s in stations], dtype=np.float32)[None, :]
+    X[:, :, 7] = capacities[None, :]
+    profile = profiles[:, days, hours].T  # (T, N)
+    X[:, :, 8] = np.where(np.isnan(profile), capacities[None, :] / 2, profile)
+    return X.reshape(n_times * n_stations, len(STATION_FEATURES))
+
+
+def predict_station_values(model, forecast_items, stations, profile_docs):
+    """
+    48 créneaux × toutes les stations en un seul appel à model.predict.
+    Renvoie (stations retenues, prédictions (T, N) bornées à [0, capacité]).
+    """
+    stations = [s for s in stations if s.get('lat') is not None and s.get('lon') is not None]
+    X = build_station_matrix(forecast_items, stations, profile_docs)
+    y = np.asarray(model.predict(X), dtype=np.float32).reshape(len(forecast_items), len(stations))
+    capacities = np.array([station_capacity(s) for s in stations], dtype=np.float32)
+    return stations, np.clip(np.rint(y), 0, capacities[None, :])
+
+
+class ForecastGrid:
+    """
+    Grille de prévisions pour une série de créneaux météo : valeurs du modèle global
+    (T,) et, si le modèle par station est disponible, prédictions (T, N) par station.
+    `key` identifie les entrées du calcul (créneaux, météo, versions des modèles).
+    """
+
+    def __init__(self, key, slots, global_values=None, stations=None, station_values=None):
+        self.key = key
+        self.slots = slots  # [{time, temp, wind, weather_description, weather_code}]
+        self.global_values = global_values
+        stations = stations or []
+        self.index = {s['station_id']: i for i, s in enumerate(stations)}
+        self.names = [s.get('name', 'Station') for s in stations]
+        self.capacities = [station_capacity(s) for s in stations]
+        self.station_values = station_values
+
+    def for_station(self, station_id):
+        """(nom, capacité, valeurs prédites par créneau) ou None si la station est inconnue."""
+        i = self.index.get(station_id)
+        if i is None or self.station_values is None:
+            return None
+        return self.names[i], self.capacities[i], self.station_values[:, i]
+
+    def to_documents(self):
+        """Documents forecast_predictions : un par station puis le document _meta."""
+        docs = [{
+            "_id": station_id,
+            "key": self.key,
+            "name": self.names[i],
+            "capacity": self.capacities[i],
+            "predicted_bikes": [int(v) for v in self.station_values[:, i]]
+        } for station_id, i in self.index.items()]
+        docs.append({
+            "_id": "_meta",
+            "key": self.key,
+            "slots": self.slots,
+            "global_values": None if self.global_values is None else [float(v) for v in self.global_values],
+            "stations": len(self.index),
+            "computed_at": datetime.utcnow()
+        })
+        return docs
+
+    @classmethod
+    def from_documents(cls, meta, station_docs):
+        """Inverse de to_documents (station_docs : documents portant la même clé que meta)."""
+        station_docs = list(station_docs)
+        stations = [{"station_id": d["_id"], "name": d.get("name"), "capacity": d.get("capacity")}
+                    for d in station_docs]
+        values = None
+        if station_docs:
+            values = np.array([d["predicted_bikes"] for d in station_docs], dtype=np.float32).T
+        global_values = meta.get("global_values")
+        return cls(meta["key"], meta["slots"],
+                   None if global_values is None else np.asarray(global_values, dtype=np.float32),
+                   stations, values)
+
+
+class ForecastGridCache:
+    """
+    Dernière ForecastGrid calculée. `current` est une simple lecture (aucun calcul
+    dans les requêtes) ; `get` ne recalcule que si la clé a changé.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.current = None
+
+    def get(self, key, compute):
+        grid = self.current
+        if grid is not None and grid.key == key:
+            return grid
+        with self._lock:
+            # Un autre thread a pu faire le calcul pendant l'attente du verrou
+            if self.current is None or self.current.key != key:
+                self.current = compute()
+            return self.current
@@ -0,0 +1,213 @@
+import math
+from collections import defaultdict
+
+import numpy as np
+
+EARTH_RADIUS = 6371000  # Rayon de la Terre en mètres
+
+# Au-delà de ce nombre d'anneaux (10 km avec des cellules de 500 m), ou pour un point
+# hors de la grille, la recherche par cellules coûte plus qu'un calcul vectorisé sur
+# toutes les stations : on bascule sur distances() + argpartition
+MAX_RING_SEARCH = 20
+
+
+def calculate_distance(lat1, lon1, lat2, lon2):
+    """
+    Calcule la distance en mètres entre deux points (Haversine).
+    """
+    phi1 = lat1 * math.pi / 180
+    phi2 = lat2 * math.pi / 180
+    delta_phi = (lat2 - lat1) * math.pi / 180
+    delta_lambda = (lon2 - lon1) * math.pi / 180
+
+    a = math.sin(delta_phi / 2) * math.sin(delta_phi / 2) + \
+        math.cos(phi1) * math.cos(phi2) * \
+        math.sin(delta_lambda / 2) * math.sin(delta_lambda / 2)
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+    return EARTH_RADIUS * c
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """
+    Version vectorisée (NumPy) de calculate_distance : accepte des scalaires
+    ou des tableaux compatibles par broadcasting, renvoie des mètres.
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_phi = phi2 - phi1
+    delta_lambda = np.radians(lon2) - np.radians(lon1)
+
+    a = np.sin(delta_phi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def distance_matrix(query_lats, query_lons, lats, lons):
+    """
+    Matrice des distances (mètres) entre m points de requête et n stations :
+    tableau float64 de forme (m, n).
+    """
+    query_lats = np.asarray(query_lats, dtype=np.float64).reshape(-1, 1)
+    query_lons = np.asarray(query_lons, dtype=np.float64).reshape(-1, 1)
+    return haversine_np(query_lats, query_lons,
+                        np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+
+
+class StationGridIndex:
+    """
+    Index spatial en mémoire (grille régulière) pour les requêtes
+    "k plus proches" et "dans un rayon" sur les stations.
+
+    Les coordonnées sont projetées en mètres (équirectangulaire centrée sur
+    la zone couverte, largement suffisant à l'échelle de Paris) puis rangées
+    dans des cellules carrées de `cell_size` mètres. Les distances renvoyées
+    sont recalculées en Haversine (vectorisé sur les tableaux `lats`/`lons`).
+    """
+
+    def __init__(self, stations, cell_size=500):
+        self.cell_size = cell_size
+        self.stations = [s for s in stations if s.get('lat') and s.get('lon')]
+        self.cells = defaultdict(list)
+
+        if self.stations:
+            lat0 = sum(s['lat'] for s in self.stations) / len(self.stations)
+        else:
+            lat0 = 48.8566
+        self._ky = EARTH_RADIUS * math.pi / 180
+        self._kx = self._ky * math.cos(lat0 * math.pi / 180)
+
+        # Coordonnées en tableaux float64 contigus (calculs vectorisés)
+        self.lats = np.ascontiguousarray([s['lat'] for s in self.stations], dtype=np.float64)
+        self.lons = np.ascontiguousarray([s['lon'] for s in self.stations], dtype=np.float64)
+
+        self._points = []
+        for i, s in enumerate(self.stations):
+            x, y = self._project(s['lat'], s['lon'])
+            self._points.append((x, y))
+            self.cells[self._cell(x, y)].append(i)
+
+        if self.cells:
+            xs = [c[0] for c in self.cells]
+            ys = [c[1] for c in self.cells]
+            self._bounds = (min(xs), max(xs), min(ys), max(ys))
+        else:
+            self._bounds = (0, 0, 0, 0)
+
+    def __len__(self):
+        return len(self.stations)
+
+    def distances(self, lat, lon):
+        """Distances (mètres) d'un point à toutes les stations, dans l'ordre de `stations`."""
+        return haversine_np(lat, lon, self.lats, self.lons)
+
+    def distance_matrix(self, query_lats, query_lons):
+        """Distances (mètres) de plusieurs points à toutes les stations : forme (m, n)."""
+        return distance_matrix(query_lats, query_lons, self.lats, self.lons)
+
+    def _collect(self, lat, lon, indices):
+        """(distance_m, station) pour les indices donnés, triés par distance."""
+        if not indices:
+            return []
+        idx = np.fromiter(indices, dtype=np.intp, count=len(indices))
+        dist = haversine_np(lat, lon, self.lats[idx], self.lons[idx])
+        order = np.argsort(dist, kind='stable')
+        return [(float(dist[j]), self.stations[idx[j]]) for j in order]
+
+    def _project(self, lat, lon):
+        return lon * self._kx, lat * self._ky
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def _ring(self, cx, cy, r):
+        """Cellules de la grille à distance de Chebyshev exactement r de (cx, cy), bornées à la grille."""
+        if r == 0:
+            yield cx, cy
+            return
+        min_x, max_x, min_y, max_y = self._bounds
+        x_range = range(max(cx - r, min_x), min(cx + r, max_x) + 1)
+        for gy in (cy - r, cy + r):
+            if min_y <= gy <= max_y:
+                for gx in x_range:
+                    yield gx, gy
+        for gx in (cx - r, cx + r):
+            if min_x <= gx <= max_x:
+                for gy in range(max(cy - r + 1, min_y), min(cy + r - 1, max_y) + 1):
+                    yield gx, gy
+
+    def _max_ring(self, cx, cy):
+        min_x, max_x, min_y, max_y = self._bounds
+        return max(abs(cx - min_x), abs(cx - max_x), abs(cy - min_y), abs(cy - max_y))
+
+    def _in_bounds(self, cx, cy):
+        min_x, max_x, min_y, max_y = self._bounds
+        return min_x <= cx <= max_x and min_y <= cy <= max_y
+
+    def _nearest_vectorized(self, lat, lon, k):
+        """k plus proches par calcul de toutes les distances (argpartition, puis tri des k)."""
+        dist = self.distances(lat, lon)
+        k = min(k, len(dist))
+        idx = np.argpartition(dist, k - 1)[:k]
+        idx = idx[np.argsort(dist[idx], kind='stable')]
+        return [(float(dist[i]), self.stations[i]) for i in idx]
+
+    def nearest(self, lat, lon, k=10):
+        """
+        Renvoie les k stations les plus proches : liste de (distance_m, station)
+        triée par distance croissante.
+        """
+        if not self.stations or k <= 0:
+            return []
+
+        x, y = self._project(lat, lon)
+        cx, cy = self._cell(x, y)
+        max_ring = self._max_ring(cx, cy)
+        if not self._in_bounds(cx, cy) or max_ring > MAX_RING_SEARCH:
+            return self._nearest_vectorized(lat, lon, k)
+
+        found = []  # (distance projetée au carré, index)
+        r = 0
+        while r <= max_ring:
+            for cell in self._ring(cx, cy, r):
+                for i in self.cells.get(cell, ()):
+                    px, py = self._points[i]
+                    found.append(((px - x) ** 2 + (py - y) ** 2, i))
+            # Toute station hors des anneaux déjà parcourus est à plus de r * cell_size
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= (r * self.cell_size) ** 2:
+                    break
+            r += 1
+
+        found.sort()
+        return self._collect(lat, lon, [i for _, i in found[:k]])
+
+    def within(self, lat, lon, radius):
+        """
+        Renvoie les stations à moins de `radius` mètres : liste de
+        (distance_m, station) triée par distance croissante.
+        """
+        if not self.stations or radius < 0:
+            return []
+
+        x, y = self._project(lat, lon)
+        # Marge d'une cellule pour absorber l'approximation de la projection
+        span = int(math.ceil(radius / self.cell_size)) + 1
+        cx, cy = self._cell(x, y)
+
+        # Fenêtre de cellules bornée à la grille
+        min_x, max_x, min_y, max_y = self._bounds
+        x_range = range(max(cx - span, min_x), min(cx + span, max_x) + 1)
+        y_range = range(max(cy - span, min_y), min(cy + span, max_y) + 1)
+        if len(x_range) * len(y_range) > len(self.cells):
+            # Fenêtre plus large que la grille occupée : calcul vectorisé direct
+            dist = self.distances(lat, lon)
+            idx = np.nonzero(dist <= radius)[0]
+            idx = idx[np.argsort(dist[idx], kind='stable')]
+            return [(float(dist[i]), self.stations[i]) for i in idx]
+
+        indices = []
+        for gx in x_range:
+            for gy in y_range:
+                indices.extend(self.cells.get((gx, gy), ()))
+        return [(d, s) for d, s in self._collect(lat, lon, indices) if d <= radius]
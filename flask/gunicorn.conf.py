@@ -0,0 +1,55 @@
+"""
+Configuration gunicorn (SERVER_MODE=gunicorn) : gunicorn -c gunicorn.conf.py app:app
+
+L'application est importée une seule fois dans le processus maître (preload_app) :
+modèles, snapshot des stations et grille de prévisions y sont chargés avant le fork
+et partagés par les workers en copy-on-write. Chaque worker recrée ensuite ses
+connexions MongoDB et démarre ses propres threads de fond.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# Workers multi-threadés : les routes passent l'essentiel de leur temps à attendre
+# MongoDB (GIL relâché), les threads absorbent la concurrence à moindre coût mémoire
+worker_class = "gthread"
+workers = int(os.getenv("GUNICORN_WORKERS", min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+keepalive = 5
+
+preload_app = True
+
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # Métriques multi-processus : repartir d'un répertoire vide (fichiers d'anciens workers)
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        os.makedirs(multiproc_dir, exist_ok=True)
+        for name in os.listdir(multiproc_dir):
+            os.remove(os.path.join(multiproc_dir, name))
+
+
+def when_ready(server):
+    # Maître, après le chargement de l'application et avant le fork des workers
+    from app import warm_caches
+    warm_caches()
+
+
+def post_fork(server, worker):
+    # Un MongoClient hérité du maître ne doit pas être réutilisé après un fork,
+    # et les threads du maître ne survivent pas au fork
+    from app import connect_databases, start_background_tasks
+    connect_databases()
+    start_background_tasks()
+
+
+def child_exit(server, worker):
+    # Les jauges du worker arrêté ne doivent plus être agrégées par /metrics
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,77 @@
+"""
+Métriques Prometheus de l'application, exposées sur /metrics :
+
+- velib_http_request_duration_seconds : latence par route Flask (règle d'URL, pas le chemin brut)
+- velib_mongo_command_duration_seconds : durée des commandes MongoDB, par collection et
+  par nom de pipeline (option `comment` passée aux aggregate)
+- velib_model_inference_seconds : temps de predict des modèles (grille de prévisions)
+
+Sous gunicorn / uvicorn multi-processus, définir PROMETHEUS_MULTIPROC_DIR (répertoire
+vide au démarrage) pour agréger les workers ; sinon chaque processus expose ses
+propres valeurs.
+"""
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest
+from prometheus_client import multiprocess
+from pymongo import monitoring
+
+# Bornes en secondes : de la lecture en mémoire (~1 ms) au pipeline lent (10 s)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_LATENCY = Histogram(
+    'velib_http_request_duration_seconds', "Durée des requêtes HTTP par route",
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    'velib_mongo_command_duration_seconds', "Durée des commandes MongoDB",
+    ['command', 'collection', 'pipeline', 'outcome'], buckets=LATENCY_BUCKETS
+)
+MODEL_INFERENCE_LATENCY = Histogram(
+    'velib_model_inference_seconds', "Durée du predict des modèles",
+    ['model'], buckets=LATENCY_BUCKETS
+)
+
+
+class MongoMetricsListener(monitoring.CommandListener):
+    """
+    Chronomètre chaque commande MongoDB (durée mesurée par le driver). Les événements
+    de fin ne portent pas la commande : collection et pipeline sont retenus au début,
+    par (connexion, request_id).
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        command = event.command
+        # find / aggregate / insert... : le nom de la collection est la valeur du 1er champ ;
+        # getMore : champ "collection"
+        collection = command.get('collection') if event.command_name == 'getMore' else command.get(event.command_name)
+        comment = command.get('comment')
+        self._pending[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else "",
+            comment if isinstance(comment, str) else ""
+        )
+
+    def _observe(self, event, outcome):
+        collection, pipeline = self._pending.pop((event.connection_id, event.request_id), ("", ""))
+        MONGO_COMMAND_LATENCY.labels(event.command_name, collection, pipeline, outcome).observe(
+            event.duration_micros / 1e6
+        )
+
+    def succeeded(self, event):
+        self._observe(event, "ok")
+
+    def failed(self, event):
+        self._observe(event, "error")
+
+
+def render_metrics():
+    """(corps, content-type) de /metrics, agrégé sur tous les workers en mode multi-processus."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
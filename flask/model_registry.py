@@ -0,0 +1,85 @@
+import json
+import os
+import time
+
+from background import start_once
+
+# Manifeste écrit (atomiquement) par le trainer après chaque modèle :
+# {"models": {"<nom>": {"file": "...", "version": "...", "trained_at": "..."}}}
+MANIFEST_PATH = "/models/manifest.json"
+
+
+class ModelRegistry:
+    """
+    Modèle chargé en mémoire et rechargé à chaud quand le trainer en publie un nouveau.
+
+    Le fichier chargé est celui indiqué par le manifeste du trainer, sinon le premier
+    existant parmi `paths` (ex. artefact natif puis ancien pickle) ; sa version vient
+    du manifeste, ou à défaut de (mtime, taille) du fichier.
+    Un thread de fond vérifie la version toutes les `interval` secondes, charge le
+    nouveau modèle hors de tout verrou puis remplace `current` d'une seule affectation :
+    les requêtes lisent `current` sans jamais attendre un chargement, et un modèle
+    illisible laisse l'ancien en service (nouvel essai au tour suivant).
+    """
+
+    def __init__(self, name, paths, loader, interval=30, manifest_path=MANIFEST_PATH):
+        self.name = name
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.path = self.paths[0]
+        self.loader = loader
+        self.interval = interval
+        self.manifest_path = manifest_path
+        self.current = (None, None)  # (modèle, version)
+
+    @property
+    def model(self):
+        return self.current[0]
+
+    @property
+    def version(self):
+        return self.current[1]
+
+    def published(self):
+        """(fichier, version) du modèle publié, ou (None, None) si aucun fichier n'existe."""
+        try:
+            with open(self.manifest_path) as f:
+                entry = json.load(f).get("models", {}).get(self.name)
+            if entry and entry.get("version") and entry.get("file"):
+                path = os.path.join(os.path.dirname(self.manifest_path), entry["file"])
+                if os.path.exists(path):
+                    return path, str(entry["version"])
+        except (OSError, ValueError):
+            pass
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            return path, f"{st.st_mtime_ns}-{st.st_size}"
+        return None, None
+
+    def reload(self):
+        """Charge le modèle si sa version a changé. Renvoie True si un nouveau modèle est en service."""
+        path, version = self.published()
+        if version is None or version == self.version:
+            return False
+        try:
+            model = self.loader(path)
+        except Exception as e:
+            print(f"Erreur chargement modèle {self.name} ({version}): {e}")
+            return False
+        self.path = path
+        self.current = (model, version)
+        print(f"Modèle {self.name} chargé depuis {path} (version {version})")
+        return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Erreur surveillance modèle {self.name}: {e}")
+
+    def start(self):
+        start_once(f"model-registry-{self.name}", self._watch)
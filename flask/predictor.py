@@ -0,0 +1,49 @@
+import json
+import os
+
+import numpy as np
+
+# Artefacts publiés par le trainer pour chaque modèle :
+#   <nom>.ubj        booster XGBoost au format natif (UBJSON)
+#   <nom>.meta.json  {"features": [...], "n_trees": ..., "trained_at": ...}
+#   <nom>.pkl        ancien format (wrapper scikit-learn picklé), gardé en repli
+
+
+def meta_path(path):
+    """velib_model.ubj -> velib_model.meta.json"""
+    return os.path.splitext(path)[0] + ".meta.json"
+
+
+class BoosterPredictor:
+    """
+    Booster XGBoost natif : prédiction directe sur un tableau NumPy (inplace_predict),
+    sans pandas, scikit-learn ni désérialisation pickle.
+    """
+
+    def __init__(self, booster, features):
+        self.booster = booster
+        self.features = features
+
+    def predict(self, X):
+        if isinstance(X, np.ndarray):
+            X = np.ascontiguousarray(X, dtype=np.float32)
+            if X.shape[1] != len(self.features):
+                raise ValueError(f"{X.shape[1]} colonnes reçues, {len(self.features)} attendues ({self.features})")
+        return self.booster.inplace_predict(X)
+
+
+def load_predictor(path):
+    """
+    Charge un modèle publié par le trainer : artefact natif (.ubj/.json + métadonnées)
+    ou, pour un .pkl, le wrapper scikit-learn via joblib (imports faits à la demande).
+    """
+    if path.endswith(".pkl"):
+        import joblib
+        return joblib.load(path)
+
+    import xgboost as xgb
+    with open(meta_path(path)) as f:
+        meta = json.load(f)
+    booster = xgb.Booster()
+    booster.load_model(path)
+    return BoosterPredictor(booster, meta["features"])
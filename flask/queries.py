@@ -0,0 +1,303 @@
+"""
+Requêtes MongoDB et mises en forme partagées entre l'application Flask (pymongo,
+app.py) et la variante asynchrone (motor, asgi_app.py) : mêmes filtres, mêmes
+pipelines, mêmes réponses ; seul le driver change.
+"""
+import base64
+import json
+import math
+from datetime import datetime, timezone
+
+# Champs de station_latest renvoyés au frontend
+LATEST_PROJECTION = {
+    "_id": 0, "station_id": 1, "name": 1, "lat": 1, "lon": 1, "capacity": 1,
+    "num_bikes_available": 1, "num_docks_available": 1, "scrape_timestamp": 1
+}
+
+# Dernier cycle du scraper : station_latest trié sur son index scrape_timestamp
+LATEST_TIMESTAMP_PROJECTION = {"_id": 0, "scrape_timestamp": 1}
+LATEST_TIMESTAMP_SORT = [("scrape_timestamp", -1)]
+
+# Marqueur de fin de cycle écrit par le scraper après les deux flux (scraper_state)
+CYCLE_MARKER_COLLECTION = "scraper_state"
+CYCLE_MARKER_ID = "velib_cycle"
+
+# Index partiel des keyframes de l'historique des statuts (ingestion delta du scraper)
+KEYFRAME_INDEX_KEYS = [("keyframe", 1), ("scrape_timestamp", -1)]
+KEYFRAME_INDEX_OPTIONS = {"name": "keyframes", "partialFilterExpression": {"keyframe": True}}
+
+# Rayon maximal de /api/nearby_stations (mètres) : toute l'Île-de-France
+MAX_NEARBY_RADIUS = 50000
+
+# Tri de /velib_list/ : clé d'URL -> champ de station_latest (station_id départage les égalités)
+STATION_LIST_SORTS = {
+    "name": "name",
+    "capacity": "capacity",
+    "bikes": "num_bikes_available",
+    "docks": "num_docks_available",
+}
+STATION_LIST_PAGE_SIZE = 50
+STATION_LIST_MAX_PAGE_SIZE = 200
+
+EMPTY_SHARD_STATS = {"labels": [], "counts": [], "sizes": [], "total_count": 0, "total_size": 0, "avg_obj_size": 0}
+
+
+def total_capacity(stations):
+    """Capacité totale (vélos + places du dernier statut) d'une liste de stations."""
+    return sum(
+        (st.get('num_bikes_available') or 0) + (st.get('num_docks_available') or 0)
+        for st in stations
+    )
+
+
+def hourly_stats_pipeline(station_ids):
+    # (au plus 200 stations × 7 jours × 24 heures petits documents)
+    return [
+        # 1. Filtrer sur les stations visibles (index station_id, day_of_week, hour)
+        {
+            "$match": {
+                "station_id": {"$in": station_ids}
+            }
+        },
+        # 2. Sommer les compteurs par heure (tous jours confondus)
+        {
+            "$group": {
+                "_id": "$hour",
+                "count": {"$sum": "$count"},
+                "sum_bikes": {"$sum": "$sum_bikes"}
+            }
+        },
+        # 3. Moyenne pondérée = somme des vélos / nombre de relevés
+        {
+            "$project": {
+                "avg_bikes": {
+                    "$cond": [{"$gt": ["$count", 0]}, {"$divide": ["$sum_bikes", "$count"]}, None]
+                }
+            }
+        },
+        # 4. Trier par heure (0h -> 23h)
+        {
+            "$sort": {"_id": 1}
+        }
+    ]
+
+
+def format_hourly_stats(stats):
+    # Formater pour le frontend : tableau de 24 valeurs (une par heure)
+    # On met None si pas de données pour ne pas fausser la moyenne
+    hourly_data = [None] * 24
+    for s in stats:
+        hour = s['_id']
+        avg = s.get('avg_bikes')
+
+        if hour is not None and 0 <= hour < 24:
+            hourly_data[hour] = round(avg, 1) if avg is not None else None
+    return hourly_data
+
+
+def format_shard_stats(stats):
+    """Résultat de collStats -> données des graphiques de /monitoring/."""
+    shards_data = stats.get('shards', {})
+    labels = []
+    counts = []
+    sizes = []
+    for shard_name, shard_info in shards_data.items():
+        labels.append(shard_name)
+        counts.append(shard_info.get('count', 0))
+        sizes.append(round(shard_info.get('size', 0) / 1024, 2))
+    return {
+        "labels": labels, "counts": counts, "sizes": sizes,
+        "total_count": stats.get('count', 0),
+        "total_size": round(stats.get('size', 0) / 1024, 2),
+        "avg_obj_size": stats.get('avgObjSize', 0)
+    }
+
+
+def describe_last_update(last_update):
+    """(date lisible, "il y a N min") du dernier cycle du scraper."""
+    if not last_update:
+        return "Aucune donnée", "Jamais"
+    if last_update.tzinfo is None:
+        last_update = last_update.replace(tzinfo=timezone.utc)
+
+    delta = datetime.now(timezone.utc) - last_update
+    minutes = int(delta.total_seconds() / 60)
+    return last_update.strftime("%Y-%m-%d %H:%M:%S UTC"), f"il y a {minutes} min"
+
+
+def window_start_lookups(ts, status_delta, station_ids=None):
+    """
+    Recherches (filtre, projection, tri) du début de la fenêtre de reconstruction pour
+    `ts`, par ordre de préférence ; la première qui trouve un document l'emporte :
+    - en ingestion delta, le dernier keyframe <= ts (index partiel "keyframes") ;
+    - sinon, ou sans keyframe, le dernier cycle <= ts (index scrape_timestamp).
+    Hors mode delta il n'existe aucun keyframe : la recherche n'est pas lancée.
+    Avec `station_ids`, le filtre porte aussi sur station_id (préfixe de la clé de
+    sharding de status) : comme l'agrégation qui suit, la recherche ne cible que les
+    shards de ces stations au lieu d'interroger tout le cluster.
+    """
+    base = {"scrape_timestamp": {"$lte": ts}}
+    if station_ids:
+        base["station_id"] = {"$in": station_ids}
+    last_cycle = (base, LATEST_TIMESTAMP_PROJECTION, LATEST_TIMESTAMP_SORT)
+    if not status_delta:
+        return [last_cycle]
+    keyframe = (dict(base, keyframe=True), LATEST_TIMESTAMP_PROJECTION, LATEST_TIMESTAMP_SORT)
+    return [keyframe, last_cycle]
+
+
+def pick_window_start(docs):
+    """scrape_timestamp du premier résultat trouvé (même ordre que window_start_lookups), sinon None."""
+    for doc in docs:
+        if doc:
+            return doc['scrape_timestamp']
+    return None
+
+
+def availability_pipeline(start, ts, station_ids=None):
+    """Dernier statut de chaque station entre `start` (keyframe ou cycle) et `ts`."""
+    match = {"scrape_timestamp": {"$gte": start, "$lte": ts}}
+    if station_ids:
+        match["station_id"] = {"$in": station_ids}
+    return [
+        {"$match": match},
+        {"$sort": {"scrape_timestamp": -1}},
+        {"$group": {
+            "_id": "$station_id",
+            "bikes": {"$first": "$num_bikes_available"},
+            "docks": {"$first": "$num_docks_available"},
+            "as_of": {"$first": "$scrape_timestamp"}
+        }}
+    ]
+
+
+def format_availability(availability):
+    return [
+        {"station_id": sid, "bikes": a['bikes'], "docks": a['docks'],
+         "as_of": a['as_of'].strftime("%Y-%m-%d %H:%M:%S")}
+        for sid, a in availability.items()
+    ]
+
+
+def geo_near_pipeline(lat, lon, k, radius=None):
+    """$geoNear sur l'index 2dsphere de station_latest.location."""
+    geo_near = {
+        "near": {"type": "Point", "coordinates": [lon, lat]},
+        "distanceField": "distance",
+        "key": "location",
+        "spherical": True
+    }
+    if radius is not None:
+        geo_near["maxDistance"] = radius
+    return [
+        {"$geoNear": geo_near},
+        {"$limit": k},
+        {"$project": {
+            "_id": 0, "distance": 1, "station_id": 1, "name": 1, "lat": 1, "lon": 1,
+            "bikes": "$num_bikes_available",
+            "docks": "$num_docks_available"
+        }}
+    ]
+
+
+def parse_availability_params(params):
+    """
+    ?ts=ISO (UTC si sans fuseau) & station_ids=1,2,3 -> (ts UTC naïf, ids ou None).
+    Lève KeyError / ValueError si un paramètre est absent ou invalide.
+    """
+    ts = datetime.fromisoformat(params['ts'].replace('Z', '+00:00'))
+    if ts.tzinfo:
+        # Les scrape_timestamp sont stockés en UTC naïf
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    ids_param = params.get('station_ids')
+    station_ids = [int(x) for x in ids_param.split(',')] if ids_param else None
+    return ts, station_ids
+
+
+def parse_nearby_params(params, default_k):
+    """
+    ?lat=&lon=&k=&radius= -> (lat, lon, k entre 1 et 100, radius en mètres ou None).
+    Lève KeyError / ValueError si un paramètre est absent ou invalide.
+    """
+    lat = float(params['lat'])
+    lon = float(params['lon'])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"coordonnées hors limites ({lat}, {lon})")
+    k = min(max(int(params.get('k', default_k)), 1), 100)
+    radius = params.get('radius')
+    if radius is None:
+        return lat, lon, k, None
+    radius = float(radius)
+    if not 0 <= radius <= MAX_NEARBY_RADIUS:
+        raise ValueError(f"rayon hors limites ({radius} m, max {MAX_NEARBY_RADIUS})")
+    return lat, lon, k, radius
+
+
+def encode_list_cursor(value, station_id):
+    """Curseur opaque de /velib_list/ : (valeur du champ trié, station_id) de la dernière ligne."""
+    return base64.urlsafe_b64encode(json.dumps([value, station_id]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_list_cursor(cursor):
+    """
+    (valeur, station_id) d'un curseur de encode_list_cursor. Lève ValueError si le
+    curseur est illisible ou forgé : valeur autre que texte, nombre fini ou null,
+    station_id non entier (ces valeurs finissent telles quelles dans le filtre Mongo).
+    """
+    try:
+        value, station_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (TypeError, ValueError):
+        raise ValueError(f"curseur invalide '{cursor}'")
+    valid_value = value is None or isinstance(value, str) or (
+        isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value))
+    valid_id = isinstance(station_id, int) and not isinstance(station_id, bool)
+    if not (valid_value and valid_id):
+        raise ValueError(f"curseur invalide '{cursor}'")
+    return value, station_id
+
+
+def parse_station_list_params(params):
+    """
+    ?sort=name|capacity|bikes|docks & order=asc|desc & size=N & after=<curseur>
+    -> (clé de tri, décroissant, taille de page plafonnée, (valeur, station_id) ou None).
+    Lève ValueError si un paramètre est invalide.
+    """
+    sort = params.get('sort', 'name')
+    if sort not in STATION_LIST_SORTS:
+        raise ValueError(f"tri inconnu '{sort}'")
+    order = params.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError(f"ordre inconnu '{order}'")
+    size = min(max(int(params.get('size', STATION_LIST_PAGE_SIZE)), 1), STATION_LIST_MAX_PAGE_SIZE)
+    after = params.get('after')
+    return sort, order == 'desc', size, decode_list_cursor(after) if after else None
+
+
+def station_list_query(field, descending, after=None):
+    """
+    (filtre, tri) d'une page de station_latest en pagination par clé (keyset) : tri sur
+    (field, station_id) et reprise strictement après la dernière ligne de la page précédente.
+    Coût constant quelle que soit la page (pas de skip), et aucune ligne sautée ni répétée
+    si des stations changent entre deux pages.
+    Les valeurs absentes (null) sont en tête en ordre croissant, en fin en décroissant ;
+    une comparaison $gt / $lt ne les inclut jamais, d'où les branches explicites.
+    """
+    direction = -1 if descending else 1
+    sort = [(field, direction), ("station_id", direction)]
+    if after is None:
+        return {}, sort
+
+    value, station_id = after
+    after_id = {"$lt" if descending else "$gt": station_id}
+    if value is None:
+        if descending:
+            return {field: None, "station_id": after_id}, sort
+        return {"$or": [{field: None, "station_id": after_id}, {field: {"$ne": None}}]}, sort
+
+    branches = [
+        {field: {"$lt" if descending else "$gt": value}},
+        {field: value, "station_id": after_id},
+    ]
+    if descending:
+        branches.append({field: None})
+    return {"$or": branches}, sort
@@ -0,0 +1,148 @@
+"""
+Journal des requêtes lentes (mode diagnostic, SLOW_QUERY_MS > 0), affiché sur /monitoring/slow.
+
+Chaque find / aggregate plus long que le seuil est rejoué en explain("executionStats")
+par un thread de fond : documents et clés examinés contre documents renvoyés, étapes
+du plan (IXSCAN + index, ou COLLSCAN), shards interrogés. Les N dernières captures
+sont gardées dans un buffer circulaire, par processus.
+La durée mesurée est celle de la commande initiale (premier lot du curseur) ; l'explain
+ré-exécute la requête, d'où un mode réservé au diagnostic.
+"""
+import collections
+import queue
+from datetime import datetime, timezone
+
+from bson import json_util
+from pymongo import monitoring
+
+from background import start_once
+
+EXPLAINABLE_COMMANDS = ("find", "aggregate", "count", "distinct")
+# Champs de session ajoutés par le driver ($db, $clusterTime, lsid...) : hors explain
+SESSION_FIELDS = ("lsid", "txnNumber", "autocommit", "startTransaction")
+MAX_QUERY_CHARS = 4000
+
+
+def explainable_command(command):
+    """Commande telle qu'envoyée par l'application, sans les champs de session du driver."""
+    return {k: v for k, v in command.items() if not k.startswith('$') and k not in SESSION_FIELDS}
+
+
+def summarize_explain(explain):
+    """
+    Résumé d'un explain("executionStats"), collection shardée ou non, find ou aggregate :
+    totaux de chaque bloc executionStats (un par shard ou par $cursor), étapes et index
+    du plan retenu (plans rejetés ignorés), noms des shards.
+    """
+    summary = {"docs_examined": 0, "keys_examined": 0, "returned": 0}
+    stages, indexes, shards = set(), set(), set()
+
+    def walk(node, counted):
+        if isinstance(node, list):
+            for item in node:
+                walk(item, counted)
+            return
+        if not isinstance(node, dict):
+            return
+        if isinstance(node.get('stage'), str):
+            stages.add(node['stage'])
+            if node.get('indexName'):
+                indexes.add(node['indexName'])
+        if isinstance(node.get('shardName'), str):
+            shards.add(node['shardName'])
+        for key, value in node.items():
+            if key == 'rejectedPlans':
+                continue
+            if key == 'executionStats' and isinstance(value, dict) and not counted:
+                # Totaux du bloc ; les détails par shard qu'il contient ne sont pas recomptés
+                summary["docs_examined"] += value.get('totalDocsExamined', 0)
+                summary["keys_examined"] += value.get('totalKeysExamined', 0)
+                summary["returned"] += value.get('nReturned', 0)
+                walk(value, True)
+                continue
+            if key == 'shards' and isinstance(value, dict):
+                shards.update(value)
+            walk(value, counted)
+
+    walk(explain, False)
+    summary.update(
+        stages=sorted(stages),
+        indexes=sorted(indexes),
+        shards=sorted(shards),
+        collscan="COLLSCAN" in stages
+    )
+    return summary
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """
+    CommandListener pymongo : retient les commandes lisibles (find, aggregate...) au
+    début, garde celles qui dépassent `threshold_ms` et confie leur explain à un thread
+    de fond (file bornée : si elle est pleine, la capture est perdue plutôt que de
+    ralentir la requête). `client` est le MongoClient pymongo utilisé pour l'explain.
+    """
+
+    def __init__(self, threshold_ms, size=50):
+        self.threshold_ms = threshold_ms
+        self.entries = collections.deque(maxlen=size)
+        self.client = None
+        self._pending = {}
+        self._queue = queue.Queue(maxsize=size)
+
+    @property
+    def enabled(self):
+        return self.threshold_ms > 0
+
+    def started(self, event):
+        if self.enabled and event.command_name in EXPLAINABLE_COMMANDS:
+            self._pending[(event.connection_id, event.request_id)] = (
+                event.database_name, explainable_command(event.command)
+            )
+
+    def succeeded(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if pending is None or duration_ms < self.threshold_ms:
+            return
+        database, command = pending
+        try:
+            self._queue.put_nowait((datetime.now(timezone.utc), database, event.command_name, command, duration_ms))
+        except queue.Full:
+            pass
+
+    def failed(self, event):
+        self._pending.pop((event.connection_id, event.request_id), None)
+
+    def record(self, at, database, command_name, command, duration_ms):
+        """Explain de la commande puis ajout en tête du buffer."""
+        collection = command.get(command_name)
+        query = command.get('pipeline') if command_name == 'aggregate' else command.get('filter', command.get('query', {}))
+        entry = {
+            "at": at,
+            "name": command.get('comment') or f"{command_name} {collection}",
+            "command": command_name,
+            "collection": collection,
+            "duration_ms": round(duration_ms, 1),
+            "query": json_util.dumps(query, indent=1)[:MAX_QUERY_CHARS],
+            "plan": None,
+            "error": None
+        }
+        try:
+            explain = self.client[database].command("explain", command, verbosity="executionStats")
+            entry["plan"] = summarize_explain(explain)
+        except Exception as e:
+            entry["error"] = str(e)
+        self.entries.appendleft(entry)
+
+    def _explain_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self.record(*item)
+            except Exception as e:
+                print(f"Erreur capture requête lente: {e}")
+
+    def start(self):
+        """Démarre le thread d'explain si le mode est actif."""
+        if self.enabled:
+            start_once("slow-query-explain", self._explain_loop)
@@ -41,6 +41,60 @@ sh.enableSharding("velib")
 sh.shardCollection("velib.stations", { station_id: "hashed" })
 EOF
 
+# 5. Sharding de l'historique des statuts (la collection qui grossit)
+# Clé composée { station_id, scrape_timestamp } : une requête sur une seule station est
+# routée vers le shard qui porte ses chunks ; une liste $in de stations (/api/hourly_stats,
+# /api/availability_at) vise les shards de ces stations, donc souvent les deux.
+# Les écritures d'un cycle se répartissent sur les deux shards.
+# Deux zones découpent l'espace des station_id en STATUS_ZONE_SPLIT. Sans valeur fournie,
+# la coupure est la médiane des station_id déjà connus (velib.stations, sinon
+# velib.station_latest) ; sans données (premier démarrage), aucune zone n'est créée et
+# le balancer répartit les chunks lui-même.
+STATUS_LAYOUT=${STATUS_LAYOUT:-documents}
+STATUS_ZONE_SPLIT=${STATUS_ZONE_SPLIT:-}
+if [ "$STATUS_LAYOUT" = "timeseries" ]; then
+    STATUS_NS="velib.status_ts"
+    STATUS_OPTIONS='{ timeseries: { timeField: "scrape_timestamp", metaField: "station_id", granularity: "minutes" } }'
+else
+    STATUS_NS="velib.status"
+    STATUS_OPTIONS='{}'
+fi
+echo "🧩 Sharding de $STATUS_NS..."
+mongosh --host mongos --port 27017 <<EOF
+const ns = "$STATUS_NS";
+const [dbName, collName] = ns.split(".");
+if ("$STATUS_LAYOUT" !== "timeseries") {
+    db.getSiblingDB(dbName)[collName].createIndex({ station_id: 1, scrape_timestamp: 1 });
+}
+sh.shardCollection(ns, { station_id: 1, scrape_timestamp: 1 }, false, $STATUS_OPTIONS);
+
+function medianStationId() {
+    for (const source of ["stations", "station_latest"]) {
+        const ids = db.getSiblingDB(dbName)[source].distinct("station_id")
+            .map(Number).filter(Number.isFinite).sort((a, b) => a - b);
+        if (ids.length) {
+            return ids[Math.floor(ids.length / 2)];
+        }
+    }
+    return null;
+}
+
+const split = "$STATUS_ZONE_SPLIT" ? Number("$STATUS_ZONE_SPLIT") : medianStationId();
+if (split === null) {
+    print("Aucune station connue : pas de zones, répartition des chunks par le balancer.");
+} else {
+    print("Zones découpées à station_id=" + split);
+    sh.addShardToZone("rsShard1", "statusLow");
+    sh.addShardToZone("rsShard2", "statusHigh");
+    sh.updateZoneKeyRange(ns,
+        { station_id: MinKey, scrape_timestamp: MinKey },
+        { station_id: split, scrape_timestamp: MinKey }, "statusLow");
+    sh.updateZoneKeyRange(ns,
+        { station_id: split, scrape_timestamp: MinKey },
+        { station_id: MaxKey, scrape_timestamp: MaxKey }, "statusHigh");
+}
+EOF
+
 echo "################################################"
 echo "##          INSTALLATION TERMINÉE             ##"
 echo "################################################"
\ No newline at end of file
@@ -1,9 +1,14 @@
 import requests
 import time
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from pymongo import MongoClient, errors
+from pymongo import MongoClient, UpdateOne, errors
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
 import os
 import sys
+import threading
 
 # -------------------------------
 # CONFIGURATION
@@ -19,11 +24,71 @@ DB_NAME = "velib"
 
 # CORRECTION 2 : Alignement avec la collection shardée
 COLLECTION_INFO = "stations"
-COLLECTION_STATUS = "status"
+
+# Stockage de l'historique des statuts :
+# - "documents"  : collection classique 'status' (1 document par station et par cycle)
+# - "timeseries" : collection time-series 'status_ts' (station_id en metaField),
+#                  MongoDB regroupe les mesures par station en buckets compressés
+STATUS_LAYOUT = os.getenv("STATUS_LAYOUT", "documents")
+COLLECTION_STATUS_DOCUMENTS = "status"
+COLLECTION_STATUS_TIMESERIES = "status_ts"
+COLLECTION_STATUS = COLLECTION_STATUS_TIMESERIES if STATUS_LAYOUT == "timeseries" else COLLECTION_STATUS_DOCUMENTS
+MIGRATION_BATCH_SIZE = 10000
+# Vue matérialisée : 1 document par station (infos statiques + dernier statut)
+COLLECTION_LATEST = "station_latest"
+
+# Agrégat incrémental : station × jour de semaine × heure (count, sommes vélos/places)
+COLLECTION_HOURLY = "status_hourly"
+
+# Marqueur de fin de cycle (écrit une fois les deux flux enregistrés) : les lecteurs
+# de station_latest (cache de la carte) ne voient jamais un cycle à moitié écrit
+COLLECTION_STATE = "scraper_state"
+CYCLE_MARKER_ID = "velib_cycle"
+
+# Ingestion différentielle de station_information : seules les stations nouvelles
+# ou modifiées sont écrites (une version par changement). SCRAPER_INFO_DIFF=0 pour
+# réinsérer tout le flux à chaque cycle comme avant.
+INFO_DIFF = os.getenv("SCRAPER_INFO_DIFF", "1") == "1"
+
+# Empreinte des champs statiques par station : {station_id: (info_hash, info_version)}
+# Reconstruit au démarrage depuis station_latest.
+info_hashes = {}
+
+# Ingestion delta du statut : seules les stations dont vélos/places ont changé sont
+# écrites, plus un snapshot complet ("keyframe") tous les SCRAPER_KEYFRAME_EVERY cycles.
+STATUS_DELTA = os.getenv("SCRAPER_STATUS_DELTA", "0") == "1"
+KEYFRAME_EVERY = int(os.getenv("SCRAPER_KEYFRAME_EVERY", "24"))
+
+# Derniers compteurs vus par station : {station_id: (vélos, places)}
+# Reconstruit au démarrage depuis station_latest.
+last_status = {}
+status_cycles = 0
+
+# Champs recopiés dans station_latest selon le flux d'origine
+LATEST_FIELDS = {
+    "stations": ["name", "lat", "lon", "capacity", "stationCode", "info_hash", "info_version"],
+    "status": ["num_bikes_available", "num_docks_available",
+               "is_installed", "is_renting", "is_returning"],
+}
 
 UPDATE_INTERVAL = 3600  # 1 heure
 MAX_RETRIES = 5
 
+# Mode concurrent : les deux flux sont téléchargés en parallèle (session keep-alive partagée)
+# et chaque écriture Mongo démarre dès que son flux est arrivé. SCRAPER_CONCURRENT=0 pour le mode séquentiel.
+CONCURRENT_FETCH = os.getenv("SCRAPER_CONCURRENT", "1") == "1"
+
+# Métriques Prometheus servies sur http://<scraper>:SCRAPER_METRICS_PORT/metrics (0 = désactivé)
+METRICS_PORT = int(os.getenv("SCRAPER_METRICS_PORT", "8000"))
+CYCLE_DURATION = Histogram(
+    "velib_scraper_cycle_duration_seconds", "Durée d'un cycle du scraper (téléchargement + écritures)",
+    buckets=(0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+)
+DOCUMENTS_WRITTEN = Counter(
+    "velib_scraper_documents_written_total", "Documents insérés ou modifiés par le scraper", ["collection"]
+)
+LAST_CYCLE = Gauge("velib_scraper_last_cycle_timestamp_seconds", "Fin du dernier cycle (timestamp Unix)")
+
 # -------------------------------
 # FONCTIONS
 # -------------------------------
@@ -44,10 +109,23 @@ def connect_mongodb(uri, retries=MAX_RETRIES, wait=5):
     print("✗ ERREUR CRITIQUE : Impossible de joindre le Mongos.")
     return None
 
-def fetch_velib_data(url, data_type):
+# Sessions HTTP du mode concurrent : une par thread du pool (requests.Session n'est
+# pas garantie thread-safe), chacune gardant sa connexion keep-alive d'un cycle à l'autre
+_thread_sessions = threading.local()
+
+def thread_session():
+    session = getattr(_thread_sessions, "session", None)
+    if session is None:
+        session = _thread_sessions.session = requests.Session()
+    return session
+
+def fetch_with_thread_session(url, data_type):
+    return fetch_velib_data(url, data_type, thread_session())
+
+def fetch_velib_data(url, data_type, session=None):
     """Récupère les données depuis l'API Vélib'"""
     try:
-        resp = requests.get(url, timeout=10)
+        resp = (session or requests).get(url, timeout=10)
         resp.raise_for_status()
         data = resp.json()
         # Petite sécurité : vérifie que 'data' existe
@@ -58,14 +136,15 @@ def fetch_velib_data(url, data_type):
         print(f"✗ Erreur API ({data_type}): {e}")
         return None
 
-def save_to_mongodb(db, data, collection_name, data_type):
+def save_to_mongodb(db, data, collection_name, data_type, timestamp=None):
     """Insertion dans MongoDB"""
     if not data or "data" not in data or "stations" not in data["data"]:
         print(f"⚠ Données {data_type} vides ou malformées.")
         return False
 
     collection = db[collection_name]
-    timestamp = datetime.utcnow()
+    # En mode concurrent, les deux flux partagent l'horodatage du cycle
+    timestamp = timestamp or datetime.utcnow()
     stations = data["data"]["stations"]
 
     # Préparation des données
@@ -78,17 +157,412 @@ def save_to_mongodb(db, data, collection_name, data_type):
         if "station_id" not in station and "stationCode" in station:
              station["station_id"] = station["stationCode"]
 
+    if stations and data_type == "stations" and INFO_DIFF:
+        return save_station_info_changes(db, stations, timestamp)
+    if stations and data_type == "status" and STATUS_DELTA:
+        return save_status_changes(db, stations, timestamp)
+
     if stations:
         try:
             # Insert Many est très performant pour du chargement en masse
             result = collection.insert_many(stations)
+            DOCUMENTS_WRITTEN.labels(collection_name).inc(len(result.inserted_ids))
             print(f"💾 DB : {len(result.inserted_ids)} documents insérés dans '{DB_NAME}.{collection_name}'.")
+            update_latest(db, stations, data_type, timestamp)
+            if data_type == "status":
+                update_hourly_rollup(db, stations, timestamp)
             return True
         except errors.PyMongoError as e:
             print(f"✗ Erreur Mongo ({data_type}): {e}")
             return False
     return False
 
+def station_info_hash(station):
+    """Empreinte des champs statiques d'une station (hors champs ajoutés par le scraper)."""
+    static = {k: v for k, v in station.items()
+              if k not in ("_id", "scrape_timestamp", "api_last_updated", "info_hash", "info_version")}
+    return hashlib.sha1(json.dumps(static, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def load_info_hashes(db):
+    """Recharge les empreintes connues depuis station_latest (au démarrage)."""
+    info_hashes.clear()
+    cursor = db[COLLECTION_LATEST].find(
+        {"info_hash": {"$exists": True}}, {"_id": 0, "station_id": 1, "info_hash": 1, "info_version": 1}
+    )
+    for doc in cursor:
+        info_hashes[doc["station_id"]] = (doc["info_hash"], doc.get("info_version", 1))
+    print(f"✓ {len(info_hashes)} empreintes de stations chargées.")
+
+def save_station_info_changes(db, stations, timestamp):
+    """
+    Ingestion différentielle de station_information : on compare l'empreinte
+    des champs statiques à celle du cycle précédent et on n'écrit que les
+    stations nouvelles ou modifiées (une nouvelle version dans 'stations' +
+    mise à jour de station_latest).
+    """
+    changed = []
+    for station in stations:
+        if "station_id" not in station:
+            continue
+        info_hash = station_info_hash(station)
+        previous = info_hashes.get(station["station_id"])
+        if previous and previous[0] == info_hash:
+            continue
+        station["info_hash"] = info_hash
+        station["info_version"] = previous[1] + 1 if previous else 1
+        changed.append(station)
+
+    if not changed:
+        print(f"💾 DB : aucune station modifiée ({len(stations)} vérifiées).")
+        return True
+
+    try:
+        db[COLLECTION_INFO].insert_many(changed)
+        DOCUMENTS_WRITTEN.labels(COLLECTION_INFO).inc(len(changed))
+        print(f"💾 DB : {len(changed)}/{len(stations)} stations nouvelles ou modifiées versionnées dans '{DB_NAME}.{COLLECTION_INFO}'.")
+    except errors.PyMongoError as e:
+        print(f"✗ Erreur Mongo (stations): {e}")
+        return False
+    # Empreintes inchangées si station_latest n'a pas suivi : les stations sont réécrites au cycle suivant
+    if not update_latest(db, changed, "stations", timestamp):
+        return False
+
+    for station in changed:
+        info_hashes[station["station_id"]] = (station["info_hash"], station["info_version"])
+    return True
+
+def load_last_status(db):
+    """Recharge les derniers compteurs connus depuis station_latest (au démarrage)."""
+    last_status.clear()
+    cursor = db[COLLECTION_LATEST].find(
+        {"num_bikes_available": {"$exists": True}},
+        {"_id": 0, "station_id": 1, "num_bikes_available": 1, "num_docks_available": 1}
+    )
+    for doc in cursor:
+        last_status[doc["station_id"]] = (doc.get("num_bikes_available"), doc.get("num_docks_available"))
+    print(f"✓ {len(last_status)} statuts de référence chargés.")
+
+def is_keyframe_cycle(cycle, every=None):
+    """Le cycle n° `cycle` (0 = premier depuis le démarrage) écrit-il un snapshot complet ?"""
+    return cycle % (every or KEYFRAME_EVERY) == 0
+
+def select_status_changes(stations, previous, is_keyframe):
+    """
+    Statuts à insérer : tous en keyframe, sinon ceux dont (vélos, places) diffère de
+    `previous` ({station_id: (vélos, places)}). Marque chaque statut retenu (keyframe).
+    """
+    selected = []
+    for station in stations:
+        if "station_id" not in station:
+            continue
+        counts = (station.get("num_bikes_available"), station.get("num_docks_available"))
+        if is_keyframe or previous.get(station["station_id"]) != counts:
+            station["keyframe"] = is_keyframe
+            selected.append(station)
+    return selected
+
+def save_status_changes(db, stations, timestamp):
+    """
+    Ingestion delta de station_status : seules les stations dont les compteurs
+    ont changé depuis le cycle précédent sont insérées dans 'status'
+    (keyframe=False). Tous les KEYFRAME_EVERY cycles, le snapshot complet est
+    inséré (keyframe=True) pour borner la reconstruction côté lecture.
+    station_latest et l'agrégat horaire reçoivent toujours le snapshot complet.
+    """
+    global status_cycles
+    is_keyframe = is_keyframe_cycle(status_cycles)
+    to_insert = select_status_changes(stations, last_status, is_keyframe)
+
+    try:
+        if to_insert:
+            db[COLLECTION_STATUS].insert_many(to_insert)
+            DOCUMENTS_WRITTEN.labels(COLLECTION_STATUS).inc(len(to_insert))
+        kind = "keyframe" if is_keyframe else "delta"
+        print(f"💾 DB : {len(to_insert)}/{len(stations)} statuts insérés ({kind}) dans '{DB_NAME}.{COLLECTION_STATUS}'.")
+        update_latest(db, stations, "status", timestamp)
+        update_hourly_rollup(db, stations, timestamp)
+    except errors.PyMongoError as e:
+        print(f"✗ Erreur Mongo (status): {e}")
+        return False
+
+    status_cycles += 1
+    for station in stations:
+        if "station_id" in station:
+            last_status[station["station_id"]] = (station.get("num_bikes_available"), station.get("num_docks_available"))
+    return True
+
+def update_latest(db, stations, data_type, timestamp):
+    """
+    Met à jour la collection station_latest (1 document par station_id).
+    Les infos statiques et le statut arrivent par deux flux séparés :
+    chaque flux ne fait un $set que sur ses propres champs.
+    Retourne False si l'écriture a échoué.
+    """
+    fields = LATEST_FIELDS[data_type]
+    ts_field = "info_scrape_timestamp" if data_type == "stations" else "scrape_timestamp"
+
+    operations = []
+    for station in stations:
+        if "station_id" not in station:
+            continue
+        update = {f: station[f] for f in fields if f in station}
+        update[ts_field] = timestamp
+        if data_type == "stations" and station.get("lat") is not None and station.get("lon") is not None:
+            # Point GeoJSON pour l'index 2dsphere ($geoNear)
+            update["location"] = {"type": "Point", "coordinates": [station["lon"], station["lat"]]}
+        if data_type == "status":
+            update["api_last_updated"] = station.get("api_last_updated")
+        operations.append(
+            UpdateOne({"station_id": station["station_id"]}, {"$set": update}, upsert=True)
+        )
+
+    if operations:
+        try:
+            result = db[COLLECTION_LATEST].bulk_write(operations, ordered=False)
+            DOCUMENTS_WRITTEN.labels(COLLECTION_LATEST).inc(result.upserted_count + result.modified_count)
+            print(f"💾 DB : '{COLLECTION_LATEST}' à jour ({result.upserted_count} nouvelles, {result.modified_count} modifiées).")
+        except errors.PyMongoError as e:
+            print(f"✗ Erreur Mongo ({COLLECTION_LATEST}): {e}")
+            return False
+    return True
+
+def update_hourly_rollup(db, stations, timestamp):
+    """
+    Incrémente l'agrégat horaire (station × jour de semaine × heure UTC) avec
+    le statut du cycle : l'API /api/hourly_stats n'a plus qu'à lire ces compteurs.
+    """
+    day_of_week = timestamp.weekday()  # 0 = lundi, comme pandas dt.dayofweek
+    hour = timestamp.hour
+
+    operations = []
+    for station in stations:
+        bikes = station.get("num_bikes_available")
+        docks = station.get("num_docks_available")
+        if "station_id" not in station or bikes is None or docks is None:
+            continue
+        operations.append(
+            UpdateOne(
+                {"station_id": station["station_id"], "day_of_week": day_of_week, "hour": hour},
+                {"$inc": {"count": 1, "sum_bikes": bikes, "sum_docks": docks}},
+                upsert=True
+            )
+        )
+
+    if operations:
+        try:
+            result = db[COLLECTION_HOURLY].bulk_write(operations, ordered=False)
+            DOCUMENTS_WRITTEN.labels(COLLECTION_HOURLY).inc(result.upserted_count + result.modified_count)
+            print(f"💾 DB : '{COLLECTION_HOURLY}' incrémenté ({len(operations)} stations, {day_of_week}/{hour}h).")
+        except errors.PyMongoError as e:
+            print(f"✗ Erreur Mongo ({COLLECTION_HOURLY}): {e}")
+
+def rebuild_hourly_rollup(db):
+    """
+    Recalcule entièrement status_hourly depuis l'historique de status.
+    A lancer scraper arrêté (les incréments faits pendant le calcul seraient perdus).
+    Suppose un snapshot complet par cycle : avec SCRAPER_STATUS_DELTA=1, seules
+    les stations modifiées sont dans status et l'agrégat serait biaisé.
+    """
+    print(f"⚙️  Reconstruction de '{COLLECTION_HOURLY}' depuis '{COLLECTION_STATUS}'...")
+    pipeline = [
+        {"$match": {"num_bikes_available": {"$ne": None}, "num_docks_available": {"$ne": None}}},
+        {"$group": {
+            "_id": {
+                "station_id": "$station_id",
+                "day_of_week": {"$subtract": [{"$isoDayOfWeek": "$scrape_timestamp"}, 1]},
+                "hour": {"$hour": "$scrape_timestamp"}
+            },
+            "count": {"$sum": 1},
+            "sum_bikes": {"$sum": "$num_bikes_available"},
+            "sum_docks": {"$sum": "$num_docks_available"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "station_id": "$_id.station_id",
+            "day_of_week": "$_id.day_of_week",
+            "hour": "$_id.hour",
+            "count": 1, "sum_bikes": 1, "sum_docks": 1
+        }},
+        {"$out": COLLECTION_HOURLY}
+    ]
+    try:
+        db[COLLECTION_STATUS].aggregate(pipeline, allowDiskUse=True)
+        print(f"✓ '{COLLECTION_HOURLY}' : {db[COLLECTION_HOURLY].estimated_document_count()} documents.")
+    except errors.PyMongoError as e:
+        print(f"✗ Erreur Mongo (rebuild {COLLECTION_HOURLY}): {e}")
+
+def bootstrap_hourly_rollup(db):
+    """Crée les index de status_hourly et le remplit depuis l'historique s'il est vide."""
+    db[COLLECTION_HOURLY].create_index(
+        [("station_id", 1), ("day_of_week", 1), ("hour", 1)], unique=True
+    )
+    if db[COLLECTION_HOURLY].estimated_document_count() == 0 \
+            and db[COLLECTION_STATUS].estimated_document_count() > 0:
+        rebuild_hourly_rollup(db)
+
+def ensure_timeseries_collection(db):
+    """
+    Crée la collection time-series des statuts si elle n'existe pas encore
+    (mongo-setup peut l'avoir créée) et s'assure de ses index dans tous les cas.
+    """
+    if COLLECTION_STATUS_TIMESERIES not in db.list_collection_names():
+        db.create_collection(
+            COLLECTION_STATUS_TIMESERIES,
+            timeseries={"timeField": "scrape_timestamp", "metaField": "station_id", "granularity": "minutes"}
+        )
+        print(f"✓ Collection time-series '{COLLECTION_STATUS_TIMESERIES}' créée.")
+    # create_index est idempotent
+    db[COLLECTION_STATUS_TIMESERIES].create_index([("station_id", 1), ("scrape_timestamp", -1)])
+    db[COLLECTION_STATUS_TIMESERIES].create_index([("scrape_timestamp", -1)])
+
+def migrate_status_to_timeseries(db):
+    """
+    Copie l'historique de 'status' vers la collection time-series 'status_ts',
+    par lots, dans l'ordre de scrape_timestamp. Relancée, elle reprend au dernier
+    horodatage déjà migré en sautant les stations de ce cycle déjà copiées.
+    Retourne False si la migration s'est arrêtée sur une erreur.
+    """
+    ensure_timeseries_collection(db)
+    source = db[COLLECTION_STATUS_DOCUMENTS]
+    target = db[COLLECTION_STATUS_TIMESERIES]
+
+    last = target.find_one({}, {"_id": 0, "scrape_timestamp": 1}, sort=[("scrape_timestamp", -1)])
+    # Insertions ordonnées : après une erreur, seul le dernier cycle migré peut être partiel.
+    # Il est repris en entier (MongoDB 6 ne supprime dans une time-series que par station_id),
+    # en sautant les stations déjà présentes.
+    last_ts = last["scrape_timestamp"] if last else None
+    done = set(target.distinct("station_id", {"scrape_timestamp": last_ts})) if last else set()
+    query = {"scrape_timestamp": {"$gte": last_ts}} if last else {}
+    print(f"⚙️  Migration '{COLLECTION_STATUS_DOCUMENTS}' -> '{COLLECTION_STATUS_TIMESERIES}'"
+          f"{' (reprise à ' + str(last_ts) + ')' if last else ''}...")
+
+    cursor = source.find(query, {"_id": 0}).sort("scrape_timestamp", 1).batch_size(MIGRATION_BATCH_SIZE)
+    batch = []
+    migrated = 0
+    try:
+        for doc in cursor:
+            if doc.get("scrape_timestamp") is None:
+                continue
+            if doc["scrape_timestamp"] == last_ts and doc.get("station_id") in done:
+                continue
+            if len(batch) >= MIGRATION_BATCH_SIZE:
+                target.insert_many(batch, ordered=True)
+                migrated += len(batch)
+                batch = []
+                print(f"   ... {migrated} documents migrés")
+            batch.append(doc)
+        if batch:
+            target.insert_many(batch, ordered=True)
+            migrated += len(batch)
+    except errors.PyMongoError as e:
+        print(f"✗ Erreur Mongo (migration): {e}")
+        print(f"✗ Migration incomplète après {migrated} documents : relancez la commande pour reprendre.")
+        return False
+    print(f"✓ Migration terminée : {migrated} documents copiés.")
+    return True
+
+def bootstrap_latest(db):
+    """
+    Initialise station_latest à partir de l'historique si la collection est vide
+    (premier démarrage après la mise en place de la vue matérialisée).
+    """
+    latest = db[COLLECTION_LATEST]
+    latest.create_index("station_id", unique=True)
+    latest.create_index("scrape_timestamp")
+    latest.create_index([("location", "2dsphere")])
+    if latest.estimated_document_count() > 0:
+        return
+
+    print(f"⚙️  '{COLLECTION_LATEST}' vide : reconstruction depuis l'historique...")
+    for collection_name, data_type, ts_field in [
+        (COLLECTION_INFO, "stations", "info_scrape_timestamp"),
+        (COLLECTION_STATUS, "status", "scrape_timestamp"),
+    ]:
+        group = {"_id": "$station_id", ts_field: {"$first": "$scrape_timestamp"}}
+        for f in LATEST_FIELDS[data_type]:
+            group[f] = {"$first": f"${f}"}
+        if data_type == "status":
+            group["api_last_updated"] = {"$first": "$api_last_updated"}
+        pipeline = [
+            {"$sort": {"scrape_timestamp": -1}},
+            {"$group": group},
+            {"$match": {"_id": {"$ne": None}}},
+            {"$addFields": {"station_id": "$_id"}},
+            {"$project": {"_id": 0}},
+        ]
+        if data_type == "stations":
+            # Point GeoJSON seulement si les deux coordonnées existent (comme update_latest) :
+            # un Point sans coordonnées ferait échouer tout le $merge sur l'index 2dsphere
+            pipeline.append({"$addFields": {"location": {"$cond": [
+                {"$and": [{"$isNumber": "$lat"}, {"$isNumber": "$lon"}]},
+                {"type": "Point", "coordinates": ["$lon", "$lat"]},
+                "$$REMOVE"
+            ]}}})
+        pipeline += [
+            {"$merge": {"into": COLLECTION_LATEST, "on": "station_id",
+                        "whenMatched": "merge", "whenNotMatched": "insert"}}
+        ]
+        try:
+            db[collection_name].aggregate(pipeline, allowDiskUse=True)
+        except errors.PyMongoError as e:
+            print(f"✗ Erreur Mongo (bootstrap {collection_name}): {e}")
+    print(f"✓ '{COLLECTION_LATEST}' : {latest.estimated_document_count()} stations.")
+
+def mark_cycle_complete(db, iteration):
+    """Publie la fin du cycle : station_latest contient désormais les deux flux du cycle."""
+    try:
+        db[COLLECTION_STATE].replace_one(
+            {"_id": CYCLE_MARKER_ID},
+            {"_id": CYCLE_MARKER_ID, "iteration": iteration, "completed_at": datetime.utcnow()},
+            upsert=True
+        )
+    except errors.PyMongoError as e:
+        print(f"✗ Erreur Mongo ({COLLECTION_STATE}): {e}")
+
+def run_cycle_sequential(db, session=None):
+    """Cycle historique : infos statiques puis statut, l'un après l'autre."""
+    # 1. Infos statiques (Nom, Lat, Lon)
+    # Note: avec SCRAPER_INFO_DIFF=1 seules les stations modifiées sont écrites.
+    info_data = fetch_velib_data(STATION_INFO_URL, "stations", session)
+    if info_data:
+        save_to_mongodb(db, info_data, COLLECTION_INFO, "stations")
+
+    # 2. Status dynamique (Vélos dispos)
+    status_data = fetch_velib_data(STATION_STATUS_URL, "status", session)
+    if status_data:
+        save_to_mongodb(db, status_data, COLLECTION_STATUS, "status")
+
+def run_cycle_concurrent(db, executor):
+    """
+    Cycle concurrent : les deux flux sont téléchargés (et parsés) en parallèle,
+    l'écriture de chaque flux démarre dès son arrivée. Durée ≈ max() des étapes
+    au lieu de leur somme, et un horodatage commun aux deux snapshots.
+    Une exception levée dans un thread du pool est affichée ici (elle serait sinon
+    perdue avec son Future) ; l'autre flux est traité normalement.
+    """
+    timestamp = datetime.utcnow()
+    fetches = {
+        executor.submit(fetch_with_thread_session, STATION_INFO_URL, "stations"): (COLLECTION_INFO, "stations"),
+        executor.submit(fetch_with_thread_session, STATION_STATUS_URL, "status"): (COLLECTION_STATUS, "status"),
+    }
+
+    saves = {}
+    for future in as_completed(fetches):
+        collection_name, data_type = fetches[future]
+        try:
+            data = future.result()
+        except Exception as e:
+            print(f"✗ Erreur téléchargement ({data_type}): {e}")
+            continue
+        if data:
+            saves[executor.submit(save_to_mongodb, db, data, collection_name, data_type, timestamp)] = data_type
+
+    for future in as_completed(saves):
+        try:
+            future.result()
+        except Exception as e:
+            print(f"✗ Erreur sauvegarde ({saves[future]}): {e}")
+
 # -------------------------------
 # MAIN
 # -------------------------------
@@ -97,13 +571,51 @@ def main():
     sys.stdout.reconfigure(line_buffering=True)
     
     print("=== SCRAPER VÉLIB DÉMARRÉ ===")
-    print(f"Cible : {MONGO_URI} | DB : {DB_NAME}")
+    print(f"Cible : {MONGO_URI} | DB : {DB_NAME} | Statuts : {COLLECTION_STATUS}")
 
     client = connect_mongodb(MONGO_URI)
     if not client:
         exit(1)
 
     db = client[DB_NAME]
+    if "--rebuild-rollup" in sys.argv:
+        rebuild_hourly_rollup(db)
+        client.close()
+        return
+    if "--migrate-timeseries" in sys.argv:
+        complete = migrate_status_to_timeseries(db)
+        client.close()
+        if not complete:
+            exit(1)
+        return
+
+    if STATUS_LAYOUT == "timeseries":
+        ensure_timeseries_collection(db)
+
+    bootstrap_latest(db)
+    bootstrap_hourly_rollup(db)
+    if INFO_DIFF:
+        load_info_hashes(db)
+    if STATUS_DELTA:
+        load_last_status(db)
+    # Index partiel du dernier keyframe, créé dans tous les modes : hors mode delta il
+    # reste vide et une recherche de keyframe se résout sans parcourir l'historique
+    try:
+        db[COLLECTION_STATUS].create_index(
+            [("keyframe", 1), ("scrape_timestamp", -1)], name="keyframes",
+            partialFilterExpression={"keyframe": True}
+        )
+    except errors.PyMongoError as e:
+        print(f"⚠ Index keyframes non créé sur '{COLLECTION_STATUS}': {e}")
+
+    if METRICS_PORT:
+        start_http_server(METRICS_PORT)
+        print(f"✓ Métriques Prometheus sur le port {METRICS_PORT}")
+
+    # Session HTTP (keep-alive) du mode séquentiel ; le mode concurrent utilise
+    # une session par thread du pool (cf. thread_session)
+    session = requests.Session()
+    executor = ThreadPoolExecutor(max_workers=4)
 
     iteration = 0
     try:
@@ -111,17 +623,16 @@ def main():
             iteration += 1
             print(f"\n--- Cycle #{iteration} : {datetime.now().strftime('%H:%M:%S')} ---")
             
-            # 1. Infos statiques (Nom, Lat, Lon)
-            # Note: Idéalement on ne devrait pas insérer ça en boucle car ça change peu,
-            # mais pour ce TP c'est très bien (ça génère du volume).
-            info_data = fetch_velib_data(STATION_INFO_URL, "stations")
-            if info_data:
-                save_to_mongodb(db, info_data, COLLECTION_INFO, "stations")
-
-            # 2. Status dynamique (Vélos dispos)
-            status_data = fetch_velib_data(STATION_STATUS_URL, "status")
-            if status_data:
-                save_to_mongodb(db, status_data, COLLECTION_STATUS, "status")
+            cycle_start = time.perf_counter()
+            if CONCURRENT_FETCH:
+                run_cycle_concurrent(db, executor)
+            else:
+                run_cycle_sequential(db, session)
+            mark_cycle_complete(db, iteration)
+            cycle_duration = time.perf_counter() - cycle_start
+            CYCLE_DURATION.observe(cycle_duration)
+            LAST_CYCLE.set_to_current_time()
+            print(f"⏱ Cycle terminé en {cycle_duration:.2f} s.")
 
             print(f"💤 Pause de {UPDATE_INTERVAL} secondes...")
             time.sleep(UPDATE_INTERVAL)
@@ -129,6 +640,8 @@ def main():
     except KeyboardInterrupt:
         print("\n=== Arrêt demandé ===")
     finally:
+        executor.shutdown(wait=True)
+        session.close()
         client.close()
         print("Bye.")
 
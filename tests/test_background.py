@@ -0,0 +1,29 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'flask'))
+from background import start_once
+
+class TestStartOnce(unittest.TestCase):
+    def test_started_once_per_name(self):
+        release = threading.Event()
+        runs = []
+
+        def target():
+            runs.append(threading.current_thread())
+            release.wait(5)
+
+        self.assertTrue(start_once("test-start-once", target))
+        self.assertFalse(start_once("test-start-once", target))
+        self.assertTrue(start_once("test-start-once-bis", target))
+        release.set()
+        for thread in threading.enumerate():
+            if thread.name.startswith("test-start-once"):
+                thread.join(5)
+        self.assertEqual(sorted(t.name for t in runs), ["test-start-once", "test-start-once-bis"])
+        self.assertTrue(all(t.daemon for t in runs))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'flask'))
+from forecasting import GLOBAL_FEATURES, STATION_FEATURES, build_global_matrix, build_station_matrix
+
+FORECASTS = [
+    {"time": "2026-01-05T08:00", "temperature": 4.5, "windspeed": 12, "weathercode": 61},
+    {"time": "2026-01-05T09:00", "weathercode": 0},
+]
+
+class TestGlobalMatrix(unittest.TestCase):
+    def test_columns_and_metadata(self):
+        X, times, descs = build_global_matrix(iter(FORECASTS), lambda code: f"code {code}")
+        self.assertEqual(X.shape, (2, len(GLOBAL_FEATURES)))
+        self.assertEqual(X.dtype, np.float32)
+        # 2026-01-05 est un lundi ; valeurs par défaut pour les champs absents
+        np.testing.assert_allclose(X[0], [8, 0, 4.5, 12, 61])
+        np.testing.assert_allclose(X[1], [9, 0, 15, 10, 0])
+        self.assertEqual(times, ["2026-01-05T08:00", "2026-01-05T09:00"])
+        self.assertEqual(descs, ["code 61", "code 0"])
+
+class TestStationMatrix(unittest.TestCase):
+    def test_rows_per_slot_and_profiles(self):
+        stations = [
+            {"station_id": 1, "lat": 48.85, "lon": 2.35, "capacity": 30},
+            {"station_id": 2, "lat": 48.86, "lon": 2.30, "num_bikes_available": 4, "num_docks_available": 6},
+        ]
+        # 08:00 à Paris en hiver = 07:00 UTC
+        profiles = [{"station_id": 1, "day_of_week": 0, "hour": 7, "sum_bikes": 30, "count": 3}]
+        X = build_station_matrix(FORECASTS, stations, profiles)
+        self.assertEqual(X.shape, (4, len(STATION_FEATURES)))
+        # Lignes rangées créneau par créneau : (slot 0, st 1), (slot 0, st 2), (slot 1, st 1)...
+        np.testing.assert_allclose(X[:, 0], [7, 7, 8, 8])
+        np.testing.assert_allclose(X[:, 7], [30, 10, 30, 10])
+        # Profil connu, sinon moitié de la capacité
+        np.testing.assert_allclose(X[:, 8], [10, 5, 15, 5])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import random
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'flask'))
+from geo import StationGridIndex, calculate_distance, haversine_np
+
+class TestStationGridIndex(unittest.TestCase):
+    def setUp(self):
+        rnd = random.Random(42)
+        # Stations aléatoires sur Paris intra-muros
+        self.stations = [
+            {"station_id": i, "lat": 48.80 + rnd.random() * 0.12, "lon": 2.22 + rnd.random() * 0.25}
+            for i in range(1500)
+        ]
+        self.index = StationGridIndex(self.stations)
+
+    def brute_force(self, lat, lon):
+        return sorted(self.stations, key=lambda s: calculate_distance(lat, lon, s['lat'], s['lon']))
+
+    def test_nearest_matches_brute_force(self):
+        for lat, lon in [(48.8566, 2.3522), (48.8606, 2.3376), (48.70, 2.10)]:
+            expected = [s['station_id'] for s in self.brute_force(lat, lon)[:10]]
+            result = [s['station_id'] for _, s in self.index.nearest(lat, lon, 10)]
+            self.assertEqual(result, expected)
+
+    def test_within_radius(self):
+        lat, lon = 48.8566, 2.3522
+        expected = {s['station_id'] for s in self.stations
+                    if calculate_distance(lat, lon, s['lat'], s['lon']) <= 800}
+        result = self.index.within(lat, lon, 800)
+        self.assertEqual({s['station_id'] for _, s in result}, expected)
+        distances = [d for d, _ in result]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_vectorized_distances(self):
+        lat, lon = 48.8566, 2.3522
+        expected = [calculate_distance(lat, lon, s['lat'], s['lon']) for s in self.stations]
+        for got, exp in zip(self.index.distances(lat, lon), expected):
+            self.assertAlmostEqual(got, exp, places=3)
+
+        matrix = self.index.distance_matrix([lat, 48.86], [lon, 2.34])
+        self.assertEqual(matrix.shape, (2, len(self.stations)))
+        self.assertAlmostEqual(matrix[0, 0], expected[0], places=3)
+        self.assertAlmostEqual(float(haversine_np(lat, lon, lat, lon)), 0.0)
+
+    def test_far_away_queries_are_bounded(self):
+        for lat, lon in [(0.0, 0.0), (43.2965, 5.3698), (-48.85, -177.6)]:
+            t0 = time.perf_counter()
+            nearest = self.index.nearest(lat, lon, 10)
+            within = self.index.within(lat, lon, 10000000)
+            self.assertLess(time.perf_counter() - t0, 0.5)
+            expected = [s['station_id'] for s in self.brute_force(lat, lon)[:10]]
+            self.assertEqual([s['station_id'] for _, s in nearest], expected)
+            self.assertEqual(len(within), sum(1 for s in self.stations
+                                              if calculate_distance(lat, lon, s['lat'], s['lon']) <= 10000000))
+
+    def test_nearest_near_grid_edge(self):
+        # Point juste hors de Paris (banlieue) : anneaux bornés à la grille
+        lat, lon = 48.78, 2.20
+        expected = [s['station_id'] for s in self.brute_force(lat, lon)[:10]]
+        self.assertEqual([s['station_id'] for _, s in self.index.nearest(lat, lon, 10)], expected)
+
+    def test_empty_index(self):
+        index = StationGridIndex([{"station_id": 1, "lat": None, "lon": None}])
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.nearest(48.85, 2.35, 5), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+import requests
+
+class TestMapDataCache(unittest.TestCase):
+    BASE_URL = "http://localhost:5000"
+
+    def test_etag_revalidation(self):
+        response = requests.get(f"{self.BASE_URL}/api/map_data")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers.get('ETag')
+        self.assertIsNotNone(etag)
+
+        # Même snapshot : le serveur doit répondre 304 sans corps
+        response = requests.get(f"{self.BASE_URL}/api/map_data", headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_gzip_variant(self):
+        response = requests.get(f"{self.BASE_URL}/api/map_data", headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers.get('Content-Encoding'), 'gzip')
+        # requests décompresse automatiquement
+        self.assertIsInstance(response.json(), list)
+
+    def test_etag_per_encoding(self):
+        gz = requests.get(f"{self.BASE_URL}/api/map_data", headers={'Accept-Encoding': 'gzip'})
+        identity = requests.get(f"{self.BASE_URL}/api/map_data", headers={'Accept-Encoding': 'identity'})
+        self.assertNotEqual(gz.headers.get('ETag'), identity.headers.get('ETag'))
+        self.assertEqual(gz.headers.get('Vary'), 'Accept-Encoding')
+        # L'ETag d'une représentation ne valide pas l'autre
+        response = requests.get(f"{self.BASE_URL}/api/map_data",
+                                headers={'Accept-Encoding': 'identity', 'If-None-Match': gz.headers['ETag']})
+        self.assertEqual(response.status_code, 200)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'flask'))
+from model_registry import ModelRegistry
+
+def read_model(path):
+    with open(path) as f:
+        return f.read()
+
+def unreadable(path):
+    raise ValueError("modèle illisible")
+
+class TestModelRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.native = os.path.join(self.dir, "velib_model.ubj")
+        self.pickle = os.path.join(self.dir, "velib_model.pkl")
+        self.manifest = os.path.join(self.dir, "manifest.json")
+        self.loads = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def loader(self, path):
+        self.loads.append(path)
+        return read_model(path)
+
+    def registry(self):
+        return ModelRegistry("velib_model", [self.native, self.pickle], self.loader,
+                             interval=3600, manifest_path=self.manifest)
+
+    def write(self, path, content, mtime=None):
+        with open(path, "w") as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(path, ns=(mtime, mtime))
+
+    def publish(self, version, file="velib_model.ubj"):
+        with open(self.manifest, "w") as f:
+            json.dump({"models": {"velib_model": {"file": file, "version": version}}}, f)
+
+    def test_no_model(self):
+        registry = self.registry()
+        self.assertFalse(registry.reload())
+        self.assertEqual(registry.current, (None, None))
+
+    def test_fallback_path_and_file_version(self):
+        self.write(self.pickle, "v1", mtime=1_000_000_000)
+        registry = self.registry()
+        self.assertTrue(registry.reload())
+        self.assertEqual(registry.current, ("v1", "1000000000-2"))
+        self.assertEqual(registry.path, self.pickle)
+        # Même (mtime, taille) : pas de rechargement
+        self.assertFalse(registry.reload())
+        self.write(self.pickle, "v2", mtime=2_000_000_000)
+        self.assertTrue(registry.reload())
+        self.assertEqual(registry.model, "v2")
+        self.assertEqual(len(self.loads), 2)
+
+    def test_native_file_preferred(self):
+        self.write(self.pickle, "pickle")
+        self.write(self.native, "native")
+        registry = self.registry()
+        registry.reload()
+        self.assertEqual((registry.model, registry.path), ("native", self.native))
+
+    def test_manifest_version(self):
+        self.write(self.native, "v1")
+        self.publish("20260105T080000")
+        registry = self.registry()
+        self.assertTrue(registry.reload())
+        self.assertEqual(registry.version, "20260105T080000")
+        # Fichier touché sans nouvelle version publiée : ignoré
+        self.write(self.native, "v1 bis", mtime=3_000_000_000)
+        self.assertFalse(registry.reload())
+        self.publish("20260105T090000")
+        self.assertTrue(registry.reload())
+        self.assertEqual(registry.current, ("v1 bis", "20260105T090000"))
+
+    def test_manifest_without_file_falls_back(self):
+        self.write(self.pickle, "v1")
+        self.publish("20260105T080000", file="absent.ubj")
+        registry = self.registry()
+        registry.reload()
+        self.assertEqual((registry.model, registry.path), ("v1", self.pickle))
+
+    def test_failed_load_keeps_previous_model(self):
+        self.write(self.native, "v1")
+        self.publish("1")
+        registry = self.registry()
+        registry.reload()
+        self.write(self.native, "corrompu")
+        self.publish("2")
+        registry.loader = unreadable
+        self.assertFalse(registry.reload())
+        self.assertEqual(registry.current, ("v1", "1"))
+        # Nouvel essai au tour suivant
+        registry.loader = self.loader
+        self.assertTrue(registry.reload())
+        self.assertEqual(registry.current, ("corrompu", "2"))
+
+    def test_swap_is_atomic(self):
+        self.write(self.native, "v1")
+        self.publish("1")
+        registry = self.registry()
+        registry.reload()
+        self.write(self.native, "v2")
+        self.publish("2")
+        loading, release = threading.Event(), threading.Event()
+
+        def slow_loader(path):
+            loading.set()
+            release.wait(5)
+            return read_model(path)
+
+        registry.loader = slow_loader
+        thread = threading.Thread(target=registry.reload)
+        thread.start()
+        self.assertTrue(loading.wait(5))
+        # Pendant le chargement, les lecteurs voient toujours la paire (modèle, version) complète
+        self.assertEqual(registry.current, ("v1", "1"))
+        release.set()
+        thread.join(5)
+        self.assertEqual(registry.current, ("v2", "2"))
+
+if __name__ == "__main__":
+    unittest.main()
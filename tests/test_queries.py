@@ -0,0 +1,86 @@
+import base64
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'flask'))
+from queries import (STATION_LIST_MAX_PAGE_SIZE, decode_list_cursor, encode_list_cursor, parse_nearby_params,
+                     parse_station_list_params, station_list_query)
+
+class TestNearbyParams(unittest.TestCase):
+    def test_k_clamped(self):
+        self.assertEqual(parse_nearby_params({"lat": "48.85", "lon": "2.35", "k": "0"}, 10), (48.85, 2.35, 1, None))
+        self.assertEqual(parse_nearby_params({"lat": "48.85", "lon": "2.35", "k": "-5"}, 10)[2], 1)
+        self.assertEqual(parse_nearby_params({"lat": "48.85", "lon": "2.35", "k": "500"}, 10)[2], 100)
+
+    def test_invalid_radius_or_coordinates(self):
+        for params in ({"lat": "48.85", "lon": "2.35", "radius": "-1"},
+                       {"lat": "48.85", "lon": "2.35", "radius": "10000000"},
+                       {"lat": "48.85", "lon": "2.35", "radius": "nan"},
+                       {"lat": "91", "lon": "2.35"}):
+            with self.assertRaises(ValueError):
+                parse_nearby_params(params, 10)
+
+class TestListCursor(unittest.TestCase):
+    def test_round_trip(self):
+        for value in ("Bastille - Rue Saint-Antoine", 12, None):
+            self.assertEqual(decode_list_cursor(encode_list_cursor(value, 16107)), (value, 16107))
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            decode_list_cursor("pas-un-curseur")
+
+    def test_forged_cursor_types(self):
+        def forge(payload):
+            return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+        for payload in ('[{"$gt": ""}, 1]', '[[1, 2], 1]', '[true, 1]', '[NaN, 1]',
+                        '["Bastille", "1"]', '["Bastille", 1.5]', '["Bastille", null]', '["Bastille", false]',
+                        '{"$gt": 1, "b": 2}', '[1, 2, 3]', '42'):
+            with self.assertRaises(ValueError, msg=payload):
+                decode_list_cursor(forge(payload))
+        self.assertEqual(decode_list_cursor(forge(json.dumps([2.5, 7]))), (2.5, 7))
+
+    def test_forged_cursor_rejected_by_params(self):
+        cursor = base64.urlsafe_b64encode(b'[{"$ne": null}, 1]').decode('ascii')
+        with self.assertRaises(ValueError):
+            parse_station_list_params({"after": cursor})
+
+class TestStationListParams(unittest.TestCase):
+    def test_defaults(self):
+        self.assertEqual(parse_station_list_params({}), ("name", False, 50, None))
+
+    def test_size_capped_and_cursor_decoded(self):
+        params = {"sort": "bikes", "order": "desc", "size": "1000", "after": encode_list_cursor(3, 42)}
+        self.assertEqual(parse_station_list_params(params), ("bikes", True, STATION_LIST_MAX_PAGE_SIZE, (3, 42)))
+
+    def test_unknown_sort(self):
+        with self.assertRaises(ValueError):
+            parse_station_list_params({"sort": "scrape_timestamp"})
+
+class TestStationListQuery(unittest.TestCase):
+    def test_first_page(self):
+        self.assertEqual(station_list_query("name", False), ({}, [("name", 1), ("station_id", 1)]))
+
+    def test_ascending_after_value(self):
+        query, sort = station_list_query("num_bikes_available", False, (3, 42))
+        self.assertEqual(sort, [("num_bikes_available", 1), ("station_id", 1)])
+        self.assertEqual(query, {"$or": [
+            {"num_bikes_available": {"$gt": 3}},
+            {"num_bikes_available": 3, "station_id": {"$gt": 42}},
+        ]})
+
+    def test_descending_keeps_nulls_for_the_end(self):
+        query, _ = station_list_query("num_bikes_available", True, (3, 42))
+        self.assertIn({"num_bikes_available": None}, query["$or"])
+
+    def test_after_null(self):
+        # Croissant : reste des null puis toutes les valeurs ; décroissant : reste des null seulement
+        query, _ = station_list_query("capacity", False, (None, 7))
+        self.assertEqual(query, {"$or": [{"capacity": None, "station_id": {"$gt": 7}}, {"capacity": {"$ne": None}}]})
+        query, _ = station_list_query("capacity", True, (None, 7))
+        self.assertEqual(query, {"capacity": None, "station_id": {"$lt": 7}})
+
+if __name__ == "__main__":
+    unittest.main()
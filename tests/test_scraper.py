@@ -0,0 +1,452 @@
+import copy
+import io
+import os
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from pymongo import errors
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(ROOT, 'scraper'))
+sys.path.insert(0, os.path.join(ROOT, 'flask'))
+import scraper
+from queries import availability_pipeline, window_start_lookups
+
+class FakeCollection:
+    """Collection en mémoire : garde les documents insérés, compte les bulk_write."""
+    def __init__(self):
+        self.docs = []
+
+    def insert_many(self, docs):
+        self.docs.extend(copy.deepcopy(docs))
+        return SimpleNamespace(inserted_ids=list(range(len(docs))))
+
+    def bulk_write(self, operations, ordered=True):
+        return SimpleNamespace(upserted_count=0, modified_count=len(operations))
+
+class FailingCollection(FakeCollection):
+    def insert_many(self, docs):
+        raise errors.AutoReconnect("mongos injoignable")
+
+class MigrationCollection(FakeCollection):
+    """find/find_one/distinct sur scrape_timestamp ; insert_many peut échouer après `fail_after` documents."""
+    def __init__(self, docs=(), fail_after=None):
+        super().__init__()
+        self.docs = list(docs)
+        self.fail_after = fail_after
+
+    def find(self, query, projection=None):
+        return FakeCursor(copy.deepcopy([d for d in self.docs if matches(d, query)]))
+
+    def find_one(self, query, projection=None, sort=None):
+        docs = sorted(self.docs, key=lambda d: d["scrape_timestamp"], reverse=True)
+        return {"scrape_timestamp": docs[0]["scrape_timestamp"]} if docs else None
+
+    def distinct(self, field, query):
+        return list({d[field] for d in self.docs if matches(d, query)})
+
+    def insert_many(self, docs, ordered=True):
+        if self.fail_after is not None and len(self.docs) + len(docs) > self.fail_after:
+            # Insertion ordonnée interrompue : le début du lot est écrit
+            self.docs.extend(copy.deepcopy(docs[:self.fail_after - len(self.docs)]))
+            self.fail_after = None
+            raise errors.AutoReconnect("failover mongos")
+        return super().insert_many(docs)
+
+class FakeCursor(list):
+    def sort(self, field, direction):
+        return FakeCursor(sorted(self, key=lambda d: d[field], reverse=direction < 0))
+
+    def batch_size(self, n):
+        return self
+
+class FailingBulkCollection(FakeCollection):
+    def bulk_write(self, operations, ordered=True):
+        raise errors.AutoReconnect("mongos injoignable")
+
+class FakeDb(dict):
+    def __missing__(self, name):
+        self[name] = FakeCollection()
+        return self[name]
+
+def matches(doc, query):
+    for field, cond in query.items():
+        value = doc.get(field)
+        if isinstance(cond, dict):
+            if "$gte" in cond and not value >= cond["$gte"]:
+                return False
+            if "$lte" in cond and not value <= cond["$lte"]:
+                return False
+            if "$in" in cond and value not in cond["$in"]:
+                return False
+            if "$ne" in cond and value == cond["$ne"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+def evaluate(doc, expr):
+    """Expressions d'agrégation utilisées par le scraper : chemins "$a.b", $subtract, $isoDayOfWeek, $hour."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = doc
+        for part in expr[1:].split("."):
+            value = value.get(part) if isinstance(value, dict) else None
+        return value
+    if isinstance(expr, dict):
+        op, arg = next(iter(expr.items()))
+        if op == "$subtract":
+            return evaluate(doc, arg[0]) - evaluate(doc, arg[1])
+        if op == "$isoDayOfWeek":
+            return evaluate(doc, arg).isoweekday()
+        if op == "$hour":
+            return evaluate(doc, arg).hour
+        return {field: evaluate(doc, sub) for field, sub in expr.items()}
+    return expr
+
+def run_pipeline(docs, pipeline):
+    """Évaluation minimale ($match, $sort sur un champ, $group avec $first/$sum, $project) des pipelines."""
+    for stage in pipeline:
+        if "$match" in stage:
+            docs = [d for d in docs if matches(d, stage["$match"])]
+        elif "$sort" in stage:
+            (field, direction), = stage["$sort"].items()
+            docs = sorted(docs, key=lambda d: d[field], reverse=direction < 0)
+        elif "$group" in stage:
+            spec = dict(stage["$group"])
+            key = spec.pop("_id")
+            groups = {}
+            for d in docs:
+                group_id = evaluate(d, key)
+                hashable = tuple(sorted(group_id.items())) if isinstance(group_id, dict) else group_id
+                if hashable not in groups:
+                    groups[hashable] = dict({"_id": group_id}, **{
+                        f: d.get(acc["$first"][1:]) if "$first" in acc else 0 for f, acc in spec.items()
+                    })
+                group = groups[hashable]
+                for f, acc in spec.items():
+                    if "$sum" in acc:
+                        group[f] += evaluate(d, acc["$sum"])
+            docs = list(groups.values())
+        elif "$project" in stage:
+            spec = stage["$project"]
+            docs = [{f: d.get(f) if expr == 1 else evaluate(d, expr)
+                     for f, expr in spec.items() if expr != 0} for d in docs]
+    return docs
+
+class RollupCollection(FakeCollection):
+    """Applique réellement les UpdateOne ($inc, upsert) et le $out des agrégations."""
+    def __init__(self, db):
+        super().__init__()
+        self.db = db
+
+    def bulk_write(self, operations, ordered=True):
+        for op in operations:
+            target = next((d for d in self.docs if matches(d, op._filter)), None)
+            if target is None:
+                target = dict(op._filter)
+                self.docs.append(target)
+            for field, inc in op._doc["$inc"].items():
+                target[field] = target.get(field, 0) + inc
+        return SimpleNamespace(upserted_count=0, modified_count=len(operations))
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        result = run_pipeline(self.docs, pipeline)
+        if "$out" in pipeline[-1]:
+            self.db[pipeline[-1]["$out"]].docs = result
+        return iter(result)
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+class RollupDb(dict):
+    def __missing__(self, name):
+        self[name] = RollupCollection(self)
+        return self[name]
+
+def status_feed(counts):
+    """Flux station_status : {station_id: (vélos, places)}."""
+    return [{"station_id": sid, "num_bikes_available": b, "num_docks_available": d}
+            for sid, (b, d) in counts.items()]
+
+def info_feed(stations):
+    """Flux station_information : {station_id: (nom, capacité)}."""
+    return {"last_updated": 0, "data": {"stations": [
+        {"station_id": sid, "name": name, "capacity": capacity, "lat": 48.85, "lon": 2.35}
+        for sid, (name, capacity) in stations.items()
+    ]}}
+
+class TestInfoDiff(unittest.TestCase):
+    def setUp(self):
+        self.saved = (scraper.INFO_DIFF, dict(scraper.info_hashes))
+        scraper.INFO_DIFF = True
+        scraper.info_hashes.clear()
+        self.db = FakeDb()
+        self.stations = {1: ("Bastille", 30), 2: ("Nation", 40)}
+        self.ts = datetime(2026, 1, 5, 8)
+
+    def tearDown(self):
+        scraper.INFO_DIFF, previous = self.saved
+        scraper.info_hashes.clear()
+        scraper.info_hashes.update(previous)
+
+    def ingest(self, stations, hours=0, db=None):
+        feed = info_feed(stations)
+        return scraper.save_to_mongodb(db or self.db, feed, scraper.COLLECTION_INFO, "stations",
+                                       self.ts + timedelta(hours=hours))
+
+    def written(self):
+        return [(d["station_id"], d["info_version"]) for d in self.db[scraper.COLLECTION_INFO].docs]
+
+    def test_first_seen_stations_inserted(self):
+        self.assertTrue(self.ingest(self.stations))
+        self.assertEqual(self.written(), [(1, 1), (2, 1)])
+        self.assertEqual(set(scraper.info_hashes), {1, 2})
+
+    def test_unchanged_stations_skipped(self):
+        self.ingest(self.stations)
+        # Seuls scrape_timestamp / api_last_updated changent : rien n'est écrit
+        self.assertTrue(self.ingest(self.stations, hours=1))
+        self.assertEqual(self.written(), [(1, 1), (2, 1)])
+
+    def test_change_writes_new_version(self):
+        self.ingest(self.stations)
+        self.ingest({**self.stations, 2: ("Nation", 42), 3: ("Wagram", 20)}, hours=1)
+        self.ingest({**self.stations, 2: ("Nation - Trône", 42), 3: ("Wagram", 20)}, hours=2)
+        self.assertEqual(self.written(), [(1, 1), (2, 1), (2, 2), (3, 1), (2, 3)])
+        latest = self.db[scraper.COLLECTION_INFO].docs[-1]
+        self.assertEqual((latest["name"], latest["scrape_timestamp"]), ("Nation - Trône", self.ts + timedelta(hours=2)))
+
+    def test_failed_insert_retried_next_cycle(self):
+        failing = FakeDb()
+        failing[scraper.COLLECTION_INFO] = FailingCollection()
+        self.assertFalse(self.ingest(self.stations, db=failing))
+        # Empreintes inchangées : les stations sont réécrites au cycle suivant
+        self.assertEqual(scraper.info_hashes, {})
+        self.assertTrue(self.ingest(self.stations, hours=1))
+        self.assertEqual(self.written(), [(1, 1), (2, 1)])
+
+    def test_failed_latest_update_retried_next_cycle(self):
+        self.db[scraper.COLLECTION_LATEST] = FailingBulkCollection()
+        with redirect_stdout(io.StringIO()):
+            self.assertFalse(self.ingest(self.stations))
+        self.assertEqual(scraper.info_hashes, {})
+        self.db[scraper.COLLECTION_LATEST] = FakeCollection()
+        with mock.patch.object(scraper, "update_latest", wraps=scraper.update_latest) as update_latest:
+            self.assertTrue(self.ingest(self.stations, hours=1))
+        self.assertEqual(len(update_latest.call_args.args[1]), 2)
+        self.assertEqual(set(scraper.info_hashes), {1, 2})
+
+class TestConcurrentCycle(unittest.TestCase):
+    def run_cycle(self, save):
+        feeds = {scraper.STATION_INFO_URL: info_feed({1: ("Bastille", 30)}),
+                 scraper.STATION_STATUS_URL: {"last_updated": 0, "data": {"stations": status_feed({1: (5, 25)})}}}
+        out = io.StringIO()
+        with ThreadPoolExecutor(max_workers=2) as executor, redirect_stdout(out), \
+                mock.patch.object(scraper, "fetch_velib_data", lambda url, data_type, session=None: feeds[url]), \
+                mock.patch.object(scraper, "save_to_mongodb", side_effect=save) as saved:
+            scraper.run_cycle_concurrent(FakeDb(), executor)
+        return out.getvalue(), saved
+
+    def test_both_feeds_saved_with_one_timestamp(self):
+        _, saved = self.run_cycle(lambda *args: True)
+        self.assertEqual(sorted(call.args[3] for call in saved.call_args_list), ["stations", "status"])
+        self.assertEqual(len({call.args[4] for call in saved.call_args_list}), 1)
+
+    def test_save_exception_reported(self):
+        def save(db, data, collection_name, data_type, timestamp):
+            if data_type == "status":
+                raise KeyError("scrape_timestamp")
+            return True
+
+        output, saved = self.run_cycle(save)
+        self.assertEqual(saved.call_count, 2)
+        self.assertIn("Erreur sauvegarde (status)", output)
+
+    def test_one_session_per_thread(self):
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            sessions = list(executor.map(lambda _: scraper.thread_session(), range(20)))
+        self.assertLessEqual(len({id(s) for s in sessions}), 2)
+        self.assertIs(scraper.thread_session(), scraper.thread_session())
+        self.assertNotIn(scraper.thread_session(), sessions)
+
+class TestStatusSelection(unittest.TestCase):
+    def test_unchanged_stations_skipped(self):
+        previous = {1: (5, 10), 2: (3, 12)}
+        feed = status_feed({1: (5, 10), 2: (4, 11), 3: (0, 20)})
+        selected = scraper.select_status_changes(feed, previous, is_keyframe=False)
+        self.assertEqual([s["station_id"] for s in selected], [2, 3])
+        self.assertTrue(all(s["keyframe"] is False for s in selected))
+
+    def test_keyframe_keeps_every_station(self):
+        previous = {1: (5, 10), 2: (3, 12)}
+        selected = scraper.select_status_changes(status_feed(previous), previous, is_keyframe=True)
+        self.assertEqual(len(selected), 2)
+        self.assertTrue(all(s["keyframe"] for s in selected))
+
+    def test_keyframe_every_n_cycles(self):
+        self.assertEqual([c for c in range(10) if scraper.is_keyframe_cycle(c, every=4)], [0, 4, 8])
+
+class TestDeltaIngestion(unittest.TestCase):
+    STATIONS = (1, 2, 3)
+
+    def setUp(self):
+        self.saved = (scraper.STATUS_DELTA, scraper.KEYFRAME_EVERY, scraper.status_cycles, dict(scraper.last_status))
+        scraper.STATUS_DELTA = True
+        scraper.KEYFRAME_EVERY = 3
+        scraper.status_cycles = 0
+        scraper.last_status.clear()
+        self.db = FakeDb()
+        # Cycle c : la station (c % 3) + 1 change, les autres restent identiques
+        self.base = datetime(2026, 1, 5, 8)
+        self.truth = []
+        counts = {sid: (10, 10) for sid in self.STATIONS}
+        for c in range(8):
+            if c:
+                sid = c % 3 + 1
+                counts[sid] = (counts[sid][0] + 1, counts[sid][1] - 1)
+            ts = self.base + timedelta(minutes=10 * c)
+            self.truth.append((ts, dict(counts)))
+            feed = {"last_updated": 0, "data": {"stations": status_feed(counts)}}
+            self.assertTrue(scraper.save_to_mongodb(self.db, feed, scraper.COLLECTION_STATUS, "status", ts))
+
+    def tearDown(self):
+        scraper.STATUS_DELTA, scraper.KEYFRAME_EVERY, scraper.status_cycles, previous = self.saved
+        scraper.last_status.clear()
+        scraper.last_status.update(previous)
+
+    def written(self):
+        return self.db[scraper.COLLECTION_STATUS].docs
+
+    def test_writes_per_cycle(self):
+        per_cycle = [sum(1 for d in self.written() if d["scrape_timestamp"] == ts) for ts, _ in self.truth]
+        # Keyframes aux cycles 0, 3 et 6 (toutes les stations), une seule station sinon
+        self.assertEqual(per_cycle, [3, 1, 1, 3, 1, 1, 3, 1])
+        keyframes = sorted({d["scrape_timestamp"] for d in self.written() if d["keyframe"]})
+        self.assertEqual(keyframes, [self.truth[c][0] for c in (0, 3, 6)])
+
+    def find_window_start(self, ts, station_ids=None):
+        for query, _, _ in window_start_lookups(ts, status_delta=True, station_ids=station_ids):
+            docs = sorted((d for d in self.written() if matches(d, query)),
+                          key=lambda d: d["scrape_timestamp"], reverse=True)
+            if docs:
+                return docs[0]["scrape_timestamp"]
+        return None
+
+    def test_availability_rebuilt_across_keyframes(self):
+        for c, (ts, counts) in enumerate(self.truth):
+            for at in (ts, ts + timedelta(minutes=5)):
+                start = self.find_window_start(at)
+                # Fenêtre ouverte au dernier keyframe <= ts
+                self.assertEqual(start, self.truth[c - c % 3][0])
+                rebuilt = run_pipeline(self.written(), availability_pipeline(start, at))
+                self.assertEqual({d["_id"]: (d["bikes"], d["docks"]) for d in rebuilt}, counts)
+
+    def test_availability_for_selected_stations(self):
+        ts, counts = self.truth[5]
+        start = self.find_window_start(ts, [2])
+        self.assertEqual(start, self.truth[3][0])
+        rebuilt = run_pipeline(self.written(), availability_pipeline(start, ts, [2]))
+        self.assertEqual([(d["_id"], d["bikes"]) for d in rebuilt], [(2, counts[2][0])])
+
+    def test_lookups_target_selected_stations(self):
+        for status_delta in (True, False):
+            for query, _, _ in window_start_lookups(self.base, status_delta, [2, 3]):
+                self.assertEqual(query["station_id"], {"$in": [2, 3]})
+            for query, _, _ in window_start_lookups(self.base, status_delta):
+                self.assertNotIn("station_id", query)
+
+    def test_no_keyframe_lookup_outside_delta_mode(self):
+        lookups = window_start_lookups(self.base, status_delta=False)
+        self.assertEqual(len(lookups), 1)
+        self.assertNotIn("keyframe", lookups[0][0])
+
+class TestTimeseriesMigration(unittest.TestCase):
+    START = datetime(2026, 1, 5, 8)
+
+    def setUp(self):
+        self.source = MigrationCollection(
+            dict(s, scrape_timestamp=self.START + timedelta(hours=h))
+            for h in range(4) for s in status_feed({sid: (h, 20 - h) for sid in range(1, 6)}))
+        self.target = MigrationCollection(fail_after=12)
+        self.db = {scraper.COLLECTION_STATUS_DOCUMENTS: self.source,
+                   scraper.COLLECTION_STATUS_TIMESERIES: self.target}
+
+    def migrate(self):
+        with mock.patch.object(scraper, "ensure_timeseries_collection"), \
+                mock.patch.object(scraper, "MIGRATION_BATCH_SIZE", 4), redirect_stdout(io.StringIO()):
+            return scraper.migrate_status_to_timeseries(self.db)
+
+    def test_rerun_completes_partial_cycle(self):
+        # Échec au milieu du 3e cycle (12 documents sur 20 copiés)
+        self.assertFalse(self.migrate())
+        self.assertEqual(len(self.target.docs), 12)
+        self.assertTrue(self.migrate())
+        key = lambda d: (d["scrape_timestamp"], d["station_id"])
+        self.assertEqual(sorted(map(key, self.target.docs)), sorted(map(key, self.source.docs)))
+
+    def test_indexes_created_on_existing_collection(self):
+        # Collection déjà créée par mongo-setup : seuls les index sont ajoutés
+        db = mock.MagicMock()
+        db.list_collection_names.return_value = [scraper.COLLECTION_STATUS_TIMESERIES]
+        scraper.ensure_timeseries_collection(db)
+        db.create_collection.assert_not_called()
+        self.assertEqual(db[scraper.COLLECTION_STATUS_TIMESERIES].create_index.call_count, 2)
+
+    def test_rerun_copies_new_cycles(self):
+        self.target.fail_after = None
+        self.assertTrue(self.migrate())
+        self.source.docs.extend(dict(s, scrape_timestamp=self.START + timedelta(hours=4))
+                                for s in status_feed({1: (1, 19), 2: (2, 18)}))
+        self.assertTrue(self.migrate())
+        self.assertEqual(len(self.target.docs), 22)
+
+class TestHourlyRollup(unittest.TestCase):
+    # Lundi 5 janvier 2026 23h et dimanche 11 janvier 2026 23h (UTC)
+    MONDAY = datetime(2026, 1, 5, 23)
+    SUNDAY = datetime(2026, 1, 11, 23)
+
+    def setUp(self):
+        self.db = RollupDb()
+        self.cycles = [
+            (self.MONDAY, status_feed({1: (3, 17), 2: (10, 10)})),
+            (self.MONDAY.replace(minute=30), status_feed({1: (5, 15), 2: (12, 8)})),
+            (self.SUNDAY, status_feed({1: (7, 13)}) + [{"station_id": 2, "num_bikes_available": None,
+                                                         "num_docks_available": 20}]),
+        ]
+
+    def rollup(self):
+        return sorted((d["station_id"], d["day_of_week"], d["hour"], d["count"], d["sum_bikes"], d["sum_docks"])
+                      for d in self.db[scraper.COLLECTION_HOURLY].docs)
+
+    def test_incremental_rollup(self):
+        with redirect_stdout(io.StringIO()):
+            for ts, stations in self.cycles:
+                scraper.update_hourly_rollup(self.db, stations, ts)
+        # Lundi -> 0, dimanche -> 6 (pandas dt.dayofweek) ; statut incomplet ignoré
+        self.assertEqual(self.rollup(), [
+            (1, 0, 23, 2, 8, 32),
+            (1, 6, 23, 1, 7, 13),
+            (2, 0, 23, 2, 22, 18),
+        ])
+
+    def test_rebuild_matches_incremental(self):
+        history = self.db[scraper.COLLECTION_STATUS]
+        for ts, stations in self.cycles:
+            history.docs.extend(dict(s, scrape_timestamp=ts) for s in stations)
+        with redirect_stdout(io.StringIO()):
+            scraper.rebuild_hourly_rollup(self.db)
+        rebuilt = self.rollup()
+        self.db[scraper.COLLECTION_HOURLY].docs = []
+        with redirect_stdout(io.StringIO()):
+            for ts, stations in self.cycles:
+                scraper.update_hourly_rollup(self.db, stations, ts)
+        self.assertEqual(rebuilt, self.rollup())
+        self.assertEqual([r[1] for r in rebuilt], [0, 6, 0])
+
+if __name__ == "__main__":
+    unittest.main()
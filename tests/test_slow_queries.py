@@ -0,0 +1,69 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'flask'))
+from slow_queries import explainable_command, summarize_explain
+
+# find sur collection shardée : totaux en tête, détails par shard dans executionStages
+SHARDED_FIND = {
+    "queryPlanner": {"winningPlan": {"stage": "SHARD_MERGE", "shards": [
+        {"shardName": "rsShard1", "winningPlan": {"stage": "FETCH", "inputStage": {
+            "stage": "IXSCAN", "indexName": "station_id_1_scrape_timestamp_-1"}},
+         "rejectedPlans": [{"stage": "COLLSCAN"}]},
+        {"shardName": "rsShard2", "winningPlan": {"stage": "COLLSCAN"}},
+    ]}},
+    "executionStats": {
+        "nReturned": 12, "totalKeysExamined": 12, "totalDocsExamined": 5012,
+        "executionStages": {"stage": "SHARD_MERGE", "shards": [
+            {"shardName": "rsShard1", "nReturned": 12, "totalDocsExamined": 12},
+            {"shardName": "rsShard2", "nReturned": 0, "totalDocsExamined": 5000},
+        ]}
+    }
+}
+
+# aggregate sur collection shardée : un bloc executionStats par shard
+SHARDED_AGGREGATE = {
+    "shards": {
+        "rsShard1": {"stages": [{"$cursor": {
+            "queryPlanner": {"winningPlan": {"stage": "IXSCAN", "indexName": "station_id_1_day_of_week_1_hour_1"}},
+            "executionStats": {"nReturned": 24, "totalKeysExamined": 24, "totalDocsExamined": 24}
+        }}, {"$group": {}}]},
+        "rsShard2": {
+            "queryPlanner": {"winningPlan": {"stage": "IXSCAN", "indexName": "station_id_1_day_of_week_1_hour_1"}},
+            "executionStats": {"nReturned": 10, "totalKeysExamined": 10, "totalDocsExamined": 10}
+        },
+    }
+}
+
+class TestSummarizeExplain(unittest.TestCase):
+    def test_sharded_find_counts_totals_once(self):
+        summary = summarize_explain(SHARDED_FIND)
+        self.assertEqual((summary["docs_examined"], summary["keys_examined"], summary["returned"]), (5012, 12, 12))
+        self.assertEqual(summary["shards"], ["rsShard1", "rsShard2"])
+        self.assertEqual(summary["indexes"], ["station_id_1_scrape_timestamp_-1"])
+        self.assertTrue(summary["collscan"])
+
+    def test_sharded_aggregate_sums_shards(self):
+        summary = summarize_explain(SHARDED_AGGREGATE)
+        self.assertEqual((summary["docs_examined"], summary["returned"]), (34, 34))
+        self.assertEqual(summary["shards"], ["rsShard1", "rsShard2"])
+        self.assertEqual(summary["stages"], ["IXSCAN"])
+        self.assertFalse(summary["collscan"])
+
+    def test_rejected_plans_ignored(self):
+        summary = summarize_explain({"queryPlanner": {
+            "winningPlan": {"stage": "IXSCAN", "indexName": "scrape_timestamp_-1"},
+            "rejectedPlans": [{"stage": "COLLSCAN"}]
+        }})
+        self.assertFalse(summary["collscan"])
+
+class TestExplainableCommand(unittest.TestCase):
+    def test_driver_fields_removed(self):
+        command = {"find": "station_latest", "filter": {}, "comment": "velib_list", "limit": 50,
+                   "lsid": {"id": 1}, "$db": "velib", "$clusterTime": {}}
+        self.assertEqual(explainable_command(command),
+                         {"find": "station_latest", "filter": {}, "comment": "velib_list", "limit": 50})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,439 @@
+import io
+import os
+import sys
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(__file__)), 'trainer'))
+import train
+
+class FakeStatusCollection:
+    """In-memory status collection: find_one on a scrape_timestamp range, sorted by it."""
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    def select(self, bounds):
+        ts = [d for d in self.docs if d.get('scrape_timestamp') is not None]
+        if "$gte" in bounds:
+            ts = [d for d in ts if d['scrape_timestamp'] >= bounds["$gte"]]
+        if "$lt" in bounds:
+            ts = [d for d in ts if d['scrape_timestamp'] < bounds["$lt"]]
+        if "$lte" in bounds:
+            ts = [d for d in ts if d['scrape_timestamp'] <= bounds["$lte"]]
+        return ts
+
+    def find_one(self, query, projection=None, sort=None):
+        docs = sorted(self.select(query['scrape_timestamp']), key=lambda d: d['scrape_timestamp'],
+                      reverse=sort[0][1] < 0)
+        if query.get('keyframe'):
+            docs = [d for d in docs if d.get('keyframe')]
+        return {'scrape_timestamp': docs[0]['scrape_timestamp']} if docs else None
+
+    def find(self, query, projection=None):
+        return FakeCursor(self.select(query['scrape_timestamp']))
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        return run_bucket_pipeline(self.docs, pipeline)
+
+class FakeCursor(list):
+    def sort(self, field, direction):
+        return FakeCursor(sorted(self, key=lambda d: d[field], reverse=direction < 0))
+
+    def batch_size(self, n):
+        return self
+
+def run_bucket_pipeline(docs, pipeline):
+    """Evaluates bucket_pipeline: $match on the time range, $group on $dateTrunc($dateAdd)."""
+    match, group = pipeline[0]["$match"], pipeline[1]["$group"]
+    docs = [d for d in FakeStatusCollection(docs).select(match["scrape_timestamp"])
+            if d.get('num_bikes_available') is not None]
+    add = group["_id"]["$dateTrunc"]["date"]["$dateAdd"]
+    bin_ms = group["_id"]["$dateTrunc"]["binSize"] * 60 * 1000
+    out = {}
+    for d in docs:
+        shifted = d[add["startDate"][1:]] + timedelta(minutes=add["amount"])
+        ms = int((shifted - datetime(1970, 1, 1)) / timedelta(milliseconds=1))
+        key = datetime(1970, 1, 1) + timedelta(milliseconds=ms - ms % bin_ms)
+        acc = out.setdefault(key, {"_id": key, "sum_bikes": 0, "count": 0})
+        acc["sum_bikes"] += d[group["sum_bikes"]["$sum"][1:]]
+        acc["count"] += group["count"]["$sum"]
+    return list(out.values())
+
+def scrapes(start, count, every=timedelta(minutes=3)):
+    return [{'scrape_timestamp': start + i * every, 'num_bikes_available': i % 7} for i in range(count)]
+
+class TestIntervalEdges(unittest.TestCase):
+    def test_interval_edge(self):
+        # Intervals are centered on xx:x0, so they start at xx:x5 (inclusive)
+        cases = {
+            datetime(2026, 1, 5, 8, 0): datetime(2026, 1, 5, 7, 55),
+            datetime(2026, 1, 5, 8, 4, 59): datetime(2026, 1, 5, 7, 55),
+            datetime(2026, 1, 5, 8, 5): datetime(2026, 1, 5, 8, 5),
+            datetime(2026, 1, 5, 8, 14, 59, 999000): datetime(2026, 1, 5, 8, 5),
+            datetime(2026, 1, 5, 23, 58): datetime(2026, 1, 5, 23, 55),
+        }
+        for ts, edge in cases.items():
+            self.assertEqual(train.interval_edge(ts), edge, ts)
+
+    def test_time_range_half_open(self):
+        since, until = datetime(2026, 1, 5, 7, 55), datetime(2026, 1, 5, 8, 5)
+        self.assertEqual(train.time_range(), {"$ne": None})
+        self.assertEqual(train.time_range(since, until), {"$ne": None, "$gte": since, "$lt": until})
+
+    def test_high_water_mark(self):
+        self.assertIsNone(train.get_high_water_mark(FakeStatusCollection()))
+        docs = scrapes(datetime(2026, 1, 5, 8, 0), 5)  # last scrape at 08:12
+        self.assertEqual(train.get_high_water_mark(FakeStatusCollection(docs)), datetime(2026, 1, 5, 8, 5))
+
+class TestStreamBuckets(unittest.TestCase):
+    FIELDS = {'num_bikes_available': 'mean', 'temperature': 'max'}
+
+    def random_docs(self, n=3000, seed=7):
+        rng = np.random.default_rng(seed)
+        start = datetime(2026, 1, 5)
+        offsets = rng.integers(0, 2 * 24 * 3600 * 1000, n)
+        offsets = offsets[offsets % (5 * 60 * 1000) != 0]  # no exact tie, see test_ties_round_up
+        docs = []
+        for i, ms in enumerate(offsets):
+            doc = {'scrape_timestamp': start + timedelta(milliseconds=int(ms)),
+                   'num_bikes_available': None if i % 11 == 0 else int(rng.integers(0, 40)),
+                   'temperature': None if i % 5 == 0 else float(rng.normal(8, 4))}
+            if i % 13 == 0:
+                doc['time'] = doc.pop('scrape_timestamp')
+            docs.append(doc)
+        docs.append({'num_bikes_available': 3})  # no timestamp at all: skipped
+        return docs
+
+    def reference(self, docs):
+        df = pd.DataFrame(docs)
+        df['ts'] = df['scrape_timestamp'].fillna(df['time'])
+        df = df.dropna(subset=['ts'])
+        df['hour_key'] = pd.to_datetime(df['ts']).dt.round('10min')
+        grouped = df.groupby('hour_key').agg(num_bikes_available=('num_bikes_available', 'mean'),
+                                            temperature=('temperature', 'max'))
+        return grouped.reset_index()
+
+    def test_matches_pandas_rounding(self):
+        docs = self.random_docs()
+        expected = self.reference(docs)
+        for batch_size in (1, 7, 500, 10000):
+            result = train.stream_buckets(iter(docs), self.FIELDS, batch_size=batch_size, fallback_time_field='time')
+            pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    def test_ties_round_up(self):
+        docs = [{'scrape_timestamp': datetime(2026, 1, 5, 8, 5), 'num_bikes_available': 4},
+                {'scrape_timestamp': datetime(2026, 1, 5, 8, 15), 'num_bikes_available': 6}]
+        result = train.stream_buckets(iter(docs), {'num_bikes_available': 'mean'})
+        self.assertEqual(list(result['hour_key']), [pd.Timestamp(2026, 1, 5, 8, 10), pd.Timestamp(2026, 1, 5, 8, 20)])
+        # Same interval as the one interval_edge opens at the tie
+        self.assertEqual(train.interval_edge(datetime(2026, 1, 5, 8, 5)), datetime(2026, 1, 5, 8, 5))
+
+class TestBucketPipeline(unittest.TestCase):
+    def test_pipeline_shape(self):
+        match = {"num_bikes_available": {"$ne": None}, "scrape_timestamp": train.time_range()}
+        self.assertEqual(train.bucket_pipeline(match), [
+            {"$match": match},
+            {"$group": {
+                "_id": {"$dateTrunc": {
+                    "date": {"$dateAdd": {"startDate": "$scrape_timestamp", "unit": "minute", "amount": 5}},
+                    "unit": "minute", "binSize": 10
+                }},
+                "sum_bikes": {"$sum": "$num_bikes_available"},
+                "count": {"$sum": 1}
+            }}
+        ])
+
+    def test_same_intervals_as_stream_buckets(self):
+        docs = TestStreamBuckets().random_docs(n=1500, seed=3)
+        docs = [d for d in docs if d.get('scrape_timestamp') is not None]
+        docs += [{'scrape_timestamp': datetime(2026, 1, 5, 8, 5), 'num_bikes_available': 9}]  # tie
+        expected = train.stream_buckets(iter(docs), {'num_bikes_available': 'mean'})
+        expected = expected.dropna().rename(columns={'num_bikes_available': 'avg_bikes'}).reset_index(drop=True)
+        for parallelism in (1, 3, 8):
+            result = train.aggregate_buckets_in_mongo(FakeStatusCollection(docs), parallelism=parallelism)
+            pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    def test_window_and_empty_collection(self):
+        docs = scrapes(datetime(2026, 1, 5, 8, 1), 40)
+        since, until = datetime(2026, 1, 5, 8, 25), datetime(2026, 1, 5, 9, 5)
+        result = train.aggregate_buckets_in_mongo(FakeStatusCollection(docs), since, until, parallelism=2)
+        expected = pd.date_range('2026-01-05 08:30', '2026-01-05 09:00', freq='10min')
+        self.assertEqual(list(result['hour_key']), list(expected))
+        self.assertTrue(train.aggregate_buckets_in_mongo(FakeStatusCollection()).empty)
+
+class TestDeltaReplay(unittest.TestCase):
+    """Status written in delta mode: keyframe every 3 cycles, otherwise changed stations only."""
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        bikes = {sid: int(rng.integers(0, 30)) for sid in range(1, 6)}
+        self.full, self.delta = [], []
+        for c in range(12):
+            ts = datetime(2026, 1, 5, 6, 2) + c * timedelta(minutes=20)
+            changed = set(rng.choice(list(bikes), 2, replace=False)) if c else set(bikes)
+            for sid in changed:
+                bikes[sid] = int(rng.integers(0, 30))
+            keyframe = c % 3 == 0
+            for sid, b in bikes.items():
+                doc = {'scrape_timestamp': ts, 'station_id': sid, 'num_bikes_available': b, 'keyframe': keyframe}
+                self.full.append(doc)
+                if keyframe or sid in changed:
+                    self.delta.append(doc)
+        self.collection = FakeStatusCollection(self.delta)
+
+    def full_means(self, since=None, until=None):
+        docs = FakeStatusCollection(self.full).select(train.time_range(since, until))
+        df = train.stream_buckets(iter(docs), {'num_bikes_available': 'mean'})
+        return df.rename(columns={'num_bikes_available': 'avg_bikes'})
+
+    def test_interval_means_match_full_snapshots(self):
+        pd.testing.assert_frame_equal(train.replay_interval_means(self.collection), self.full_means(),
+                                      check_dtype=False)
+        # Averaging the delta documents directly is biased towards changed stations
+        biased = train.stream_buckets(iter(self.delta), {'num_bikes_available': 'mean'})
+        self.assertFalse(np.allclose(biased['num_bikes_available'], self.full_means()['avg_bikes']))
+
+    def test_incremental_window_starts_from_previous_keyframe(self):
+        # Cycles 7 and 8 (08:22, 08:42) are deltas on top of the 08:02 keyframe
+        since, until = datetime(2026, 1, 5, 8, 15), datetime(2026, 1, 5, 9, 35)
+        pd.testing.assert_frame_equal(train.replay_interval_means(self.collection, since, until),
+                                      self.full_means(since, until), check_dtype=False)
+
+    def test_station_hours_match_full_snapshots(self):
+        result = train.replay_station_hours(self.collection).set_index(['station_id', 'hour_key'])['target']
+        full = pd.DataFrame(self.full)
+        full['hour_key'] = full['scrape_timestamp'].dt.floor('h')
+        expected = full.groupby(['station_id', 'hour_key'])['num_bikes_available'].mean()
+        pd.testing.assert_series_equal(result.sort_index(), expected.sort_index(), check_names=False,
+                                       check_dtype=False)
+
+    def test_load_data_uses_replay_in_delta_mode(self):
+        db_velib = {train.STATUS_COLLECTION: self.collection}
+        db_meteo = mock.Mock()
+        db_meteo.meteo_current.find.return_value = FakeCursor()
+        with mock.patch.object(train, 'STATUS_DELTA', True):
+            df = train.load_data(db_velib, db_meteo, since=datetime(2026, 1, 5, 6, 55))
+        self.assertEqual(list(df['target']), list(self.full_means(datetime(2026, 1, 5, 6, 55))['avg_bikes']))
+
+class TestSplitTimeRange(unittest.TestCase):
+    def setUp(self):
+        # 08:01 -> 10:58, one scrape every 3 minutes
+        self.collection = FakeStatusCollection(scrapes(datetime(2026, 1, 5, 8, 1), 60))
+
+    def assert_contiguous(self, ranges, start, end):
+        self.assertEqual(ranges[0][0], start)
+        self.assertEqual(ranges[-1][1], end)
+        for (_, hi), (lo, _) in zip(ranges, ranges[1:]):
+            self.assertEqual(hi, lo)
+        for lo, hi in ranges:
+            self.assertEqual(train.interval_edge(lo), lo)
+            self.assertEqual(train.interval_edge(hi), hi)
+
+    def test_full_span(self):
+        ranges = train.split_time_range(self.collection, parallelism=4)
+        self.assertEqual(len(ranges), 4)
+        self.assert_contiguous(ranges, datetime(2026, 1, 5, 7, 55), datetime(2026, 1, 5, 11, 5))
+
+    def test_window_bounds_kept(self):
+        since, until = datetime(2026, 1, 5, 8, 35), datetime(2026, 1, 5, 9, 45)
+        ranges = train.split_time_range(self.collection, since, until, parallelism=3)
+        self.assert_contiguous(ranges, since, until)
+
+    def test_more_ranges_than_intervals(self):
+        since, until = datetime(2026, 1, 5, 8, 35), datetime(2026, 1, 5, 8, 55)
+        self.assertEqual(train.split_time_range(self.collection, since, until, parallelism=8),
+                         [(since, datetime(2026, 1, 5, 8, 45)), (datetime(2026, 1, 5, 8, 45), until)])
+
+    def test_empty_window(self):
+        self.assertEqual(train.split_time_range(self.collection, datetime(2026, 1, 6), None), [])
+        self.assertEqual(train.split_time_range(FakeStatusCollection()), [])
+
+class TestPlanRun(unittest.TestCase):
+    HWM = datetime(2026, 1, 5, 8, 5)
+
+    def test_first_run_is_full(self):
+        self.assertEqual(train.plan_run(None, False, self.HWM), (True, None, self.HWM))
+        # Empty collection: full run over everything, no high-water mark to save
+        self.assertEqual(train.plan_run(None, False, None), (True, None, None))
+
+    def test_missing_model_forces_full(self):
+        state = {'high_water_mark': self.HWM, 'runs_since_full': 1}
+        self.assertEqual(train.plan_run(state, False, self.HWM + timedelta(hours=1)),
+                         (True, None, self.HWM + timedelta(hours=1)))
+
+    def test_incremental_window(self):
+        state = {'high_water_mark': self.HWM, 'runs_since_full': 1}
+        until = self.HWM + timedelta(minutes=30)
+        self.assertEqual(train.plan_run(state, True, until, full_rebuild_every=24), (False, self.HWM, until))
+
+    def test_periodic_full_rebuild(self):
+        state = {'high_water_mark': self.HWM, 'runs_since_full': 23}
+        self.assertTrue(train.plan_run(state, True, self.HWM + timedelta(hours=1), full_rebuild_every=24)[0])
+
+    def test_nothing_new(self):
+        state = {'high_water_mark': self.HWM, 'runs_since_full': 1}
+        self.assertIsNone(train.plan_run(state, True, self.HWM, full_rebuild_every=24))
+        self.assertIsNone(train.plan_run(state, True, None, full_rebuild_every=24))
+
+    def test_consecutive_runs_read_each_row_once(self):
+        collection = FakeStatusCollection(scrapes(datetime(2026, 1, 5, 8, 1), 20))
+        state, previous_has_model, read = None, False, []
+        for new_scrapes in (0, 7, 0, 13):
+            collection.docs += scrapes(collection.docs[-1]['scrape_timestamp'] + timedelta(minutes=3), new_scrapes)
+            plan = train.plan_run(state, previous_has_model, train.get_high_water_mark(collection), 24)
+            if plan is None:
+                continue
+            full, since, until = plan
+            read += collection.select(train.time_range(since, until))
+            state, previous_has_model = {'high_water_mark': until, 'runs_since_full': 0}, True
+        ids = [d['scrape_timestamp'] for d in read]
+        self.assertEqual(len(ids), len(set(ids)))
+        # Everything before the last high-water mark was read, the filling interval was not
+        self.assertEqual(sorted(ids), [d['scrape_timestamp'] for d in collection.docs
+                                       if d['scrape_timestamp'] < state['high_water_mark']])
+
+def training_rows(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'hour': rng.integers(0, 24, n), 'day_of_week': rng.integers(0, 7, n),
+                         'temperature': rng.normal(12, 5, n), 'windspeed': rng.normal(10, 3, n),
+                         'weathercode': rng.choice([0, 3, 61], n), 'target': rng.normal(15, 4, n)})
+
+class TestTrainXgboost(unittest.TestCase):
+    def test_incremental_fits_all_new_rows_without_evaluation(self):
+        history = training_rows(200)
+        base = train.xgb.XGBRegressor(n_estimators=10, max_depth=3)
+        base.fit(history.drop(columns=['target']), history['target'])
+        fit = train.xgb.XGBRegressor.fit
+        fitted_rows = []
+
+        def spy_fit(model, X, y, **kwargs):
+            fitted_rows.append(len(X))
+            return fit(model, X, y, **kwargs)
+
+        with mock.patch.object(train.xgb.XGBRegressor, 'fit', autospec=True, side_effect=spy_fit), \
+                mock.patch.object(train, 'save_plots') as save_plots, \
+                mock.patch('builtins.open') as open_:
+            model = train.train_xgboost(training_rows(30, seed=1), base_model=base)
+        self.assertEqual(fitted_rows, [30])
+        self.assertEqual(model.get_booster().num_boosted_rounds(), 10 + train.INCREMENTAL_TREES)
+        # metrics.json and plots stay those of the last full rebuild
+        save_plots.assert_not_called()
+        open_.assert_not_called()
+
+    def test_warm_start_trains_on_a_short_window(self):
+        history = training_rows(200)
+        base = train.xgb.XGBRegressor(n_estimators=10, max_depth=3)
+        base.fit(history.drop(columns=['target']), history['target'])
+        with mock.patch.object(train, 'save_plots'):
+            model = train.train_xgboost(training_rows(3, seed=1), base_model=base)
+        self.assertEqual(model.get_booster().num_boosted_rounds(), 10 + train.INCREMENTAL_TREES)
+        # A full rebuild still needs enough rows for its held-out split
+        self.assertIsNone(train.train_xgboost(training_rows(3, seed=1)))
+
+class TestRunTraining(unittest.TestCase):
+    HWM = datetime(2026, 1, 5, 8, 5)
+
+    def run_with(self, state, docs, trained="model", new_rows=30, min_rows=24, train_xgboost=None,
+                 previous="previous"):
+        db_velib = {train.STATUS_COLLECTION: FakeStatusCollection(docs)}
+        train_xgboost = train_xgboost or mock.Mock(return_value=trained)
+        load_data = mock.Mock(return_value=training_rows(new_rows))
+        with mock.patch.multiple(train, INCREMENTAL=True, STATION_MODEL=False, FULL_REBUILD_EVERY=24,
+                                 INCREMENTAL_MIN_ROWS=min_rows,
+                                 load_state=mock.Mock(return_value=state),
+                                 load_previous_model=mock.Mock(return_value=previous),
+                                 load_data=load_data,
+                                 train_xgboost=train_xgboost,
+                                 publish_model=mock.DEFAULT, save_state=mock.DEFAULT) as mocks:
+            train.run_training(db_velib, None)
+        mocks.update(train_xgboost=train_xgboost, load_data=load_data)
+        return mocks
+
+    def test_incremental_run_saves_new_high_water_mark(self):
+        state = {'high_water_mark': self.HWM, 'runs_since_full': 2, 'last_full_rebuild': "2026-01-05T00:00:00"}
+        mocks = self.run_with(state, scrapes(datetime(2026, 1, 5, 8, 1), 20))  # last scrape 08:58
+        until = datetime(2026, 1, 5, 8, 55)
+        mocks['load_data'].assert_called_once_with(mock.ANY, None, self.HWM, until)
+        self.assertEqual(mocks['train_xgboost'].call_args.kwargs['base_model'], "previous")
+        mocks['save_state'].assert_called_once_with(
+            {'high_water_mark': until, 'runs_since_full': 3, 'last_full_rebuild': "2026-01-05T00:00:00"})
+
+    def test_no_complete_interval_skips_training(self):
+        state = {'high_water_mark': self.HWM, 'runs_since_full': 2}
+        mocks = self.run_with(state, scrapes(datetime(2026, 1, 5, 8, 5), 3))  # 08:05 -> 08:11
+        mocks['load_data'].assert_not_called()
+        # The skipped run still counts toward the full-rebuild cadence
+        mocks['save_state'].assert_called_once_with({'high_water_mark': self.HWM, 'runs_since_full': 3})
+
+    def test_too_few_new_rows_keeps_high_water_mark(self):
+        state = {'high_water_mark': self.HWM, 'runs_since_full': 2}
+        mocks = self.run_with(state, scrapes(datetime(2026, 1, 5, 8, 1), 20), new_rows=6)
+        mocks['load_data'].assert_called_once()
+        mocks['train_xgboost'].assert_not_called()
+        mocks['save_state'].assert_called_once_with({'high_water_mark': self.HWM, 'runs_since_full': 3})
+
+    def test_failed_training_keeps_high_water_mark(self):
+        state = {'high_water_mark': self.HWM, 'runs_since_full': 2}
+        mocks = self.run_with(state, scrapes(datetime(2026, 1, 5, 8, 1), 20), trained=None)
+        mocks['publish_model'].assert_not_called()
+        mocks['save_state'].assert_called_once_with({'high_water_mark': self.HWM, 'runs_since_full': 3})
+
+    def test_short_window_trains_with_real_guard(self):
+        history = training_rows(200)
+        base = train.xgb.XGBRegressor(n_estimators=10, max_depth=3)
+        base.fit(history.drop(columns=['target']), history['target'])
+        state = {'high_water_mark': self.HWM, 'runs_since_full': 2}
+        out = io.StringIO()
+        with redirect_stdout(out):
+            mocks = self.run_with(state, scrapes(datetime(2026, 1, 5, 8, 1), 20), new_rows=3, min_rows=1,
+                                  train_xgboost=train.train_xgboost, previous=base)
+        mocks['publish_model'].assert_called_once()
+        self.assertEqual(mocks['save_state'].call_args.args[0]['runs_since_full'], 3)
+        self.assertNotIn("Failed", out.getvalue())
+
+    def test_empty_window_skipped_not_failed(self):
+        state = {'high_water_mark': self.HWM, 'runs_since_full': 2}
+        out = io.StringIO()
+        with redirect_stdout(out):
+            mocks = self.run_with(state, scrapes(datetime(2026, 1, 5, 8, 1), 20), new_rows=0, min_rows=1,
+                                  train_xgboost=train.train_xgboost)
+        self.assertIn("Skipped, not enough new intervals", out.getvalue())
+        self.assertNotIn("Failed", out.getvalue())
+        mocks['publish_model'].assert_not_called()
+
+    def test_hourly_scraper_and_trainer(self):
+        # Scraper every UPDATE_INTERVAL (1 h) and TRAINER_INTERVAL=3600: one new interval per run
+        collection = FakeStatusCollection()
+        saved, runs = [None], []
+
+        def load_data(db_velib, db_meteo, since, until):
+            return training_rows(len(collection.select(train.time_range(since, until))))
+
+        def train_xgboost(data, base_model=None):
+            runs.append('full' if base_model is None else len(data))
+            return "model"
+
+        start = datetime(2026, 1, 5, 0, 2)
+        for hour in range(50):
+            collection.docs.append({'scrape_timestamp': start + timedelta(hours=hour), 'num_bikes_available': 3})
+            with mock.patch.multiple(train, INCREMENTAL=True, STATION_MODEL=False, FULL_REBUILD_EVERY=24,
+                                     INCREMENTAL_MIN_ROWS=1,
+                                     load_state=lambda: saved[0],
+                                     load_previous_model=mock.Mock(return_value="previous"),
+                                     load_data=load_data, train_xgboost=train_xgboost,
+                                     publish_model=mock.DEFAULT,
+                                     save_state=lambda state: saved.__setitem__(0, state)):
+                train.run_training({train.STATUS_COLLECTION: collection}, None)
+        # Every run trains: a full rebuild every 24 runs, one new interval otherwise
+        self.assertEqual(runs, (['full'] + [1] * 23) * 2 + ['full', 1])
+        # Last scrape 2026-01-07 01:02: its interval starts at 00:55 and is left to the next run
+        self.assertEqual(saved[0]['high_water_mark'], datetime(2026, 1, 7, 0, 55))
+        self.assertEqual(saved[0]['runs_since_full'], 1)
+
+if __name__ == "__main__":
+    unittest.main()
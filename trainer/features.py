@@ -16,3 +16,24 @@ def build_features(df):
     # capacity from column or default
     df['capacity'] = df['capacity'].fillna(20)
     return df
+
+# Per-station model: weather + calendar + static station features + station profile
+# (mean bikes of the station for the same day_of_week/hour, from status_hourly).
+# The order matters: flask/forecasting.py builds its inference matrix in the same order.
+STATION_FEATURES = ['hour', 'day_of_week', 'temperature', 'windspeed', 'weathercode',
+                    'lat', 'lon', 'capacity', 'profile_bikes']
+
+def add_station_features(df, stations, profiles):
+    """
+    df: station_id, hour_key (UTC hour) + weather columns.
+    stations: station_id, lat, lon, capacity.
+    profiles: station_id, day_of_week, hour, profile_bikes.
+    Stations without coordinates are dropped; a missing profile defaults to half the capacity.
+    """
+    df['hour'] = df['hour_key'].dt.hour
+    df['day_of_week'] = df['hour_key'].dt.dayofweek
+    df = df.merge(stations, on='station_id', how='inner')
+    df['capacity'] = df['capacity'].fillna(20)
+    df = df.merge(profiles, on=['station_id', 'day_of_week', 'hour'], how='left')
+    df['profile_bikes'] = df['profile_bikes'].fillna(df['capacity'] / 2)
+    return df
@@ -7,13 +7,50 @@ from pymongo import MongoClient
 import xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
-from joblib import dump
-from datetime import datetime
+from joblib import dump, load
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from features import STATION_FEATURES, add_station_features
 
 # --- CONFIG ---
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongos:27017/velib")
 MONGO_URI_CLOUD = os.getenv("MONGO_URI_CLOUD") # For Weather
 MODEL_PATH = "/models/velib_model.pkl"
+# Historique des statuts : collection classique ou time-series (cf. scraper STATUS_LAYOUT)
+STATUS_LAYOUT = os.getenv("STATUS_LAYOUT", "documents")
+STATUS_COLLECTION = "status_ts" if STATUS_LAYOUT == "timeseries" else "status"
+# Delta ingestion (scraper SCRAPER_STATUS_DELTA=1): the status history only holds the
+# stations that changed plus periodic keyframes, so averaging it directly would only
+# cover changed stations. Full snapshots are then replayed client-side.
+STATUS_DELTA = os.getenv("SCRAPER_STATUS_DELTA", "0") == "1"
+# Streaming loader: documents per cursor batch / NumPy buffer
+BATCH_SIZE = int(os.getenv("TRAINER_BATCH_SIZE", "50000"))
+BUCKET_MS = 10 * 60 * 1000  # 10-minute intervals
+# Status aggregation: "mongo" = $group/$dateTrunc pushed down to mongos (only the
+# aggregated intervals are transferred), "stream" = client-side streaming loader
+AGG_MODE = os.getenv("TRAINER_AGG_MODE", "mongo")
+# Number of time ranges aggregated concurrently in "mongo" mode
+AGG_PARALLELISM = int(os.getenv("TRAINER_AGG_PARALLELISM", "4"))
+# Incremental retraining: only intervals newer than the saved high-water mark are
+# loaded and boosting continues from the saved model, with a periodic full rebuild
+STATE_PATH = "/models/train_state.json"
+# Published model versions, polled by Flask to hot-reload the models
+MANIFEST_PATH = "/models/manifest.json"
+INCREMENTAL = os.getenv("TRAINER_INCREMENTAL", "1") == "1"
+INCREMENTAL_TREES = int(os.getenv("TRAINER_INCREMENTAL_TREES", "20"))
+FULL_REBUILD_EVERY = int(os.getenv("TRAINER_FULL_REBUILD_EVERY", "24"))
+# Minimum new intervals (rows) for an incremental run; below it the high-water mark
+# is kept and the new intervals are trained on once enough have accumulated.
+# The scraper writes one interval per cycle (hourly), so the default trains every run.
+INCREMENTAL_MIN_ROWS = max(1, int(os.getenv("TRAINER_INCREMENTAL_MIN_ROWS", "1")))
+# Seconds between two training runs (0 = run once and exit)
+TRAIN_INTERVAL = int(os.getenv("TRAINER_INTERVAL", "0"))
+# Per-station model (hourly availability of every station), retrained on full rebuilds
+STATION_MODEL = os.getenv("TRAINER_STATION_MODEL", "1") == "1"
+STATION_MODEL_PATH = "/models/velib_station_model.pkl"
+STATION_META_PATH = "/models/station_model.json"
+STATION_HISTORY_DAYS = int(os.getenv("TRAINER_STATION_HISTORY_DAYS", "28"))
 
 def connect_mongo(uri, name, retries=10):
     for i in range(retries):
@@ -28,8 +65,362 @@ def connect_mongo(uri, name, retries=10):
     print(f"[trainer] FAILED to connect to {name}.")
     return None
 
-def load_data():
-    # 1. Connect
+def stream_buckets(cursor, fields, batch_size=BATCH_SIZE, time_field='scrape_timestamp', fallback_time_field=None):
+    """
+    Streams a Mongo cursor into preallocated NumPy column buffers and aggregates
+    each batch per 10-minute bucket (rounded like dt.round('10min'), except that exact
+    ties at xx:x5:00 go to the next interval, as in bucket_pipeline and interval_edge).
+    fields: {name: 'mean' | 'max'}. Memory is bounded by batch_size + number of buckets.
+    Returns a DataFrame with 'hour_key' + one column per field.
+    """
+    names = list(fields)
+    ts_buf = np.empty(batch_size, dtype='datetime64[ms]')
+    val_buf = np.empty((len(names), batch_size), dtype=np.float64)
+    # bucket -> [sum per field, count per field, max per field]
+    acc = {}
+
+    def flush(n):
+        if n == 0:
+            return
+        keys = (ts_buf[:n].astype(np.int64) + BUCKET_MS // 2) // BUCKET_MS
+        uniq, inv = np.unique(keys, return_inverse=True)
+        sums = np.zeros((len(names), len(uniq)))
+        counts = np.zeros((len(names), len(uniq)))
+        maxs = np.full((len(names), len(uniq)), -np.inf)
+        for j in range(len(names)):
+            vals = val_buf[j, :n]
+            ok = ~np.isnan(vals)
+            sums[j] = np.bincount(inv[ok], weights=vals[ok], minlength=len(uniq))
+            counts[j] = np.bincount(inv[ok], minlength=len(uniq))
+            np.maximum.at(maxs[j], inv[ok], vals[ok])
+        for b, key in enumerate(uniq):
+            entry = acc.get(key)
+            if entry is None:
+                acc[key] = [sums[:, b].copy(), counts[:, b].copy(), maxs[:, b].copy()]
+            else:
+                entry[0] += sums[:, b]
+                entry[1] += counts[:, b]
+                np.maximum(entry[2], maxs[:, b], out=entry[2])
+
+    n = 0
+    total = 0
+    for doc in cursor:
+        ts = doc.get(time_field)
+        if ts is None and fallback_time_field:
+            ts = doc.get(fallback_time_field)
+        if ts is None:
+            continue
+        ts_buf[n] = np.datetime64(ts, 'ms')
+        for j, name in enumerate(names):
+            v = doc.get(name)
+            val_buf[j, n] = np.nan if v is None else v
+        n += 1
+        if n == batch_size:
+            flush(n)
+            total += n
+            n = 0
+    flush(n)
+    total += n
+
+    keys = sorted(acc)
+    out = {'hour_key': pd.to_datetime(np.array(keys, dtype=np.int64) * BUCKET_MS, unit='ms')}
+    for j, name in enumerate(names):
+        if fields[name] == 'max':
+            col = [acc[k][2][j] for k in keys]
+            out[name] = [v if np.isfinite(v) else np.nan for v in col]
+        else:
+            out[name] = [acc[k][0][j] / acc[k][1][j] if acc[k][1][j] else np.nan for k in keys]
+    print(f"[trainer] Streamed {total} documents into {len(keys)} intervals.")
+    return pd.DataFrame(out)
+
+def bucket_pipeline(match):
+    """
+    $group per 10-minute interval, computed by MongoDB. Adding 5 minutes before
+    $dateTrunc rounds to the nearest interval (same keys as stream_buckets).
+    Sums and counts are returned so that partial results can be merged.
+    """
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {"$dateTrunc": {
+                "date": {"$dateAdd": {"startDate": "$scrape_timestamp", "unit": "minute", "amount": 5}},
+                "unit": "minute", "binSize": 10
+            }},
+            "sum_bikes": {"$sum": "$num_bikes_available"},
+            "count": {"$sum": 1}
+        }}
+    ]
+
+def time_range(since=None, until=None):
+    """scrape_timestamp filter for the [since, until) window (None = unbounded)."""
+    bounds = {"$ne": None}
+    if since is not None:
+        bounds["$gte"] = since
+    if until is not None:
+        bounds["$lt"] = until
+    return bounds
+
+def interval_edge(ts):
+    """Start edge of the 10-minute interval containing ts (intervals are centered on xx:x0)."""
+    half = timedelta(minutes=5)
+    return pd.Timestamp(ts + half).floor('10min').to_pydatetime() - half
+
+def get_high_water_mark(collection):
+    """
+    Start edge of the latest (possibly still filling) interval: everything before it
+    is made of complete intervals and can be trained on.
+    """
+    last = collection.find_one({"scrape_timestamp": {"$ne": None}}, {"_id": 0, "scrape_timestamp": 1},
+                               sort=[("scrape_timestamp", -1)])
+    return interval_edge(last['scrape_timestamp']) if last else None
+
+def split_time_range(collection, since=None, until=None, parallelism=AGG_PARALLELISM):
+    """
+    Splits the scrape_timestamp span of [since, until) into at most `parallelism`
+    consecutive (lo, hi) ranges aligned on 10-minute interval boundaries.
+    Returns [] when the window holds no document.
+    """
+    window = {"scrape_timestamp": time_range(since, until)}
+    first = collection.find_one(window, {"_id": 0, "scrape_timestamp": 1}, sort=[("scrape_timestamp", 1)])
+    last = collection.find_one(window, {"_id": 0, "scrape_timestamp": 1}, sort=[("scrape_timestamp", -1)])
+    if not first or not last:
+        return []
+
+    # Range edges fall between two intervals (xx:x5:00), so no interval is split
+    start = interval_edge(first['scrape_timestamp'])
+    end = interval_edge(last['scrape_timestamp']) + timedelta(minutes=10)
+    if since is not None:
+        start = max(start, since)
+    if until is not None:
+        end = min(end, until)
+    n_buckets = max(1, int((end - start) / timedelta(minutes=10)))
+    parallelism = max(1, min(parallelism, n_buckets))
+    step = timedelta(minutes=10) * -(-n_buckets // parallelism)
+    ranges = []
+    lo = start
+    while lo < end:
+        ranges.append((lo, min(lo + step, end)))
+        lo += step
+    return ranges
+
+def aggregate_buckets_in_mongo(collection, since=None, until=None, parallelism=AGG_PARALLELISM):
+    """
+    Mean bikes across stations per 10-minute interval, aggregated server-side.
+    On the sharded cluster mongos already runs the $group on every shard in parallel;
+    the time span is additionally split into `parallelism` ranges (aligned on interval
+    boundaries) aggregated concurrently. Returns a DataFrame hour_key / avg_bikes.
+    """
+    base_match = {"num_bikes_available": {"$ne": None}}
+    ranges = split_time_range(collection, since, until, parallelism)
+    if not ranges:
+        return pd.DataFrame(columns=['hour_key', 'avg_bikes'])
+
+    def run(bounds):
+        match = dict(base_match, scrape_timestamp={"$gte": bounds[0], "$lt": bounds[1]})
+        return list(collection.aggregate(bucket_pipeline(match), allowDiskUse=True))
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        results = [doc for part in pool.map(run, ranges) for doc in part]
+
+    print(f"[trainer] MongoDB aggregation: {len(results)} intervals from {len(ranges)} range(s).")
+    df = pd.DataFrame(results, columns=['_id', 'sum_bikes', 'count'])
+    df = df.groupby('_id', as_index=False)[['sum_bikes', 'count']].sum()
+    df['avg_bikes'] = df['sum_bikes'] / df['count']
+    df['hour_key'] = pd.to_datetime(df['_id'])
+    return df[['hour_key', 'avg_bikes']].sort_values('hour_key').reset_index(drop=True)
+
+def station_hour_pipeline(match):
+    """$group per (station, UTC hour): partial sums/counts, merged client-side."""
+    return [
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "station_id": "$station_id",
+                "hour": {"$dateTrunc": {"date": "$scrape_timestamp", "unit": "hour"}}
+            },
+            "sum_bikes": {"$sum": "$num_bikes_available"},
+            "count": {"$sum": 1}
+        }}
+    ]
+
+def aggregate_station_hours(collection, since=None, until=None, parallelism=AGG_PARALLELISM):
+    """
+    Mean bikes per station and per UTC hour, aggregated server-side over the same
+    concurrent time ranges as aggregate_buckets_in_mongo (an hour cut by a range edge
+    is merged back from its partial sums). Returns station_id / hour_key / target.
+    """
+    base_match = {"num_bikes_available": {"$ne": None}}
+    ranges = split_time_range(collection, since, until, parallelism)
+    if not ranges:
+        return pd.DataFrame(columns=['station_id', 'hour_key', 'target'])
+
+    def run(bounds):
+        match = dict(base_match, scrape_timestamp={"$gte": bounds[0], "$lt": bounds[1]})
+        return [(d['_id']['station_id'], d['_id']['hour'], d['sum_bikes'], d['count'])
+                for d in collection.aggregate(station_hour_pipeline(match), allowDiskUse=True)]
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+        results = [row for part in pool.map(run, ranges) for row in part]
+
+    print(f"[trainer] MongoDB aggregation: {len(results)} station-hours from {len(ranges)} range(s).")
+    df = pd.DataFrame(results, columns=['station_id', 'hour_key', 'sum_bikes', 'count'])
+    df = df.groupby(['station_id', 'hour_key'], as_index=False)[['sum_bikes', 'count']].sum()
+    df['target'] = df['sum_bikes'] / df['count']
+    df['hour_key'] = pd.to_datetime(df['hour_key'])
+    return df[['station_id', 'hour_key', 'target']]
+
+def replay_status_cycles(collection, since=None, until=None, batch_size=BATCH_SIZE):
+    """
+    Delta ingestion: yields (scrape_timestamp, {station_id: bikes}) for every cycle in
+    [since, until), the full snapshot being the last keyframe carried forward with the
+    changes written since. Reading starts at the last keyframe at or before `since`.
+    A cycle in which no station changed wrote nothing and is not yielded.
+    """
+    start = since
+    if since is not None:
+        keyframe = collection.find_one({"keyframe": True, "scrape_timestamp": {"$lte": since}},
+                                       {"_id": 0, "scrape_timestamp": 1}, sort=[("scrape_timestamp", -1)])
+        start = keyframe['scrape_timestamp'] if keyframe else None
+    cursor = collection.find(
+        {"scrape_timestamp": time_range(start, until)},
+        {"_id": 0, "scrape_timestamp": 1, "station_id": 1, "num_bikes_available": 1, "keyframe": 1}
+    ).sort("scrape_timestamp", 1).batch_size(batch_size)
+
+    snapshot = {}
+    for ts, docs in groupby(cursor, key=lambda d: d['scrape_timestamp']):
+        docs = list(docs)
+        if any(d.get('keyframe') for d in docs):
+            # Keyframe: complete snapshot, stations absent from it are gone
+            snapshot = {}
+        for d in docs:
+            snapshot[d['station_id']] = d.get('num_bikes_available')
+        if since is None or ts >= since:
+            yield ts, snapshot
+
+def replay_interval_means(collection, since=None, until=None):
+    """Delta ingestion counterpart of aggregate_buckets_in_mongo: hour_key / avg_bikes."""
+    def cycle_means():
+        for ts, snapshot in replay_status_cycles(collection, since, until):
+            values = [v for v in snapshot.values() if v is not None]
+            if values:
+                yield {'scrape_timestamp': ts, 'num_bikes_available': sum(values) / len(values)}
+
+    df = stream_buckets(cycle_means(), {'num_bikes_available': 'mean'})
+    return df.rename(columns={'num_bikes_available': 'avg_bikes'}).dropna()
+
+def replay_station_hours(collection, since=None, until=None):
+    """Delta ingestion counterpart of aggregate_station_hours: station_id / hour_key / target."""
+    acc = {}
+    for ts, snapshot in replay_status_cycles(collection, since, until):
+        hour = ts.replace(minute=0, second=0, microsecond=0)
+        for station_id, bikes in snapshot.items():
+            if bikes is not None:
+                entry = acc.setdefault((station_id, hour), [0.0, 0])
+                entry[0] += bikes
+                entry[1] += 1
+    df = pd.DataFrame([(sid, hour, total / count) for (sid, hour), (total, count) in acc.items()],
+                      columns=['station_id', 'hour_key', 'target'])
+    df['hour_key'] = pd.to_datetime(df['hour_key'])
+    return df
+
+def load_station_frames(db_velib):
+    """Static station features (station_latest) and hourly profiles (status_hourly)."""
+    stations = pd.DataFrame(list(db_velib.station_latest.find(
+        {"lat": {"$ne": None}, "lon": {"$ne": None}},
+        {"_id": 0, "station_id": 1, "lat": 1, "lon": 1, "capacity": 1,
+         "num_bikes_available": 1, "num_docks_available": 1}
+    )), columns=['station_id', 'lat', 'lon', 'capacity', 'num_bikes_available', 'num_docks_available'])
+    # Capacity from station info, or bikes + docks of the latest status
+    stations['capacity'] = stations['capacity'].fillna(
+        stations['num_bikes_available'] + stations['num_docks_available'])
+    stations = stations[['station_id', 'lat', 'lon', 'capacity']]
+
+    profiles = pd.DataFrame(list(db_velib.status_hourly.find(
+        {"count": {"$gt": 0}}, {"_id": 0, "station_id": 1, "day_of_week": 1, "hour": 1, "sum_bikes": 1, "count": 1}
+    )), columns=['station_id', 'day_of_week', 'hour', 'sum_bikes', 'count'])
+    profiles['profile_bikes'] = profiles['sum_bikes'] / profiles['count']
+    return stations, profiles[['station_id', 'day_of_week', 'hour', 'profile_bikes']]
+
+def load_station_data(db_velib, db_meteo, until=None):
+    """
+    Training set of the per-station model: one row per station and UTC hour over the
+    last STATION_HISTORY_DAYS days, with the hourly weather and the station features.
+    """
+    print("[trainer] Fetching per-station hourly data...")
+    since = (until or datetime.utcnow()) - timedelta(days=STATION_HISTORY_DAYS)
+    if STATUS_DELTA:
+        print("[trainer] Delta ingestion: replaying keyframes + changes per station...")
+        df = replay_station_hours(db_velib[STATUS_COLLECTION], since, until)
+    else:
+        df = aggregate_station_hours(db_velib[STATUS_COLLECTION], since, until)
+    if df.empty:
+        print("[trainer] No Velib data found for the station model.")
+        return None
+
+    cursor_meteo = db_meteo.meteo_current.find(
+        {"scrape_timestamp": {"$gte": since - timedelta(hours=1)}},
+        {"_id": 0, "scrape_timestamp": 1, "time": 1, "temperature": 1, "windspeed": 1, "weathercode": 1}
+    ).batch_size(BATCH_SIZE)
+    weather = stream_buckets(
+        cursor_meteo, {'temperature': 'mean', 'windspeed': 'mean', 'weathercode': 'max'},
+        fallback_time_field='time'
+    )
+    if weather.empty:
+        df['temperature'], df['windspeed'], df['weathercode'] = 15, 10, 0
+    else:
+        # 10-minute weather intervals -> hours
+        weather['hour_key'] = weather['hour_key'].dt.floor('h')
+        weather = weather.groupby('hour_key', as_index=False).agg(
+            temperature=('temperature', 'mean'), windspeed=('windspeed', 'mean'), weathercode=('weathercode', 'max'))
+        df = df.merge(weather, on='hour_key', how='left').sort_values('hour_key')
+        df['temperature'] = df['temperature'].ffill().fillna(15)
+        df['windspeed'] = df['windspeed'].ffill().fillna(10)
+        df['weathercode'] = df['weathercode'].fillna(0)
+
+    stations, profiles = load_station_frames(db_velib)
+    df = add_station_features(df, stations, profiles)
+    df_final = df[STATION_FEATURES + ['target']].dropna()
+    print(f"[trainer] Station dataset size: {len(df_final)} rows, {df['station_id'].nunique()} stations.")
+    return df_final
+
+def train_station_model(df):
+    """Fits the per-station model and writes its metadata (feature order, metrics)."""
+    if df is None or len(df) < 100:
+        print("[trainer] Not enough data to train the station model.")
+        return None
+
+    X = df[STATION_FEATURES]
+    y = df['target']
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    print(f"[trainer] Training station XGBoost on {len(X_train)} rows...")
+    model = xgb.XGBRegressor(
+        objective='reg:squarederror',
+        n_estimators=200,
+        learning_rate=0.1,
+        max_depth=8,
+        tree_method='hist'
+    )
+    model.fit(X_train, y_train)
+
+    score = model.score(X_test, y_test)
+    rmse = np.sqrt(mean_squared_error(y_test, model.predict(X_test)))
+    print(f"[trainer] Station model R²: {score:.4f}, RMSE: {rmse:.4f}")
+
+    meta = {
+        "features": STATION_FEATURES,
+        "r2": round(score, 4),
+        "rmse": round(float(rmse), 4),
+        "rows_train": len(X_train),
+        "rows_test": len(X_test),
+        "last_run": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    write_json_atomic(STATION_META_PATH, meta)
+    publish_model(model, STATION_MODEL_PATH, "velib_station_model")
+    print(f"[trainer] Saved station model to {STATION_MODEL_PATH}.")
+    return model
+
+def connect_databases():
     client_velib = connect_mongo(MONGO_URI, "Velib DB")
     if not client_velib: sys.exit(1)
     db_velib = client_velib['velib']
@@ -41,66 +432,71 @@ def load_data():
         # Fallback local if cloud not set (dev mode)
         db_meteo = client_velib['meteo'] 
         print("[trainer] Warning: Using local DB for Meteo.")
+    return db_velib, db_meteo
 
+def load_data(db_velib, db_meteo, since=None, until=None):
+    """
+    Builds the training set from the status intervals in [since, until)
+    (whole history when since is None).
+    """
     # 2. Extract Velib Status History
-    # We fetch a reasonable amount of history (e.g., last 100,000 records) to avoid OOM
     print("[trainer] Fetching Velib status data...")
-    # Projection to reduce size
-    cursor = db_velib.status.find({}, 
-        {"station_id": 1, "scrape_timestamp": 1, "num_bikes_available": 1, "is_renting": 1}
-    ).sort("scrape_timestamp", -1).limit(100000)
-    
-    df_velib = pd.DataFrame(list(cursor))
-    if df_velib.empty:
-        print("[trainer] No Velib data found.")
-        return None
-    
-    print(f"[trainer] Loaded {len(df_velib)} rows from Velib.")
+    if STATUS_DELTA:
+        # Server-side means would only cover the stations that changed
+        print("[trainer] Delta ingestion: replaying keyframes + changes (Mean across stations)...")
+        df_agg = replay_interval_means(db_velib[STATUS_COLLECTION], since, until)
+        if df_agg.empty:
+            print("[trainer] No Velib data found.")
+            return None
+    elif AGG_MODE == "mongo":
+        # Bucketing + mean across stations pushed down to MongoDB
+        print("[trainer] Aggregating data in MongoDB (Mean across stations)...")
+        df_agg = aggregate_buckets_in_mongo(db_velib[STATUS_COLLECTION], since, until)
+        if df_agg.empty:
+            print("[trainer] No Velib data found.")
+            return None
+    else:
+        # Streamed in cursor batches into NumPy buffers and aggregated per 10-minute
+        # interval on the fly (mean across stations): no row cap, bounded memory.
+        cursor = db_velib[STATUS_COLLECTION].find({"scrape_timestamp": time_range(since, until)},
+            {"_id": 0, "scrape_timestamp": 1, "num_bikes_available": 1}
+        ).batch_size(BATCH_SIZE)
 
-    df_velib['time'] = pd.to_datetime(df_velib['scrape_timestamp'])
-    # Round to nearest 10 minutes to have more granular data points
-    df_velib['hour_key'] = df_velib['time'].dt.round('10min')
-    
-    # --- AGGREGATION PAR STATION (MOYENNE) ---
-    print("[trainer] Aggregating data (Mean across stations)...")
-    df_agg = df_velib.groupby('hour_key')['num_bikes_available'].mean().reset_index()
-    df_agg.rename(columns={'num_bikes_available': 'avg_bikes'}, inplace=True)
+        print("[trainer] Aggregating data (Mean across stations)...")
+        df_agg = stream_buckets(cursor, {'num_bikes_available': 'mean'})
+        if df_agg.empty:
+            print("[trainer] No Velib data found.")
+            return None
+        df_agg.rename(columns={'num_bikes_available': 'avg_bikes'}, inplace=True)
     
     print(f"[trainer] After aggregation: {len(df_agg)} intervals.")
 
     # 3. Extract Weather History
     print("[trainer] Fetching Weather history...")
-    cursor_meteo = db_meteo.meteo_current.find({})
-    df_meteo = pd.DataFrame(list(cursor_meteo))
+    # Incremental run: only the weather around the new intervals
+    meteo_query = {"scrape_timestamp": {"$gte": since - timedelta(minutes=10)}} if since else {}
+    cursor_meteo = db_meteo.meteo_current.find(meteo_query,
+        {"_id": 0, "scrape_timestamp": 1, "time": 1, "temperature": 1, "windspeed": 1, "weathercode": 1}
+    ).batch_size(BATCH_SIZE)
+    # Deduplicate weather per interval
+    weather_hourly = stream_buckets(
+        cursor_meteo, {'temperature': 'mean', 'windspeed': 'mean', 'weathercode': 'max'},
+        fallback_time_field='time'
+    )
     
-    if df_meteo.empty:
+    if weather_hourly.empty:
         print("[trainer] No Weather data found. Using dummy weather.")
         df_agg['temperature'] = 15
         df_agg['windspeed'] = 10
         df_agg['weathercode'] = 0
     else:
-        # Standardize weather
-        if 'scrape_timestamp' in df_meteo.columns:
-            df_meteo['time'] = pd.to_datetime(df_meteo['scrape_timestamp'])
-        elif 'time' in df_meteo.columns:
-            df_meteo['time'] = pd.to_datetime(df_meteo['time'])
-        
-        df_meteo['hour_key'] = df_meteo['time'].dt.round('10min')
-        
-        # Deduplicate weather per interval
-        weather_hourly = df_meteo.groupby('hour_key').agg({
-            'temperature': 'mean',
-            'windspeed': 'mean',
-            'weathercode': 'max'
-        }).reset_index()
-        
         # 4. Merge
         print("[trainer] Merging Data...")
         df_agg = pd.merge(df_agg, weather_hourly, on='hour_key', how='left')
         
         # Fill missing weather
-        df_agg['temperature'] = df_agg['temperature'].fillna(method='ffill').fillna(15)
-        df_agg['windspeed'] = df_agg['windspeed'].fillna(method='ffill').fillna(10)
+        df_agg['temperature'] = df_agg['temperature'].ffill().fillna(15)
+        df_agg['windspeed'] = df_agg['windspeed'].ffill().fillna(10)
         df_agg['weathercode'] = df_agg['weathercode'].fillna(0)
 
     # 5. Feature Engineering
@@ -117,8 +513,8 @@ def load_data():
     df_final = df_agg[features + ['target']].dropna()
     print(f"[trainer] Final dataset size: {len(df_final)}")
     
-    # --- FALLBACK: SYNTHETIC DATA IF TOO FEW ---
-    if len(df_final) < 100:
+    # --- FALLBACK: SYNTHETIC DATA IF TOO FEW (full rebuild only) ---
+    if len(df_final) < 100 and since is None:
         print("[trainer] Data too small. Generating synthetic data for TP...")
         # Create 1000 synthetic rows based on the last row (or default)
         base_row = df_final.iloc[-1] if not df_final.empty else pd.Series({
@@ -214,17 +610,38 @@ def save_plots(model, X_test, y_test, df_final):
         print(f"[trainer] Error saving plots: {e}")
         traceback.print_exc()
 
-def train_xgboost(df):
-    if df is None or len(df) < 5:
+def train_xgboost(df, base_model=None):
+    """
+    Full rebuild: fits the model from scratch on 80% of the rows and writes
+    metrics.json and the plots from the 20% held out.
+    Incremental run (base_model given): INCREMENTAL_TREES more trees boosted on all
+    the new rows, without evaluation. Held-out rows would never be trained on (the
+    next run starts at the new high-water mark) and a few intervals are too few to
+    measure on, so the metrics of the last full rebuild are kept.
+    """
+    # A full rebuild needs enough rows to hold out a test split; warm-start runs fit
+    # every new row, so INCREMENTAL_MIN_ROWS (checked by run_training) applies instead
+    min_rows = 1 if base_model is not None else 5
+    if df is None or len(df) < min_rows:
         print("[trainer] Not enough data to train.")
         return None
 
     X = df.drop(columns=['target'])
     y = df['target']
-    
+
+    if base_model is not None:
+        print(f"[trainer] Training XGBoost (incremental) on {len(X)} new rows...")
+        model = xgb.XGBRegressor(objective='reg:squarederror', n_estimators=INCREMENTAL_TREES,
+                                 learning_rate=0.1, max_depth=6)
+        # Warm start: new trees are added on top of the saved booster
+        model.fit(X, y, xgb_model=base_model.get_booster())
+        print(f"[trainer] Booster now has {model.get_booster().num_boosted_rounds()} trees "
+              f"(metrics and plots kept from the last full rebuild).")
+        return model
+
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
-    print(f"[trainer] Training XGBoost on {len(X_train)} rows...")
+    print(f"[trainer] Training XGBoost (full) on {len(X_train)} rows...")
     model = xgb.XGBRegressor(
         objective='reg:squarederror',
         n_estimators=100,
@@ -244,6 +661,8 @@ def train_xgboost(df):
         "rmse": round(rmse, 4),
         "rows_train": len(X_train),
         "rows_test": len(X_test),
+        "mode": "full",
+        "n_trees": model.get_booster().num_boosted_rounds(),
         "last_run": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     }
     with open("/models/metrics.json", "w") as f:
@@ -254,17 +673,151 @@ def train_xgboost(df):
 
     return model
 
-if __name__ == "__main__":
-    # Ensure /models exists
-    os.makedirs("/models", exist_ok=True)
-    
-    print("[trainer] Starting process...")
-    data = load_data()
-    model = train_xgboost(data)
+def load_state():
+    try:
+        with open(STATE_PATH) as f:
+            state = json.load(f)
+        state['high_water_mark'] = datetime.fromisoformat(state['high_water_mark'])
+        return state
+    except (OSError, KeyError, ValueError):
+        return None
+
+def write_json_atomic(path, data):
+    # Written to a temp file then renamed: a crash never leaves a truncated file
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def save_state(state):
+    write_json_atomic(STATE_PATH, dict(state, high_water_mark=state['high_water_mark'].isoformat()))
+
+def publish_model(model, path, name):
+    """
+    Writes the model atomically (readers never see a partial file), then records
+    its new version in the manifest so that Flask reloads it.
+
+    Two artifacts are written: the pickled sklearn wrapper (path, used for warm starts)
+    and the native booster in UBJSON next to a .meta.json with the feature order, which
+    Flask loads with xgboost.Booster alone (no pandas/sklearn, no unpickling).
+    """
+    tmp_path = path + ".tmp"
+    dump(model, tmp_path)
+    os.replace(tmp_path, path)
+
+    base = os.path.splitext(path)[0]
+    native_path = base + ".ubj"
+    booster = model.get_booster()
+    write_json_atomic(base + ".meta.json", {
+        "features": list(booster.feature_names or model.feature_names_in_),
+        "n_trees": booster.num_boosted_rounds(),
+        "format": "ubj",
+        "trained_at": datetime.now().isoformat()
+    })
+    tmp_native = base + ".tmp.ubj"  # the extension selects the format
+    booster.save_model(tmp_native)
+    os.replace(tmp_native, native_path)
+
+    try:
+        with open(MANIFEST_PATH) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    manifest.setdefault("models", {})[name] = {
+        "file": os.path.basename(native_path),
+        "version": datetime.now().strftime("%Y%m%dT%H%M%S%f"),
+        "trained_at": datetime.now().isoformat()
+    }
+    write_json_atomic(MANIFEST_PATH, manifest)
+
+def load_previous_model():
+    try:
+        return load(MODEL_PATH)
+    except Exception as e:
+        print(f"[trainer] No previous model ({e}).")
+        return None
+
+def plan_run(state, has_previous, high_water_mark, full_rebuild_every=None):
+    """
+    (full, since, until) of the next run, or None when an incremental run has no new
+    complete interval. Windows are [since, until): the interval starting at the
+    high-water mark is left to the next run, whose `since` is that mark.
+    A run is full without saved state or model, or every `full_rebuild_every` runs
+    (skipped and failed runs included, see count_skipped_run).
+    """
+    full_rebuild_every = full_rebuild_every or FULL_REBUILD_EVERY
+    full = state is None or not has_previous or state.get('runs_since_full', 0) + 1 >= full_rebuild_every
+    if full:
+        return True, None, high_water_mark
+    since = state['high_water_mark']
+    if high_water_mark is None or high_water_mark <= since:
+        return None
+    return False, since, high_water_mark
+
+def count_skipped_run(state):
+    """
+    Counts a run that trained nothing toward the full-rebuild cadence, keeping the
+    high-water mark so the pending intervals are loaded again next run.
+    """
+    if state is not None:
+        save_state(dict(state, runs_since_full=state.get('runs_since_full', 0) + 1))
+
+def run_training(db_velib, db_meteo):
+    state = load_state() if INCREMENTAL else None
+    previous = load_previous_model() if state else None
+
+    plan = plan_run(state, previous is not None, get_high_water_mark(db_velib[STATUS_COLLECTION]))
+    if plan is None:
+        print(f"[trainer] No new complete interval since {state['high_water_mark']}. Nothing to do.")
+        count_skipped_run(state)
+        return
+    full, since, until = plan
+
+    print(f"[trainer] {'Full rebuild' if full else 'Incremental run'}: intervals "
+          f"[{since or 'beginning'}, {until}).")
+    data = load_data(db_velib, db_meteo, since, until)
+    new_rows = 0 if data is None else len(data)
+    if not full and new_rows < INCREMENTAL_MIN_ROWS:
+        # High-water mark kept: the same window, grown, is loaded again next run
+        print(f"[trainer] Skipped, not enough new intervals ({new_rows} < {INCREMENTAL_MIN_ROWS}). "
+              f"Waiting for more data since {since}.")
+        count_skipped_run(state)
+        return
+    model = train_xgboost(data, base_model=None if full else previous)
     
     if model:
         print(f"[trainer] Saving model to {MODEL_PATH}...")
-        dump(model, MODEL_PATH)
+        publish_model(model, MODEL_PATH, "velib_model")
+        if until is not None:
+            save_state({
+                "high_water_mark": until,
+                "runs_since_full": 0 if full else state.get('runs_since_full', 0) + 1,
+                "last_full_rebuild": datetime.now().isoformat() if full else state.get('last_full_rebuild')
+            })
         print("[trainer] Done.")
     else:
+        # High-water mark kept: the new intervals will be picked up by the next run
         print("[trainer] Failed.")
+        if not full:
+            count_skipped_run(state)
+
+    # Per-station model: rebuilt with the full rebuilds (or when it does not exist yet)
+    if STATION_MODEL and (full or not os.path.exists(STATION_MODEL_PATH)):
+        try:
+            train_station_model(load_station_data(db_velib, db_meteo, until))
+        except Exception as e:
+            print(f"[trainer] Station model failed: {e}")
+            traceback.print_exc()
+
+if __name__ == "__main__":
+    # Ensure /models exists
+    os.makedirs("/models", exist_ok=True)
+    
+    print("[trainer] Starting process...")
+    db_velib, db_meteo = connect_databases()
+    while True:
+        run_training(db_velib, db_meteo)
+        if TRAIN_INTERVAL <= 0:
+            break
+        print(f"[trainer] Sleeping {TRAIN_INTERVAL} seconds...")
+        time.sleep(TRAIN_INTERVAL)